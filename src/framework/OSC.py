@@ -747,16 +747,21 @@ def OSCArgument(next, typehint=None):
     return (tag, binary)
 
 
+# seconds from the NTP epoch (1900-01-01) to the Unix epoch (1970-01-01), and NTP fractional units per second
+NTP_delta = 2208988800
+NTP_units_per_second = 0x100000000
+
+
 def OSCTimeTag(time):
     """
-    Convert a time in floating seconds to its
-    OSC binary representation
+    Convert a time in floating seconds (since the Unix epoch, as in time.time())
+    to its OSC binary representation (an NTP timestamp)
     """
     if time > 0:
         fract, secs = math.modf(time)
-        binary = struct.pack('>ll', int(secs), int(fract * 1e9))
+        binary = struct.pack('>LL', int(secs) + NTP_delta, int(fract * NTP_units_per_second))
     else:
-        binary = struct.pack('>ll', 0, 1)
+        binary = struct.pack('>LL', 0, 1)
 
     return binary
 
@@ -814,11 +819,11 @@ def _readTimeTag(data):
     """Tries to interpret the next 8 bytes of the data
     as a TimeTag.
      """
-    high, low = struct.unpack(">ll", data[0:8])
+    high, low = struct.unpack(">LL", data[0:8])
     if (high == 0) and (low <= 1):
         time = 0.0
     else:
-        time = int(high) + float(low / 1e9)
+        time = int(high) - NTP_delta + float(low) / NTP_units_per_second
     rest = data[8:]
     return (time, rest)
 
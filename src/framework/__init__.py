@@ -1,5 +1,22 @@
 from .OSC import OSCClient, OSCMessage
+from .clock import RealClock, VirtualClock, get_clock, set_clock
+from .frameclock import FrameClock
 from .tickmodule import TickModule, engine_lock, shared_lock
 from .basicstimuli import BasicStimuli
 from .latentmodule import LatentModule
-
+from .framepacer import FramePacer
+from .telemetry import FrameTelemetry, load_telemetry
+from .headless import EventScript
+from .onsets import OnsetTracker
+from .stimuluspool import StimulusPool
+from .textcache import TextCache
+from .rsvp import RSVPStream
+from .preloader import MediaPreloader
+from .mediacache import MediaCache
+from .atlas import TextureAtlas
+from .batch import StimulusBatch
+from .procedural import ProceduralStimuli
+from .mixer import AudioMixer, AudioClip, NullSink, FileSink, DeviceSink
+from .soundpool import SoundPool
+from .moviestream import MovieStream
+from .registry import ResourceRegistry
@@ -0,0 +1,201 @@
+"""
+Texture atlases for large sets of image stimuli.
+
+An atlas packs many images into a few large textures (pages), so that presenting an image only requires changing
+the texture coordinates of a card rather than binding a new texture, and no video memory is wasted on padding each
+image to a power-of-two size. Atlases can be built online from a list of image files (see build_atlas()), or
+offline into a set of PNG pages plus a JSON manifest of the UV rectangles (see save_atlas()), e.g.:
+  python -m framework.atlas media/faces --output media/faces-atlas
+
+Once an atlas has been loaded via load_atlas() (or BasicStimuli.load_atlas()), its images can be referred to as
+'atlas:<file name>' (e.g., picture('atlas:media/faces/face01.png')); the file name is the one given when the atlas
+was built (for directories, the path of the image relative to the current working directory).
+"""
+
+import json
+import optparse
+import os
+
+from pandac.PandaModules import Filename, PNMImage, Texture, TextureStage
+
+# prefix of image references that are looked up in the loaded atlases
+ATLAS_PREFIX = 'atlas:'
+
+# the images of all loaded atlases, as a mapping from file name to the atlas that holds it
+global atlas_images
+atlas_images = {}
+
+
+class TextureAtlas:
+    """
+    A set of atlas pages (textures) along with the location of each image on them. Each entry holds the page index,
+    the UV rectangle (u0, v0, u1, v1) and the size of the image in pixels.
+    """
+
+    def __init__(self,
+                 pages,  # list of atlas pages (Textures, PNMImages or file names)
+                 entries  # mapping from image name to (page index, (u0, v0, u1, v1), (width, height))
+                 ):
+        """Construct a new TextureAtlas."""
+        self.pages = [_make_texture(p, 'atlas-page-' + str(k)) for k, p in enumerate(pages)]
+        self.entries = entries
+
+    def lookup(self, name):
+        """Get the texture and UV rectangle of an image in the atlas."""
+        page, uv, size = self.entries[name]
+        return self.pages[page], uv
+
+    def __contains__(self, name):
+        return name in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+
+def build_atlas(filenames, page_size=2048, padding=2):
+    """
+    Pack the given image files into atlas pages (using a simple shelf packer, tallest images first).
+    Returns a tuple of the list of pages (PNMImages) and the entries (as in TextureAtlas).
+    """
+    images = []
+    for filename in filenames:
+        image = PNMImage()
+        if not image.read(Filename.fromOsSpecific(filename)):
+            raise IOError("Could not read the image " + filename)
+        if image.getXSize() + 2 * padding > page_size or image.getYSize() + 2 * padding > page_size:
+            raise ValueError("The image " + filename + " does not fit onto an atlas page.")
+        if not image.hasAlpha():
+            image.addAlpha()
+            image.alphaFill(1.0)
+        images.append((filename, image))
+    images.sort(key=lambda item: -item[1].getYSize())
+
+    pages = []
+    entries = {}
+    x = y = shelf = page_size
+    for filename, image in images:
+        w = image.getXSize()
+        h = image.getYSize()
+        if x + w + 2 * padding > page_size:
+            # start a new shelf
+            x = 0
+            y += shelf
+            shelf = 0
+        if y + h + 2 * padding > page_size:
+            # start a new page
+            page = PNMImage(page_size, page_size, 4)
+            page.alphaFill(0.0)
+            pages.append(page)
+            x = y = shelf = 0
+        pages[-1].copySubImage(image, x + padding, y + padding)
+        # (texture coordinates start at the bottom of the image)
+        entries[filename] = (len(pages) - 1,
+                             ((x + padding) / page_size, 1.0 - (y + padding + h) / page_size,
+                              (x + padding + w) / page_size, 1.0 - (y + padding) / page_size),
+                             (w, h))
+        x += w + 2 * padding
+        shelf = max(shelf, h + 2 * padding)
+    return pages, entries
+
+
+def save_atlas(pages, entries, prefix):
+    """
+    Write atlas pages (as returned by build_atlas) to <prefix>-<k>.png and the manifest to <prefix>.json;
+    returns the manifest file name.
+    """
+    names = []
+    for k, page in enumerate(pages):
+        name = prefix + '-' + str(k) + '.png'
+        page.write(Filename.fromOsSpecific(name))
+        names.append(os.path.basename(name))
+    manifest = {'pages': names,
+                'images': {name: {'page': page, 'uv': list(uv), 'size': list(size)}
+                           for name, (page, uv, size) in entries.items()}}
+    with open(prefix + '.json', 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    return prefix + '.json'
+
+
+def load_atlas(source, page_size=2048, padding=2):
+    """
+    Load an atlas and make its images available as 'atlas:<file name>'. The source may be the file name of a
+    manifest (.json), a directory of images, or a list of image files (which are packed online).
+    Returns the TextureAtlas.
+    """
+    if type(source) == str and source.endswith('.json'):
+        with open(source) as f:
+            manifest = json.load(f)
+        directory = os.path.dirname(source)
+        pages = [os.path.join(directory, p) for p in manifest['pages']]
+        entries = {name: (e['page'], tuple(e['uv']), tuple(e['size'])) for name, e in manifest['images'].items()}
+    else:
+        if type(source) == str:
+            source = list_images(source)
+        pages, entries = build_atlas(source, page_size, padding)
+    atlas = TextureAtlas(pages, entries)
+    for name in entries:
+        atlas_images[name] = atlas
+    return atlas
+
+
+def lookup_atlas_image(reference):
+    """
+    Resolve an image reference of the form 'atlas:<file name>' against the loaded atlases; returns a tuple of the
+    atlas page (Texture) and the UV rectangle (u0, v0, u1, v1).
+    """
+    name = reference[len(ATLAS_PREFIX):] if reference.startswith(ATLAS_PREFIX) else reference
+    try:
+        return atlas_images[name].lookup(name)
+    except KeyError:
+        raise KeyError("The image " + name + " is not in any loaded atlas.")
+
+
+def is_atlas_reference(image):
+    """Check whether the given image is a reference to an atlas image."""
+    return type(image) == str and image.startswith(ATLAS_PREFIX)
+
+
+def apply_uv(nodepath, uv):
+    """Set the texture transform of a card (with texture coordinates from 0 to 1) to show the given UV rectangle."""
+    stage = TextureStage.getDefault()
+    nodepath.setTexOffset(stage, uv[0], uv[1])
+    nodepath.setTexScale(stage, uv[2] - uv[0], uv[3] - uv[1])
+
+
+def list_images(directory, extensions=('.png', '.jpg', '.jpeg', '.bmp', '.tga', '.tif', '.tiff')):
+    """List the image files in a directory (recursively), in sorted order."""
+    result = []
+    for root, dirs, files in os.walk(directory):
+        for f in files:
+            if os.path.splitext(f)[1].lower() in extensions:
+                result.append(os.path.join(root, f))
+    return sorted(result)
+
+
+def _make_texture(page, name):
+    """Internal helper that turns an atlas page into a texture."""
+    if isinstance(page, Texture):
+        return page
+    texture = Texture(name)
+    if isinstance(page, PNMImage):
+        texture.load(page)
+    else:
+        texture.read(Filename.fromOsSpecific(page))
+    # no mipmaps, so that neighboring images do not bleed into each other
+    texture.setMinfilter(Texture.FTLinear)
+    texture.setMagfilter(Texture.FTLinear)
+    return texture
+
+
+if __name__ == "__main__":
+    parser = optparse.OptionParser(usage="%prog [options] directory")
+    parser.add_option("--output", dest="output", default=None,
+                      help="The prefix of the atlas files to write (pages <prefix>-<k>.png and manifest <prefix>.json).")
+    parser.add_option("--size", dest="size", type="int", default=2048, help="The size of the atlas pages in pixels.")
+    parser.add_option("--padding", dest="padding", type="int", default=2, help="The padding around each image in pixels.")
+    (opts, args) = parser.parse_args()
+    if len(args) != 1 or not opts.output:
+        parser.error("Please specify an image directory and an output prefix.")
+    pages, entries = build_atlas(list_images(args[0]), opts.size, opts.padding)
+    save_atlas(pages, entries, opts.output)
+    print("Packed %i images into %i atlas pages." % (len(entries), len(pages)))
@@ -0,0 +1,192 @@
+"""
+Persistent index of the durations of audio files, read from the file headers.
+
+The index maps the absolute path of a file to its modification time, size and duration. Optionally (see
+set_audio_index()), entries are appended to an on-disk cache file (one JSON record per line) as they are discovered,
+so each file's header is only read once across sessions (and again whenever the file changes); the file is
+rewritten compactly whenever it is loaded. Supported formats are WAV (PCM and other RIFF/WAVE files),
+FLAC, and Ogg Vorbis/Opus.
+"""
+
+import json
+import os
+import struct
+
+from .mediacache import resolve_media
+
+# the suggested location of an on-disk cache
+DEFAULT_INDEX_FILE = 'logs/audioindex.jsonl'
+
+
+def wav_duration(f):
+    """Read the duration of a RIFF/WAVE file from its fmt and data chunks."""
+    header = f.read(12)
+    if len(header) < 12 or header[0:4] != b'RIFF' or header[8:12] != b'WAVE':
+        return None
+    byte_rate = None
+    while True:
+        chunk = f.read(8)
+        if len(chunk) < 8:
+            return None
+        chunk_id, chunk_size = struct.unpack('<4sI', chunk)
+        if chunk_id == b'fmt ':
+            fmt = f.read(chunk_size + (chunk_size & 1))
+            byte_rate = struct.unpack('<I', fmt[8:12])[0]
+        elif chunk_id == b'data':
+            if not byte_rate:
+                return None
+            if chunk_size == 0xFFFFFFFF:
+                # (streamed file of unknown length)
+                chunk_size = os.fstat(f.fileno()).st_size - f.tell()
+            return chunk_size / float(byte_rate)
+        else:
+            f.seek(chunk_size + (chunk_size & 1), os.SEEK_CUR)
+
+
+def flac_duration(f):
+    """Read the duration of a FLAC file from its STREAMINFO block."""
+    header = f.read(8)
+    if len(header) < 8 or header[0:4] != b'fLaC' or (header[4] & 0x7F) != 0:
+        return None
+    info = f.read(34)
+    if len(info) < 34:
+        return None
+    # sample rate (20 bits), channels (3), bits per sample (5), total samples (36)
+    bits = int.from_bytes(info[10:18], 'big')
+    rate = bits >> 44
+    samples = bits & 0xFFFFFFFFF
+    if rate == 0 or samples == 0:
+        return None
+    return samples / float(rate)
+
+
+def ogg_duration(f):
+    """Read the duration of an Ogg Vorbis or Opus file from its identification header and its last page."""
+    first = f.read(128)
+    if len(first) < 28 or first[0:4] != b'OggS':
+        return None
+    body = first[27 + first[26]:]
+    if body[0:7] == b'\x01vorbis':
+        rate = struct.unpack('<I', body[12:16])[0]
+        preskip = 0
+    elif body[0:8] == b'OpusHead':
+        # Opus granule positions always count samples at 48 kHz
+        rate = 48000
+        preskip = struct.unpack('<H', body[10:12])[0]
+    else:
+        return None
+    # find the granule position of the last page
+    size = os.fstat(f.fileno()).st_size
+    f.seek(max(0, size - 65536))
+    tail = f.read()
+    pos = tail.rfind(b'OggS')
+    while pos >= 0:
+        if pos + 14 <= len(tail):
+            granule = struct.unpack('<q', tail[pos + 6:pos + 14])[0]
+            if granule >= 0 and rate > 0:
+                return (granule - preskip) / float(rate)
+        pos = tail.rfind(b'OggS', 0, pos)
+    return None
+
+
+# readers by file extension
+readers = {'.wav': wav_duration, '.wave': wav_duration, '.flac': flac_duration,
+           '.ogg': ogg_duration, '.oga': ogg_duration, '.opus': ogg_duration}
+
+
+def read_duration(filename):
+    """Read the duration of an audio file from its header; returns None if the format is not supported."""
+    reader = readers.get(os.path.splitext(filename)[1].lower())
+    if reader is None:
+        return None
+    try:
+        with open(filename, 'rb') as f:
+            return reader(f)
+    except (IOError, OSError, struct.error, IndexError):
+        return None
+
+
+class AudioIndex:
+    """
+    Index of audio file durations, backed by an on-disk cache (see module documentation). Looking up a file costs
+    its resolution through the model path, one os.stat() and a dictionary lookup, unless its header has not been
+    read yet.
+    """
+
+    def __init__(self,
+                 filename=None  # optionally the on-disk cache file (e.g., DEFAULT_INDEX_FILE)
+                 ):
+        """Construct a new AudioIndex and load its on-disk cache (if any)."""
+        self.filename = filename
+        self._entries = {}  # mapping from absolute path to (mtime, size, duration)
+        if filename is not None and os.path.exists(filename):
+            records = 0
+            with open(filename) as f:
+                for line in f:
+                    records += 1
+                    try:
+                        record = json.loads(line)
+                        self._entries[record['path']] = (record['mtime'], record['size'], record['duration'])
+                    except (ValueError, KeyError):
+                        # skip partially written records
+                        pass
+            if records > len(self._entries):
+                self._compact()
+
+    def duration(self, filename):
+        """
+        Get the duration of an audio file in seconds, or None if it cannot be determined from the header; the file
+        name is resolved through the engine's model path (as by the engine's loader).
+        """
+        path = os.path.abspath(resolve_media(filename))
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        entry = self._entries.get(path)
+        if entry is not None and entry[0] == stat.st_mtime and entry[1] == stat.st_size:
+            return entry[2]
+        duration = read_duration(path)
+        self._entries[path] = (stat.st_mtime, stat.st_size, duration)
+        if self.filename is not None:
+            try:
+                directory = os.path.dirname(self.filename)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                with open(self.filename, 'a') as f:
+                    f.write(json.dumps({'path': path, 'mtime': stat.st_mtime, 'size': stat.st_size,
+                                        'duration': duration}) + '\n')
+            except (IOError, OSError) as e:
+                print("Could not update the audio index " + self.filename + ":", e)
+        return duration
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _compact(self):
+        """Internal helper that rewrites the on-disk cache with only the current entry of each file."""
+        try:
+            with open(self.filename + '.tmp', 'w') as f:
+                for path, (mtime, size, duration) in self._entries.items():
+                    f.write(json.dumps({'path': path, 'mtime': mtime, 'size': size, 'duration': duration}) + '\n')
+            os.replace(self.filename + '.tmp', self.filename)
+        except (IOError, OSError) as e:
+            print("Could not compact the audio index " + self.filename + ":", e)
+
+
+global _index
+_index = None
+
+
+def get_audio_index():
+    """Get the global audio index (by default an in-memory index, created on first use)."""
+    global _index
+    if _index is None:
+        _index = AudioIndex()
+    return _index
+
+
+def set_audio_index(index):
+    """Set the global audio index, e.g., AudioIndex(DEFAULT_INDEX_FILE) to keep the durations across sessions."""
+    global _index
+    _index = index
@@ -1,9 +1,28 @@
+import contextlib
+import heapq
+import itertools
 import math
 import direct.gui
 import direct.showbase
 import pandac.PandaModules
+import pylsl
 from . import eventmarkers
+from .clock import get_clock
+from .stimuluspool import StimulusPool
+from .textcache import TextCache, TextInstance
+from .rsvp import RSVPStream
+from .preloader import MediaPreloader
+from .mediacache import MediaCache
+from .atlas import apply_uv, is_atlas_reference, load_atlas, lookup_atlas_image
+from .batch import StimulusBatch
+from .procedural import ProceduralStimuli
+from .audioindex import get_audio_index
+from .mixer import AudioMixer
+from .soundpool import STEAL_POLICIES, SoundPool
+from .moviestream import MovieStream
+from .registry import ResourceRegistry, ScopedHandle
 from . import OSCClient, OSCMessage
+from .OSC import OSCBundle
 
 global base
 # global loader
@@ -14,6 +33,12 @@ class BasicStimuli:
     A class that provides convenience functions for displaying psychological-type stimuli.
     This includes text, rectangles, crosshairs, images, sounds, and video.
     These functions are automatically available to any LatentModule. 
+    If the LatentModule runs in coroutine mode, blocking calls return an awaitable that must be awaited.
+    The nodes of text and image stimuli whose lifetime is managed entirely by these functions (i.e., blocking calls,
+    which do not return the stimulus) are recycled via a StimulusPool; stimuli that are returned to you are never
+    pooled.
+    Likewise, the geometry of such texts is kept in a TextCache, so that recurring texts are instanced rather than
+    generated anew.
     """
 
     class destroy_helper:
@@ -42,18 +67,55 @@ class BasicStimuli:
         self.implicit_markers = False  # whether to generate implicit markers
         # in write(), movie(), etc.
         self.extensive_markers = False  # whether to emit extensive string markers
-        self._to_destroy = []
+        self._resources = ResourceRegistry()  # the stimulus objects etc. to destroy upon cancel (or scope end)
+        self._expiries = []  # heap of (time, sequence number, objects, handles, callback) for timed-out stimuli
+        self._expiry_count = itertools.count()  # source of sequence numbers for self._expiries
+        self._expiry_task = None  # the task that handles all expirations (runs while any are pending)
         self._oscclient = None  # osc client to use
         self._oscplayer = 1  # target output device (1 or 2)
+        self._clock = get_clock()  # the clock that provides the current time (real or virtual)
+        self._onset_tracker = None  # the launcher's OnsetTracker, if visual onsets are time-stamped at the flip
+        self.pool_stimuli = True  # whether to recycle the nodes of text and image stimuli
+        self._stimulus_pool = StimulusPool()
+        self.cache_text = False
+        # whether to cache the generated geometry of texts (write() then returns a TextInstance instead of an
+        # OnscreenText for texts with a duration, which does not support the OnscreenText-specific functions)
+        self._text_cache = TextCache()
+        self._fonts = {}  # the fonts loaded so far, by file name
+        self._preloader = None  # background loader for media files (created on first use)
+        self._procedural = None  # generator and cache of procedural stimulus textures (created on first use)
+        self._mixer = None  # software audio mixer for local sound playback, if enabled (see start_mixer())
+        self.pool_sounds = False
+        # whether to play local (non-surround) sounds through the voice-limited sound pool (sound() then returns a
+        # SoundVoice instead of the sound object)
+        self.buffer_movies = False
+        # whether to decode movies ahead on a background thread (see MovieStream); movie() then returns the
+        # MovieStream instead of the sound or movie texture, and the video is paced by the clock rather than
+        # synchronized to the soundtrack
+        self.movie_buffer_frames = 8  # the number of movie frames that are decoded ahead
+        self.movie_start_latency = 0.1  # the maximum time in seconds from movie() until its first frame is shown
+        self._movie_streams = {}  # prerolled movie streams (see precache_movie()), by file name
 
-    def marker(self, markercode):
+    def marker(self, markercode, timestamp=None):
         """
         Emit a marker.
         The marker code can be a string or a number.
+        Optionally, the LSL timestamp of the event can be given (e.g., for an event that is scheduled to happen
+        shortly); by default the marker is time-stamped when it is sent.
         Side note: strings will not work if a legacy marker sending protocol is enabled
         (such as DataRiver or the parallel port).
         """
-        eventmarkers.send_marker(markercode)
+        eventmarkers.send_marker(markercode, timestamp)
+
+    def onset_marker(self, markercode):
+        """
+        Emit a marker for the onset of a visual stimulus that has just been created; if the launcher tracks
+        onsets, the marker is time-stamped at the time when the next frame is flipped to the display.
+        """
+        if self._onset_tracker is not None:
+            self._onset_tracker.register(markercode)
+        else:
+            eventmarkers.send_marker(markercode)
 
     def write(self,
               text,  # the text to display
@@ -93,30 +155,23 @@ class BasicStimuli:
         if duration == 0:
             block = False
 
-        if type(font) == str:
-            font = self._engine.base.loader.loadFont(font)
-        obj = self._engine.direct.gui.OnscreenText.OnscreenText(text=text, pos=(pos[0], pos[1] - scale / 4), roll=roll,
-                                                                scale=scale, fg=fg, bg=bg, shadow=shadow,
-                                                                shadowOffset=shadowOffset, frame=frame, align=align,
-                                                                wordwrap=wordwrap, drawOrder=drawOrder, font=font,
-                                                                parent=parent, sort=sort)
-        self._to_destroy.append(obj)
+        pooled = block  # (only nodes that are never handed out to the caller are recycled)
+        obj = None
+        if pooled and self.cache_text:
+            obj = self._cached_text(text, (pos[0], pos[1] - scale / 4), font, roll, scale, fg, bg, shadow,
+                                    shadowOffset, frame, align, wordwrap, drawOrder, parent, sort)
+        if obj is None:
+            obj = self._onscreen_text(pooled, text, (pos[0], pos[1] - scale / 4), font, roll=roll, scale=scale,
+                                      fg=fg, bg=bg, shadow=shadow, shadowOffset=shadowOffset, frame=frame,
+                                      align=align, wordwrap=wordwrap, drawOrder=drawOrder, parent=parent, sort=sort)
+        self._resources.add(obj)
         if self.implicit_markers:
-            self.marker(254)
+            self.onset_marker(254)
         if block:
-            if isinstance(duration, (list, tuple)):
-                self.sleep(duration[0])
-                self.waitfor(duration[1])
-            elif type(duration) == str:
-                self.waitfor(duration)
-            else:
-                self.sleep(duration)
-
-            self._destroy_object(obj, 255)
+            return self._latent(self._hold(duration, obj, 255))
         else:
             if duration > 0:
-                self._engine.base.taskMgr.doMethodLater(duration, self._destroy_object,
-                                                        'ConvenienceFunctions, remove_text', extraArgs=[obj, 255])
+                self._expire_later(duration, obj, 255)
             return obj
 
     def crosshair(self,
@@ -137,30 +192,22 @@ class BasicStimuli:
         """Draw a crosshair."""
         if self.extensive_markers:
             self.marker("BasicStimuli::crosshair()")
-        obj1 = self._engine.direct.gui.OnscreenImage.OnscreenImage(image='blank.tga', pos=(pos[0], 0, pos[1]),
-                                                                   scale=(size, 1, width), color=color, parent=parent)
-        self._to_destroy.append(obj1)
+        pooled = block
+        obj1 = self._onscreen_image(pooled, 'blank.tga', pos=(pos[0], 0, pos[1]), scale=(size, 1, width), color=color,
+                                    parent=parent)
+        self._resources.add(obj1)
         obj1.setTransparency(self._engine.pandac.TransparencyAttrib.MAlpha)
-        obj2 = self._engine.direct.gui.OnscreenImage.OnscreenImage(image='blank.tga', pos=(pos[0], 0, pos[1]),
-                                                                   scale=(width, 1, size), color=color, parent=parent)
-        self._to_destroy.append(obj2)
+        obj2 = self._onscreen_image(pooled, 'blank.tga', pos=(pos[0], 0, pos[1]), scale=(width, 1, size), color=color,
+                                    parent=parent)
+        self._resources.add(obj2)
         obj2.setTransparency(self._engine.pandac.TransparencyAttrib.MAlpha)
         if self.implicit_markers:
-            self.marker(252)
+            self.onset_marker(252)
         if block:
-            if isinstance(duration, (list, tuple)):
-                self.sleep(duration[0])
-                self.waitfor(duration[1])
-            elif type(duration) == str:
-                self.waitfor(duration)
-            else:
-                self.sleep(duration)
-            self._destroy_object([obj1, obj2], 253)
+            return self._latent(self._hold(duration, [obj1, obj2], 253))
         else:
             if duration > 0:
-                self._engine.base.taskMgr.doMethodLater(duration, self._destroy_object,
-                                                        'ConvenienceFunctions, remove_crosshair',
-                                                        extraArgs=[[obj1, obj2], 253])
+                self._expire_later(duration, [obj1, obj2], 253)
             return self.destroy_helper([obj1, obj2])
 
     def rectangle(self,
@@ -188,27 +235,17 @@ class BasicStimuli:
         r = rect[1]
         t = rect[2]
         b = rect[3]
-        obj = self._engine.direct.gui.OnscreenImage.OnscreenImage(image='blank.tga',
-                                                                  pos=((l + r) / 2, depth, (b + t) / 2),
-                                                                  scale=((r - l) / 2, 1, (b - t) / 2), color=color,
-                                                                  parent=parent)
-        self._to_destroy.append(obj)
+        obj = self._onscreen_image(block, 'blank.tga', pos=((l + r) / 2, depth, (b + t) / 2),
+                                   scale=((r - l) / 2, 1, (b - t) / 2), color=color, parent=parent)
+        self._resources.add(obj)
         obj.setTransparency(self._engine.pandac.TransparencyAttrib.MAlpha)
         if self.implicit_markers:
-            self.marker(250)
+            self.onset_marker(250)
         if block:
-            if isinstance(duration, (list, tuple)):
-                self.sleep(duration[0])
-                self.waitfor(duration[1])
-            elif type(duration) == str:
-                self.waitfor(duration)
-            else:
-                self.sleep(duration)
-            self._destroy_object(obj, 251)
+            return self._latent(self._hold(duration, obj, 251))
         else:
             if duration > 0:
-                self._engine.base.taskMgr.doMethodLater(duration, self._destroy_object,
-                                                        'ConvenienceFunctions, remove_rect', extraArgs=[obj, 251])
+                self._expire_later(duration, obj, 251)
             return obj
 
     def frame(self,
@@ -235,46 +272,36 @@ class BasicStimuli:
         b = rect[3]
         w = thickness[0]
         h = thickness[1]
-        L = self._engine.direct.gui.OnscreenImage.OnscreenImage(image='blank.tga', pos=(l - w / 2, 0, (b + t) / 2),
-                                                                scale=(w / 2, 1, w + (b - t) / 2), color=color,
-                                                                parent=parent)
+        pooled = block
+        L = self._onscreen_image(pooled, 'blank.tga', pos=(l - w / 2, 0, (b + t) / 2), scale=(w / 2, 1, w + (b - t) / 2),
+                               color=color, parent=parent)
         L.setTransparency(self._engine.pandac.TransparencyAttrib.MAlpha)
-        self._to_destroy.append(L)
-        R = self._engine.direct.gui.OnscreenImage.OnscreenImage(image='blank.tga', pos=(r + w / 2, 0, (b + t) / 2),
-                                                                scale=(w / 2, 1, w + (b - t) / 2), color=color,
-                                                                parent=parent)
+        self._resources.add(L)
+        R = self._onscreen_image(pooled, 'blank.tga', pos=(r + w / 2, 0, (b + t) / 2), scale=(w / 2, 1, w + (b - t) / 2),
+                               color=color, parent=parent)
         R.setTransparency(self._engine.pandac.TransparencyAttrib.MAlpha)
-        self._to_destroy.append(R)
-        T = self._engine.direct.gui.OnscreenImage.OnscreenImage(image='blank.tga', pos=((l + r) / 2, 0, t - h / 2),
-                                                                scale=(h + (r - l) / 2, 1, h / 2), color=color,
-                                                                parent=parent)
+        self._resources.add(R)
+        T = self._onscreen_image(pooled, 'blank.tga', pos=((l + r) / 2, 0, t - h / 2), scale=(h + (r - l) / 2, 1, h / 2),
+                               color=color, parent=parent)
         T.setTransparency(self._engine.pandac.TransparencyAttrib.MAlpha)
-        self._to_destroy.append(T)
-        B = self._engine.direct.gui.OnscreenImage.OnscreenImage(image='blank.tga', pos=((l + r) / 2, 0, b + h / 2),
-                                                                scale=(h + (r - l) / 2, 1, h / 2), color=color,
-                                                                parent=parent)
+        self._resources.add(T)
+        B = self._onscreen_image(pooled, 'blank.tga', pos=((l + r) / 2, 0, b + h / 2), scale=(h + (r - l) / 2, 1, h / 2),
+                               color=color, parent=parent)
         B.setTransparency(self._engine.pandac.TransparencyAttrib.MAlpha)
-        self._to_destroy.append(B)
+        self._resources.add(B)
         if self.implicit_markers:
-            self.marker(242)
+            self.onset_marker(242)
         if block:
-            if isinstance(duration, (list, tuple)):
-                self.sleep(duration[0])
-                self.waitfor(duration[1])
-            elif type(duration) == str:
-                self.waitfor(duration)
-            else:
-                self.sleep(duration)
-            self._destroy_object([L, R, T, B], 243)
+            return self._latent(self._hold(duration, [L, R, T, B], 243))
         else:
             if duration > 0:
-                self._engine.base.taskMgr.doMethodLater(duration, self._destroy_object,
-                                                        'ConvenienceFunctions, remove_frame',
-                                                        extraArgs=[[L, R, T, B], 243])
+                self._expire_later(duration, [L, R, T, B], 243)
             return self.destroy_helper([L, R, T, B])
 
     def picture(self,
-                image,  # the image to display (may be a file name, preferably a relative path)
+                image,
+                # the image to display (may be a file name, preferably a relative path,
+                # or a reference to an image in a loaded atlas, as in 'atlas:media/face01.png'; see load_atlas())
                 duration=1.0,  # duration for which this object will be displayed
                 # if this is a string, the stimulus will be displayed until the corresponding event is generated
                 # if this is a list of [number,string], the stimulus will at least be displayed for <number> seconds,
@@ -308,27 +335,110 @@ class BasicStimuli:
         if duration == 0:
             block = False
 
-        obj = self._engine.direct.gui.OnscreenImage.OnscreenImage(image=image, pos=pos, hpr=hpr, scale=scale,
-                                                                  color=color, parent=parent)
-        self._to_destroy.append(obj)
+        obj = self._onscreen_image(block, image, pos=pos, hpr=hpr, scale=scale, color=color,
+                                   parent=parent)
+        self._resources.add(obj)
         obj.setTransparency(self._engine.pandac.TransparencyAttrib.MAlpha)
         if self.implicit_markers:
-            self.marker(248)
+            self.onset_marker(248)
         if block:
-            if isinstance(duration, (list, tuple)):
-                self.sleep(duration[0])
-                self.waitfor(duration[1])
-            elif type(duration) == str:
-                self.waitfor(duration)
-            else:
-                self.sleep(duration)
-            self._destroy_object(obj, 249)
+            return self._latent(self._hold(duration, obj, 249))
+        else:
+            if duration > 0:
+                self._expire_later(duration, obj, 249)
+            return obj
+
+    def draw_batch(self,
+                   kind,  # the kind of the elements: 'rectangle', 'crosshair' or 'picture'
+                   positions,  # N x 2 (NumPy) array of the (x,y) positions of the elements on the screen
+                   colors=None,  # N x 4 array of (r,g,b,a) colors, or a single color for all elements (default: white)
+                   scales=None,
+                   # N x 2 array of (x,y) half-sizes, an array of N sizes, or a single size for all elements
+                   # (default: 0.05)
+                   duration=1.0,  # duration for which the elements will be displayed
+                   # if this is a string, the stimulus will be displayed until the corresponding event is generated
+                   # if this is a list of [number,string], the stimulus will at least be displayed for <number> seconds,
+                   # but needs to confirmed with the respective event
+                   # if this is 0, the call will be non-blocking and you have to .destroy()
+                   # the return value of this function manually
+                   block=True,  # whether this function should only return once the duration is over
+                   # additional parameters
+                   images=None,
+                   # for pictures: a single image (file name or Texture) for all elements, or a list of references
+                   # to images on the same atlas page, one per element (see load_atlas())
+                   thickness=0.08,  # for crosshairs: the thickness of the bars relative to their length
+                   parent=None  # the renderer to use for displaying the elements
+                   ):
+        """
+        Draw many elements (e.g., the items of a visual search display) at once, as a single node with a single
+        draw call. The non-blocking version returns a StimulusBatch whose elements can be changed via its update()
+        function without rebuilding the geometry. Requires NumPy.
+        """
+        if self.extensive_markers:
+            self.marker("BasicStimuli::draw_batch(kind=%s)" % kind)
+        if duration == 0:
+            block = False
+
+        obj = StimulusBatch(self._engine, kind, positions, colors, scales, images, thickness, parent)
+        self._resources.add(obj)
+        onset, offset = {'rectangle': (250, 251), 'crosshair': (252, 253), 'picture': (248, 249)}[kind]
+        if self.implicit_markers:
+            self.onset_marker(onset)
+        if block:
+            return self._latent(self._hold(duration, obj, offset))
         else:
             if duration > 0:
-                self._engine.base.taskMgr.doMethodLater(duration, self._destroy_object,
-                                                        'ConvenienceFunctions, remove_picture', extraArgs=[obj, 249])
+                self._expire_later(duration, obj, offset)
             return obj
 
+    def rsvp(self,
+             images,  # list of images to present (file names or Textures)
+             frames=6,
+             # the number of display frames for which each image is shown;
+             # either a single number or a list with one number per image
+             block=True,  # whether to wait until the whole stream has been presented
+             # if False, the stream is returned and can be stopped early via its destroy() function
+             # optional parameters:
+             markers=None,
+             # optional list of onset markers, one per image (None entries are skipped);
+             # each marker is emitted in the frame in which its image appears
+             pos=None,  # the (x,z) or (x,y,z) position of the images on the screen
+             hpr=None,  # the (heading,pitch,roll) angles of the images
+             scale=None,  # the size of the images; a single float or a 2-tuple or 3-tuple of floats
+             color=None,  # the (r,g,b,a) coloring of the images
+             parent=None,  # parent rendering context or Panda3d NodePath
+             ):
+        """
+        Present a rapid serial visual presentation (RSVP) stream of images, each for a given number of frames.
+        The images are preloaded and shown on a single card whose texture is swapped in the render loop (see
+        RSVPStream), so the item durations are frame-exact even at high presentation rates.
+        """
+        if self.extensive_markers:
+            self.marker("BasicStimuli::rsvp(images=%i)" % len(images))
+
+        if pos is not None and type(pos) not in (int, float) and len(pos) == 2:
+            pos = (pos[0], 0, pos[1])
+        if scale is not None and type(scale) not in (int, float) and len(scale) == 2:
+            scale = (scale[0], 1, scale[1])
+        end_marker = None
+        if markers is None and self.implicit_markers:
+            markers = [248] * len(images)
+            end_marker = 249
+
+        def on_finish():
+            # (a stream that has ended on its own no longer needs to be cleaned up)
+            self._resources.release(stream)
+            if block:
+                self.resume()
+
+        stream = RSVPStream(self, images, frames, markers, end_marker, pos=pos, hpr=hpr, scale=scale, color=color,
+                            parent=parent, frameclock=getattr(self, '_frameclock', None), on_finish=on_finish)
+        self._resources.add(stream)
+        if block:
+            return self._latent(self._await_stream(stream))
+        else:
+            return stream
+
     def sound(self,
               filename,  # the sound file name to play (preferably a relative path)
               block=False,  # optionally wait until the sound has finished playing before returning from this function
@@ -350,7 +460,12 @@ class BasicStimuli:
               sourcetype='point',  # can be 'point' or 'ambient'
               playerindex=None,  # can be 1, or 2, or None (in that case using default setting)
               autostop=False,  # whether to issue an OSC stop command at end of track
-              override_id=None  # if this is not none, the sound will be assigned this ID
+              override_id=None,  # if this is not none, the sound will be assigned this ID
+              onset=None
+              # optionally the time of the framework's clock (by default the wall-clock time, as in time.time()) at
+              # which the sound shall start (if None, the sound starts as soon as possible); when playing through the asset manager or the software mixer (see
+              # start_mixer()), the cue is sent ahead of time and started at exactly that time, otherwise the sound
+              # is started in the first frame at or after that time
               ):
         """Play a sound in a particular location."""
         if self.extensive_markers:
@@ -360,6 +475,40 @@ class BasicStimuli:
         if playerindex is None:
             playerindex = self._oscplayer
 
+        if onset is not None and onset > self._clock.time() and \
+                not (self._oscclient is not None and (location == 'surround' or location == 'array')) and \
+                not (self._mixer is not None and not surround and self._mixer.can_load(filename, playrate)):
+            # the engine's audio manager cannot schedule sounds ahead of time, so the sound is started when it is due
+            delay = onset - self._clock.time()
+            args = dict(volume=volume, direction=direction, playrate=playrate, timeoffset=timeoffset,
+                        looping=looping, loopcount=loopcount, surround=surround, distance=distance,
+                        location=location, sourcetype=sourcetype, playerindex=playerindex, autostop=autostop,
+                        override_id=override_id)
+            if block:
+                return self._latent(self._sound_later(delay, filename, args))
+
+            # instantiate a handle that cancels the sound before it starts, or stops it afterwards
+            class Deferred:
+                def __init__(self):
+                    self.sound = None
+                    self.timer = None
+
+                def destroy(self):
+                    if self.sound is not None:
+                        self.sound.stop()
+                    else:
+                        self.timer.destroy()
+
+                def stop(self):
+                    self.destroy()
+
+            deferred = Deferred()
+
+            def start():
+                deferred.sound = self.sound(filename, **args)
+            deferred.timer = self.do_later(delay, start)
+            return deferred
+
         # location = 'surround'  # override destination system (TODO: remove once all is working!)
         if self._oscclient is not None and (location == 'surround' or location == 'array'):
             # play sound via Peter Otto's Max/MSP asset manager
@@ -377,41 +526,51 @@ class BasicStimuli:
             # transmit playback parameters
             destination = "/" + projectname + "/" + location + "/" + str(playerindex) + "/" + sourcetype
 
+            # the whole cue is sent as a single bundle, time-tagged with the desired onset (0 means immediately)
+            cue = OSCBundle(time=onset if onset is not None else 0)
             msg = OSCMessage(destination)
             msg += [id, "vol", volume]
-            oscclient.send(msg)
+            cue.append(msg)
             msg = OSCMessage(destination)
             msg += [id, "clipname", filename]
-            oscclient.send(msg)
+            cue.append(msg)
             msg = OSCMessage(destination)
             msg += [id, "pos", direction * 180 / 3.1415, 0.0, distance]
-            oscclient.send(msg)
+            cue.append(msg)
             msg = OSCMessage(destination)
             msg += [id, "speed", playrate]
-            oscclient.send(msg)
+            cue.append(msg)
 
             if timeoffset > 0:
                 print("Time offset is currently not supported in this interface")
             if loopcount is not None:
                 print("Loop count is currently not supported in this interface")
 
-            # determine the length of the file, so we can block for the appropriate time (and later reclaim sound ID's)
-            obj = self._engine.loader.loadSfx(filename)
-            length = obj.length()
+            # determine the length of the file, so we can block for the appropriate time (and later reclaim sound ID's);
+            # the length is usually read from the file header via the audio index (and only decoded as a fallback)
+            obj = None
+            length = get_audio_index().duration(filename)
+            if length is None:
+                obj = self._engine.base.loader.loadSfx(filename)
+                length = obj.length()
             if loopcount is not None:
                 length *= loopcount
             if looping:
-                obj.setLoop(True)
                 length = 100000
             if timeoffset > 0.0:
                 length -= timeoffset
-            length *= playrate
+            length /= playrate
             if loopcount is None:
                 loopcount = 1
 
             msg = OSCMessage(destination)
             msg += [id, "play", timeoffset, 0 if looping else loopcount]
-            oscclient.send(msg)
+            cue.append(msg)
+            oscclient.send(cue)
+
+            # the time until the sound starts
+            delay = max(0.0, onset - self._clock.time()) if onset is not None else 0.0
+            length += delay
 
             # instantiate a stopper object
             class Stopper:
@@ -434,30 +593,61 @@ class BasicStimuli:
                         self.client.send(msg)
 
             if self.implicit_markers:
-                self.marker(246)
+                self.marker(246, pylsl.local_clock() + delay if delay > 0 else None)
             if block:
-                self.sleep(length)
-                self._destroy_object(obj, 247)
-                stopper = Stopper(oscclient, id, destination, autostop)
-                stopper.stop()
+                def hold():
+                    yield from self._sleep(length)
+                    self._destroy_object(obj, 247)
+                    stopper = Stopper(oscclient, id, destination, autostop)
+                    stopper.stop()
+                return self._latent(hold())
             else:
-                self._engine.base.taskMgr.doMethodLater(length, self._destroy_object,
-                                                        'ConvenienceFunctions, end_sound',
-                                                        extraArgs=[None, 247])
+                self._expire_later(length, None, 247)
                 return Stopper(oscclient, id, destination, autostop)
 
+        elif self._mixer is not None and not surround and self._mixer.can_load(filename, playrate):
+            # play sound via the software mixer (files that it cannot decode are played through the engine)
+            loops = loopcount if loopcount is not None else (0 if looping else 1)
+            obj = self._mixer.play(self._mixer.load(filename, playrate), onset, volume, direction, timeoffset, loops)
+            self._resources.add(obj)
+            length = 100000 if loops == 0 else obj.length()
+            delay = max(0.0, onset - self._clock.time()) if onset is not None else 0.0
+            length += delay
+            if self.implicit_markers:
+                self.marker(246, pylsl.local_clock() + delay if delay > 0 else None)
+            if block:
+                return self._latent(self._hold(length, obj, 247))
+            else:
+                self._expire_later(length, obj, 247)
+                return obj
+
+        elif self.pool_sounds and not surround:
+            # play sound via the voice pool (which recycles the sound objects and ends the voices without a timer
+            # per sound)
+            obj = self._sound_pool.play(filename, volume, direction, playrate, timeoffset, looping, loopcount,
+                                        None if block else (lambda: self._destroy_object(obj, 247)))
+            if obj is None:
+                # all voices are busy (and voice stealing is disabled)
+                return
+            self._resources.add(obj)
+            if self.implicit_markers:
+                self.marker(246)
+            if block:
+                return self._latent(self._hold(min(obj.length(), 100000), obj, 247))
+            return obj
+
         else:
             if surround:
                 if self.audio3d is None:
                     self.audio3d = self._engine.direct.showbase.Audio3DManager.Audio3DManager(
                         self._engine.base.sfxManagerList[0], None)
                 obj = self.audio3d.loadSfx(filename)
-                self._to_destroy.append(obj)
+                self._resources.add(obj)
                 obj.set3dAttributes(1.0 * math.sin(direction), 1.0 * math.cos(direction), 0.0, 0.0, 0.0, 0.0)
                 obj.setVolume(volume)
             else:
-                obj = self._engine.base.loader.loadSfx(filename)
-                self._to_destroy.append(obj)
+                obj = self._media_cache.sound(filename)
+                self._resources.add(obj)
                 obj.setVolume(volume)
                 obj.setBalance(direction)
             length = obj.length()
@@ -471,19 +661,136 @@ class BasicStimuli:
                 obj.setTime(timeoffset)
                 length -= timeoffset
             obj.setPlayRate(playrate)
-            length *= playrate
+            length /= playrate
             obj.play()
             if self.implicit_markers:
                 self.marker(246)
             if block:
-                self.sleep(length)
-                self._destroy_object(obj, 247)
+                return self._latent(self._hold(length, obj, 247))
             else:
-                self._engine.base.taskMgr.doMethodLater(length, self._destroy_object,
-                                                        'ConvenienceFunctions, end_sound',
-                                                        extraArgs=[None, 247])
+                self._expire_later(length, obj, 247)
                 return obj
 
+    def set_polyphony(self,
+                      max_voices=16,  # the maximum number of local sounds that may play at the same time
+                      steal='oldest'
+                      # what to do when all voices are busy: 'oldest' or 'quietest' stops the oldest or the quietest
+                      # playing sound to make room for the new one, 'none' drops the new sound
+                      ):
+        """
+        Play local sounds through the voice-limited sound pool (see SoundPool) and configure its voice limit;
+        returns the pool's statistics.
+        """
+        if steal not in STEAL_POLICIES:
+            raise ValueError("Unsupported voice stealing policy: " + str(steal))
+        self.pool_sounds = True
+        self._sound_pool.max_voices = max_voices
+        self._sound_pool.steal = steal
+        return self._sound_pool.statistics()
+
+    def begin_scope(self,
+                    name='trial'  # the name of the scope (e.g., 'trial' or 'block')
+                    ):
+        """
+        Open a scope (nested in the current one): the stimuli that are created from now on are destroyed together
+        when the scope is ended via end_scope(), unless they have been destroyed already.
+        """
+        return self._resources.push_scope(name)
+
+    def end_scope(self,
+                  name='trial',  # the name of the scope to end (the innermost scope of that name)
+                  teardown=True  # whether to destroy the scope's remaining stimuli (else they are kept)
+                  ):
+        """End a scope (and any scopes nested in it), destroying the stimuli that are still alive in it."""
+        self._resources.pop_scope(name, teardown)
+
+    @contextlib.contextmanager
+    def scope(self,
+              name='trial'  # the name of the scope (e.g., 'trial' or 'block')
+              ):
+        """
+        Context manager for a scope (see begin_scope()): the stimuli, sounds, event handlers (see accept()) and
+        timers (see do_later()) that are created within the with-block are released together when it is left, e.g.:
+            with self.trial_scope():
+                self.picture('cue.png', 3, block=False)
+                self.sound('beep.wav')
+                self.waitfor('space')
+        """
+        scope = self._resources.push_scope(name)
+        try:
+            yield scope
+        finally:
+            if not getattr(self, '_cancelled', False):
+                # (if the module is being cancelled, its cancel() destroys all resources)
+                self._resources.pop_scope(scope)
+
+    def trial_scope(self):
+        """Context manager for a trial scope (see scope())."""
+        return self.scope('trial')
+
+    def block_scope(self):
+        """Context manager for a block scope (see scope())."""
+        return self.scope('block')
+
+    def do_later(self,
+                 delay,  # the delay in seconds
+                 function,  # the function to call
+                 *args  # the arguments to the function
+                 ):
+        """
+        Call a function after the given delay (from the main thread), like taskMgr.doMethodLater(); the call is
+        cancelled if the scope in which it was set up ends before. Returns a handle whose destroy() cancels the call.
+        """
+        timer = ScopedHandle(self._resources)
+
+        def fire(alive):
+            self._resources.release(timer)
+            function(*args)
+        self._schedule_expiry(delay, [timer], [self._resources.handle(timer)], fire)
+        return timer
+
+    def start_mixer(self,
+                    sink=None,
+                    # the output sink (see framework.mixer; by default the sound card if the sounddevice package is
+                    # installed, otherwise a NullSink)
+                    **kwargs  # further arguments to AudioMixer (rate, channels, blocksize, buffer_blocks)
+                    ):
+        """
+        Play local (non-surround) sounds through the framework's software mixer instead of the engine's audio
+        manager, so that sounds can be scheduled sample-accurately via the onset parameter of sound(); the
+        returned voices report the output sample at which they actually started. Only PCM WAV files are played by the
+        mixer; other sound files are played through the engine as before. Returns the AudioMixer.
+        """
+        if self._mixer is None:
+            self._mixer = AudioMixer(sink, clock=self._clock, **kwargs)
+            self._mixer.start()
+        return self._mixer
+
+    def schedule_sounds(self,
+                        cues,
+                        # list of sound cues, each a tuple of (onset, filename) or (onset, filename, parameters), where
+                        # onset is in seconds relative to the start time, and parameters is a dictionary of optional
+                        # arguments to sound() (e.g., {'volume': 0.5, 'direction': 0.3})
+                        start=None,
+                        # the time of the framework's clock (as in sound()) to which the onsets are relative;
+                        # if None, this is the current time plus the lead time
+                        lead=0.1  # the lead time in seconds, to allow the cues to arrive in time
+                        ):
+        """
+        Pre-schedule a whole block of sounds on the asset manager: all cues are sent right away, each as a single
+        time-tagged OSC bundle, so that the sounds start at exactly the scheduled times (see the onset parameter
+        of sound()). Local sounds can be scheduled in the same way on the software mixer (see start_mixer());
+        otherwise they are started in the first frame at or after their onset.
+        Returns the list of return values of sound() (which can be used to stop the sounds).
+        """
+        if start is None:
+            start = self._clock.time() + lead
+        result = []
+        for cue in cues:
+            parameters = cue[2] if len(cue) > 2 else {}
+            result.append(self.sound(cue[1], block=False, onset=start + cue[0], **parameters))
+        return result
+
     def movie(self,
               filename,  # the video file to play (preferably a relative path)
               block=False,  # optionally wait until the movie has finished playing before returning from this function
@@ -534,52 +841,77 @@ class BasicStimuli:
 
         # load the soundtrack if there is one
         try:
-            snd = self._engine.base.loader.loadSfx(filename)
+            snd = self._media_cache.sound(filename)
             if snd.length() == 0.0:
                 snd = None
         except:
             snd = None
         # ... and set basic sound properties
         if snd is not None:
-            self._to_destroy.append(snd)
+            self._resources.add(snd)
             snd.setVolume(volume)
             snd.setBalance(direction)
 
-        # create the video texture and set basic properties
-        tex = self._engine.base.loader.loadTexture(filename)
-        self._to_destroy.append(tex)
+        # create the video texture (or take the prerolled stream, if any) and set basic properties
+        stream = self._movie_streams.pop(filename, None)
+        if stream is None and self.buffer_movies:
+            try:
+                stream = MovieStream(self._engine, filename, self.movie_buffer_frames, self.movie_start_latency,
+                                     self._clock, timeoffset)
+            except Exception as e:
+                print("Could not decode the movie " + filename + " in the background, falling back to the "
+                      "engine's movie texture:", e)
+        if stream is not None:
+            tex = stream.texture
+            self._resources.add(stream)
+            videosize = (stream.width, stream.height)
+        else:
+            tex = self._media_cache.texture(filename)
+            self._resources.add(tex)
+            videosize = (tex.getVideoWidth(), tex.getVideoHeight())
         tex.setBorderColor((bordercolor[0], bordercolor[1], bordercolor[2], bordercolor[3]))
         tex.setWrapU(self._engine.pandac.Texture.WMBorderColor)
         tex.setWrapV(self._engine.pandac.Texture.WMBorderColor)
-        if snd is not None:
+        if snd is not None and stream is None:
             tex.synchronizeTo(snd)
 
         # apply custom playback options and deduce the actual length
-        if snd is not None:
+        if stream is not None:
+            # (the stream starts the soundtrack along with the first frame)
+            if snd is not None:
+                snd.setPlayRate(playrate)
+                if looping:
+                    snd.setLoop(True)
+                else:
+                    snd.setLoopCount(loopcount or 1)
+                if timeoffset > 0.0:
+                    snd.setTime(timeoffset)
+        elif snd is not None:
             length = snd.length()
             playable = snd
         else:
             length = tex.getTime()
             playable = tex
-        if playrate != 1.0:
-            playable.setPlayRate(playrate)
-            length /= playrate
-        if loopcount is not None:
-            playable.setLoopCount(loopcount)
-            length = length * loopcount
-        playable.setLoop(looping)
-        if looping:
-            length = 10000000
-        if timeoffset > 0.0:
-            playable.setTime(timeoffset)
-            length -= timeoffset
+        if stream is None:
+            if playrate != 1.0:
+                playable.setPlayRate(playrate)
+                length /= playrate
+            if loopcount is not None:
+                playable.setLoopCount(loopcount)
+                length = length * loopcount
+            playable.setLoop(looping)
+            if looping:
+                length = 10000000
+            if timeoffset > 0.0:
+                playable.setTime(timeoffset)
+                length -= timeoffset
 
         # deduce the aspect ratio
         if aspect is None:
-            aspect = tex.getVideoWidth() / float(tex.getVideoHeight())
+            aspect = videosize[0] / float(videosize[1])
         # deduce the content scale based on the padding in the video        
         if contentscale is None:
-            contentscale = (float(tex.getVideoWidth()) / tex.getXSize(), float(tex.getVideoHeight()) / tex.getYSize())
+            contentscale = (float(videosize[0]) / tex.getXSize(), float(videosize[1]) / tex.getYSize())
         # deduce the scale of the image
         if scale is None:
             scale = 1.0
@@ -588,8 +920,8 @@ class BasicStimuli:
         if len(scale) == 2:
             scale = (scale[0], 1, scale[1])
         if pixelscale or parent == pixel2d:
-            scale[0] *= tex.getVideoWidth()
-            scale[2] *= tex.getVideoHeight()
+            scale[0] *= videosize[0]
+            scale[2] *= videosize[1]
         else:
             if aspect >= 1.0:
                 scale[2] /= float(aspect)
@@ -605,34 +937,51 @@ class BasicStimuli:
         # create the image and set up content parameters
         img = self._engine.direct.gui.OnscreenImage.OnscreenImage(image=tex, pos=pos, hpr=hpr, scale=scale, color=color,
                                                                   parent=parent)
-        self._to_destroy.append(img)
+        self._resources.add(img)
         img.setTransparency(self._engine.pandac.TransparencyAttrib.MAlpha)
         img.setTexScale(self._engine.pandac.TextureStage.getDefault(), contentscale[0], contentscale[1])
         img.setTexOffset(self._engine.pandac.TextureStage.getDefault(), contentoffset[0], contentoffset[1])
 
         # start playback and assure its destruction
+        if stream is not None:
+            def on_start():
+                if self.implicit_markers:
+                    self.onset_marker(244)
+
+            def on_finish():
+                self._destroy_object([img, snd], 245)
+                if self.implicit_markers:
+                    self.marker("BasicStimuli::movie_stats(filename=%s, decoded=%i, presented=%i, dropped=%i, "
+                                "stalls=%i, start_latency=%.1fms)" % (filename, stream.decoded, stream.presented,
+                                                                      stream.dropped, stream.stalls,
+                                                                      (stream.latency or 0.0) * 1000))
+                if block:
+                    self.resume()
+
+            stream.play(playrate, timeoffset, 0 if looping else (loopcount or 1), snd, on_start, on_finish)
+            if block:
+                return self._latent(self._await_stream(stream))
+            return stream
         playable.play()
         if self.implicit_markers:
-            self.marker(244)
+            self.onset_marker(244)
         if block:
-            self.sleep(length)
-            self._destroy_object(img, 245)
+            return self._latent(self._hold(length, img, 245))
         else:
-            self._engine.base.taskMgr.doMethodLater(length, self._destroy_object, 'ConvenienceFunctions, remove_movie',
-                                                    extraArgs=[[img, tex, snd], 245])
+            self._expire_later(length, [img, tex, snd], 245)
             return playable
 
     def precache_sound(self, filename):
         """Pre-cache a sound file."""
         if filename is None:
             return
-        return self._engine.base.loader.loadSfx(filename)
+        return self._media_cache.sound(filename)
 
     def precache_picture(self, filename):
         """Pre-cache a picture file."""
         if filename is None:
             return
-        return self._engine.base.loader.loadTexture(filename)
+        return self._media_cache.texture(filename)
 
     def precache_font(self, filename):
         """Pre-cache a font file."""
@@ -647,50 +996,130 @@ class BasicStimuli:
         return self._engine.base.loader.loadModel(filename)
 
     def precache_movie(self, filename):
-        """Pre-cache a movie file."""
+        """
+        Pre-cache a movie file. If movies are decoded in the background (see buffer_movies), the decoding of the
+        movie's first frames starts right away (preroll), so that the next movie() call for the file can start
+        playback without waiting for the decoder.
+        """
         if filename is None:
             return
+        if self.buffer_movies and filename not in self._movie_streams:
+            try:
+                self._movie_streams[filename] = MovieStream(self._engine, filename, self.movie_buffer_frames,
+                                                            self.movie_start_latency, self._clock)
+            except Exception as e:
+                print("Could not preroll the movie " + filename + ":", e)
         try:
-            self._engine.base.loader.loadTexture(filename)
+            self._media_cache.texture(filename)
         except:
             pass
         try:
-            return self._engine.base.loader.loadSfx(filename)
+            return self._media_cache.sound(filename)
         except:
             pass
 
+    def preload(self,
+                filenames,  # a file name or list of file names
+                kind='picture',  # the kind of media: 'picture', 'sound', 'movie', 'font' or 'model'
+                priority=0,  # the priority of the request; lower values are loaded first (e.g., -1 for the next trial)
+                event=None  # optionally the name of an event to send once all given files have been loaded
+                ):
+        """
+        Pre-cache media files in the background (unlike the precache_* functions, which block until the file is
+        loaded). Returns a concurrent.futures.Future (or a list of them, if a list of files was given) whose
+        result is the loaded object; to block until the files are loaded, pass an event name and waitfor() it.
+        See MediaPreloader for details.
+        """
+        if self._preloader is None:
+            self._preloader = MediaPreloader(self._engine)
+        futures = self._preloader.preload(filenames, kind, priority, event)
+        if kind in ('picture', 'sound', 'movie'):
+            # enter the loaded files into the media cache
+            def on_done(future, filename):
+                if future.exception() is None:
+                    self._media_cache.add('sound' if kind == 'sound' else 'texture', filename, future.result())
+            for future, filename in zip(futures if type(filenames) != str else [futures],
+                                        filenames if type(filenames) != str else [filenames]):
+                future.add_done_callback(lambda future, filename=filename: on_done(future, filename))
+        return futures
+
+    def preload_progress(self):
+        """Get the number of completed and of submitted background pre-cache requests."""
+        if self._preloader is None:
+            return 0, 0
+        return self._preloader.progress()
+
+    def procedural(self,
+                   kind,  # the kind of stimulus: 'gabor', 'grating' or 'noise'
+                   **params  # the stimulus parameters (see the respective functions in framework.procedural)
+                   ):
+        """
+        Get the texture of a procedurally generated stimulus, which can be passed as the image to picture(), e.g.:
+        self.picture(self.procedural('gabor', size=256, wavelength=20, orientation=45, contrast=0.3), 0.5)
+        Textures are cached by their parameters. Requires NumPy.
+        """
+        if self._procedural is None:
+            self._procedural = ProceduralStimuli(self._engine)
+        return self._procedural.texture(kind, **params)
+
+    def precompute_procedural(self,
+                              kind,  # the kind of stimulus: 'gabor', 'grating' or 'noise'
+                              param_sets  # list of parameter dictionaries (one per stimulus)
+                              ):
+        """
+        Compute procedural stimuli on a worker thread ahead of time, e.g., the candidate stimuli for the next step
+        of a staircase, so that the subsequent procedural() calls only need to create the textures.
+        """
+        if self._procedural is None:
+            self._procedural = ProceduralStimuli(self._engine)
+        self._procedural.precompute(kind, param_sets)
+
+    def load_atlas(self,
+                   source,
+                   # the atlas manifest (.json, as written by framework.atlas), or a directory or list of image files
+                   # that shall be packed into an atlas right away
+                   page_size=2048,  # the size of the atlas pages in pixels (when packing)
+                   padding=2  # the padding around each image in pixels (when packing)
+                   ):
+        """
+        Load a texture atlas, so that its images can be displayed via picture('atlas:<file name>') (or via an
+        ImagePresenter); images on the same atlas page are then shown by only changing texture coordinates.
+        See framework.atlas for details.
+        """
+        return load_atlas(source, page_size, padding)
+
     def uncache_sound(self, filename):
         """Un-cache a previously cached sound file."""
         if filename is None:
             return
-        # get the handle
-        h = self._engine.base.loader.loadSfx(filename)
-        # remove it
-        self._engine.base.loader.unloadSfx(h)
+        self._media_cache.remove('sound', filename)
 
     def uncache_picture(self, filename):
         """Un-cache a previously cached picture file."""
         if filename is None:
             return
-        # get the handle
-        h = self._engine.base.loader.loadTexture(filename)
-        # remove it
-        self._engine.base.loader.unloadTexture(h)
+        self._media_cache.remove('texture', filename)
 
     def uncache_movie(self, filename):
         """Un-cache a previously cached movie file."""
         if filename is None:
             return
-        try:
-            h = self._engine.base.loader.loadTexture(filename)
-            self._engine.base.loader.unloadTexture(h)
-        except:
-            pass
-        try:
-            h = self._engine.base.loader.loadSfx(filename)
-            self._engine.base.loader.unloadSfx(h)
-        except:
-            pass
+        stream = self._movie_streams.pop(filename, None)
+        if stream is not None:
+            stream.destroy()
+        self._media_cache.remove('texture', filename)
+        self._media_cache.remove('sound', filename)
+
+    def prune(self, budget=None):
+        """
+        Unload the least recently used pictures, sounds and movies until the cached media fit into the memory
+        budget (512 MB by default); if a budget in bytes is given, it replaces the current one (None keeps it).
+        The budget is also enforced automatically whenever new media are loaded.
+        Returns a dictionary of cache statistics (number of entries, bytes, budget, hits, misses and evictions).
+        """
+        if budget is not None:
+            self._media_cache.budget = budget
+        return self._media_cache.prune()
 
     # =========================
     # === Advanced Features ===
@@ -728,6 +1157,230 @@ class BasicStimuli:
                 self.pandac = pandac
 
         self._engine = Engine(base, direct, pandac)
+        # the media cache (keeps track of the textures and sounds that are loaded on this engine)
+        self._media_cache = MediaCache(self._engine)
+        # the voice-limited pool through which local sounds are played (recycles the sound objects)
+        self._sound_pool = SoundPool(self._engine, self._media_cache.sound)
+
+    def _hold(self, duration, obj, id=-1):
+        """
+        Internal generator that keeps a stimulus object up for the given duration (as in write())
+        and then destroys it; executed via _latent().
+        """
+        if isinstance(duration, (list, tuple)):
+            yield from self._sleep(duration[0])
+            yield from self._waitfor(duration[1])
+        elif type(duration) == str:
+            yield from self._waitfor(duration)
+        else:
+            yield from self._sleep(duration)
+        self._destroy_object(obj, id)
+
+    def _sound_later(self, delay, filename, args):
+        """
+        Internal generator that waits for the given delay and then plays a sound (see sound()) until it has
+        finished; executed via _latent().
+        """
+        yield from self._sleep(delay)
+        result = self.sound(filename, block=True, **args)
+        if isinstance(result, self.Awaitable):
+            # (in coroutine mode)
+            result = yield from result
+        return result
+
+    def _expire_later(self, delay, obj, id=-1):
+        """
+        Internal helper to destroy a stimulus object (or list of objects) after the given delay, as
+        _destroy_object(obj, id). All pending expirations are handled by a single task (instead of a timer task per
+        stimulus); objects that have been destroyed in the meantime (e.g., at the end of their scope) are skipped.
+        """
+        objs = obj if type(obj) in (list, tuple) else [obj]
+        handles = [self._resources.handle(o) if o is not None else None for o in objs]
+        if id > 0:
+            # if the objects are torn down early (at the end of their scope), the offset marker is emitted then
+            emitted = []
+
+            def emit_offset():
+                if not emitted:
+                    emitted.append(True)
+                    self._destroy_object(None, id)
+            for h in handles:
+                if h is not None:
+                    self._resources.on_teardown(h, emit_offset)
+        self._schedule_expiry(delay, objs, handles, lambda alive: self._destroy_object(alive, id))
+
+    def _schedule_expiry(self, delay, objs, handles, callback):
+        """Internal helper that enters a callback into the expiration heap (see _expire_later())."""
+        heapq.heappush(self._expiries, (self._clock.time() + delay, next(self._expiry_count), objs, handles,
+                                        callback))
+        if self._expiry_task is None:
+            self._expiry_task = self._engine.base.taskMgr.add(self._expiry_tick, "BasicStimuli.expire")
+
+    def _expiry_tick(self, task):
+        """Internal task that handles the due expirations; runs only while expirations are pending."""
+        now = self._clock.time()
+        while self._expiries and self._expiries[0][0] <= now:
+            due, seq, objs, handles, callback = heapq.heappop(self._expiries)
+            tracked = any(h is not None for h in handles)
+            alive = [o for o, h in zip(objs, handles) if h is not None and h in self._resources]
+            if tracked and not alive:
+                # (the objects have been destroyed already)
+                continue
+            try:
+                callback(alive if tracked else None)
+            except Exception as e:
+                print("Exception during timed stimulus removal:", e)
+        if not self._expiries:
+            self._expiry_task = None
+            return task.done
+        return task.cont
+
+    def _await_stream(self, stream):
+        """
+        Internal generator that waits until an RSVP stream has ended (or stops it if the module is cancelled);
+        executed via _latent().
+        """
+        try:
+            while not stream.finished:
+                # (the stream resumes the module when it has ended)
+                yield from self._sleep()
+        finally:
+            self._destroy_object(stream)
+
+    def _onscreen_text(self, pooled, text, pos, font, **style):
+        """
+        Internal helper to create an OnscreenText; if pooled, an idle text node with the same style is reused
+        (only the text and position are updated).
+        """
+        if pooled and self.pool_stimuli:
+            key = ('text', font, tuple(sorted(style.items())))
+            try:
+                obj = self._stimulus_pool.acquire(key)
+            except TypeError:
+                # the style cannot be used as a key (e.g., a color was given as a list)
+                return self._onscreen_text(False, text, pos, font, **style)
+            if obj is not None:
+                obj.setText(text)
+                obj.setTextPos(pos[0], pos[1])
+                return obj
+        font = self._load_font(font)
+        if not (pooled and self.pool_stimuli):
+            return self._engine.direct.gui.OnscreenText.OnscreenText(text=text, pos=pos, font=font, **style)
+        obj = self._engine.direct.gui.OnscreenText.OnscreenText(text=text, pos=pos, font=font, mayChange=True, **style)
+        return self._stimulus_pool.adopt(key, obj)
+
+    def _cached_text(self, text, pos, font, roll, scale, fg, bg, shadow, shadowOffset, frame, align, wordwrap,
+                     drawOrder, parent, sort):
+        """
+        Internal helper to display a piece of text by instancing its cached geometry (which is generated in the
+        same way as by OnscreenText if it is not cached yet); returns a TextInstance, or None if the text's style
+        cannot be used as a cache key.
+        """
+        key = (text, font, align, wordwrap, fg, bg, shadow, shadowOffset, frame)
+        try:
+            geometry = self._text_cache.get(key)
+        except TypeError:
+            # the style cannot be used as a key (e.g., a color was given as a list)
+            return None
+        if geometry is None:
+            pandac = self._engine.pandac
+            node = pandac.TextNode('BasicStimuli.write')
+            node.setFont(self._load_font(font))
+            node.setAlign(align)
+            if wordwrap is not None:
+                node.setWordwrap(wordwrap)
+            if fg is None:
+                fg = (0, 0, 0, 1)
+            node.setTextColor(*fg)
+            if bg is not None and bg[3] != 0:
+                node.setCardColor(*bg)
+                node.setCardAsMargin(0.1, 0.1, 0.1, 0.1)
+            if shadow is not None and shadow[3] != 0:
+                node.setShadowColor(*shadow)
+                node.setShadow(*shadowOffset)
+            if frame is not None and frame[3] != 0:
+                node.setFrameColor(*frame)
+                node.setFrameAsMargin(0.1, 0.1, 0.1, 0.1)
+            node.setText(text)
+            geometry = pandac.NodePath(node.generate())
+            if fg[3] != 1 or (bg is not None and bg[3] not in (0, 1)):
+                geometry.setTransparency(pandac.TransparencyAttrib.MAlpha)
+            geometry.flattenStrong()
+            self._text_cache.put(key, geometry)
+        if parent is None:
+            parent = self._engine.base.aspect2d
+        nodepath = parent.attachNewNode('BasicStimuli.write', sort)
+        geometry.instanceTo(nodepath)
+        nodepath.setPos(pos[0], 0, pos[1])
+        # (OnscreenText rolls clockwise)
+        nodepath.setR(-roll)
+        if type(scale) in (int, float):
+            nodepath.setScale(scale)
+        else:
+            nodepath.setScale(scale[0], 1, scale[1])
+        if drawOrder is not None:
+            nodepath.setBin('fixed', drawOrder)
+        return TextInstance(nodepath)
+
+    def _load_font(self, font):
+        """Internal helper to resolve a font file name; each font is loaded only once per module."""
+        if type(font) != str:
+            return font
+        loaded = self._fonts.get(font)
+        if loaded is None:
+            loaded = self._fonts[font] = self._engine.base.loader.loadFont(font)
+        return loaded
+
+    def _onscreen_image(self, pooled, image, pos=None, hpr=None, scale=None, color=None, parent=None):
+        """
+        Internal helper to create an OnscreenImage (loading texture files via the media cache, and resolving atlas
+        references to an atlas page and UV rectangle); if pooled and the image is a texture, an idle image node with
+        the same parent is reused (with its texture, texture coordinates and transform updated).
+        """
+        uv = None
+        if is_atlas_reference(image):
+            image, uv = lookup_atlas_image(image)
+        elif type(image) == str:
+            image = self._media_cache.texture(image)
+        if not (pooled and self.pool_stimuli and isinstance(image, self._engine.pandac.Texture)):
+            obj = self._engine.direct.gui.OnscreenImage.OnscreenImage(image=image, pos=pos, hpr=hpr, scale=scale,
+                                                                      color=color, parent=parent)
+            if uv is not None:
+                apply_uv(obj, uv)
+            return obj
+        key = ('image', parent)
+        obj = self._stimulus_pool.acquire(key)
+        if obj is None:
+            obj = self._engine.direct.gui.OnscreenImage.OnscreenImage(image=image, pos=pos, hpr=hpr, scale=scale,
+                                                                      color=color, parent=parent)
+            if uv is not None:
+                apply_uv(obj, uv)
+            obj._pool_image = image
+            obj._pool_uv = uv
+            return self._stimulus_pool.adopt(key, obj)
+        if obj._pool_image is not image:
+            obj.setTexture(image, 1)
+            obj._pool_image = image
+        if obj._pool_uv != uv:
+            # (images on the same atlas page only differ in their texture coordinates)
+            if uv is None:
+                obj.clearTexTransform()
+            else:
+                apply_uv(obj, uv)
+            obj._pool_uv = uv
+        obj.setPos(*(pos if pos is not None else (0, 0, 0)))
+        obj.setHpr(*(hpr if hpr is not None else (0, 0, 0)))
+        if scale is None:
+            obj.setScale(1)
+        elif type(scale) in (int, float):
+            obj.setScale(scale)
+        else:
+            obj.setScale(*scale)
+        if color is None:
+            obj.clearColor()
+        else:
+            obj.setColor(*color)
+        return obj
 
     def _destroy_object(self, obj, id=-1):
         """Internal helper to automatically destroy a stimulus object."""
@@ -739,13 +1392,13 @@ class BasicStimuli:
 
             for o in obj:
                 if o is not None:
+                    # remove from cancel list
+                    self._resources.release(o)
                     if hasattr(o, 'destroy'):
                         o.destroy()
                     elif hasattr(o, 'stop'):
                         o.stop()
                     else:
                         del o
-                    # remove from cancel list
-                    self._to_destroy.remove(o)
         except:
             pass
@@ -0,0 +1,155 @@
+"""
+Batched drawing of many simple stimulus elements (e.g., the items of a visual search display) in a single node.
+"""
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# the quads that make up one element of each kind, as (left, bottom, right, top) in units of the element's scale;
+# the crosshair's bar thickness is filled in from the thickness parameter
+_templates = {
+    'rectangle': lambda thickness: [(-1, -1, 1, 1)],
+    'picture': lambda thickness: [(-1, -1, 1, 1)],
+    'crosshair': lambda thickness: [(-1, -thickness, 1, thickness), (-thickness, -1, thickness, 1)],
+}
+
+
+class StimulusBatch:
+    """
+    A set of stimulus elements (rectangles, crosshairs or pictures) that are drawn as one GeomNode with a single
+    vertex buffer, so that a display with hundreds of elements costs one node and one draw call.
+
+    The elements' positions, colors, scales and (for pictures) texture coordinates are kept in NumPy arrays; they
+    can be changed via update(), which only rewrites the vertex data (the geometry is not rebuilt). To hide an
+    element, set its alpha to zero. Pictures share one texture; to show different images, use references to
+    images on the same atlas page (see framework.atlas).
+    """
+
+    def __init__(self,
+                 engine,  # the engine (see BasicStimuli.set_engine)
+                 kind,  # the kind of the elements: 'rectangle', 'crosshair' or 'picture'
+                 positions,  # N x 2 array of element (x,y) positions
+                 colors=None,  # N x 4 array of (r,g,b,a) colors, or a single color for all elements
+                 scales=None,  # N x 2 array of (x,y) half-sizes, N-element array, or a single number for all elements
+                 images=None,
+                 # for pictures: a single image (file name or Texture), or a list of N atlas references
+                 # (e.g., 'atlas:media/item01.png') that must all lie on the same atlas page
+                 thickness=0.08,  # for crosshairs: the thickness of the bars relative to their length
+                 parent=None  # parent rendering context or Panda3d NodePath
+                 ):
+        """Construct a new StimulusBatch and attach it to the scene graph."""
+        if numpy is None:
+            raise ImportError("Batched drawing requires NumPy.")
+        if kind not in _templates:
+            raise ValueError("Unsupported kind of batch element: " + str(kind))
+        pandac = engine.pandac
+        self.kind = kind
+        self.positions = numpy.array(positions, dtype=numpy.float32).reshape(-1, 2)
+        n = len(self.positions)
+        self.colors = numpy.empty((n, 4), dtype=numpy.float32)
+        self.colors[:] = colors if colors is not None else (1, 1, 1, 1)
+        self.scales = numpy.empty((n, 2), dtype=numpy.float32)
+        scales = numpy.asarray(scales if scales is not None else 0.05, dtype=numpy.float32)
+        self.scales[:] = scales.reshape(-1, 1) if scales.ndim == 1 else scales
+        self.uvs = numpy.empty((n, 4), dtype=numpy.float32)
+        self.uvs[:] = (0, 0, 1, 1)
+
+        texture = None
+        if kind == 'picture':
+            from .atlas import is_atlas_reference, lookup_atlas_image
+            if isinstance(images, (list, tuple)):
+                for k, image in enumerate(images):
+                    if not is_atlas_reference(image):
+                        raise ValueError("Pictures in a batch must be references to atlas images.")
+                    page, self.uvs[k] = lookup_atlas_image(image)
+                    if texture is not None and page is not texture:
+                        raise ValueError("All pictures in a batch must lie on the same atlas page.")
+                    texture = page
+            elif type(images) == str:
+                texture = engine.base.loader.loadTexture(images)
+            else:
+                texture = images
+
+        # the corners and texture coordinates of the quads of a single element, in element units
+        quads = numpy.array(_templates[kind](thickness), dtype=numpy.float32)
+        self._corners = numpy.stack([quads[:, [0, 1]], quads[:, [2, 1]], quads[:, [2, 3]], quads[:, [0, 3]]],
+                                    axis=1).reshape(-1, 2)
+        self._texcoords = (self._corners + 1) / 2
+
+        # vertex format: position, color and texture coordinates, all as float32
+        array_format = pandac.GeomVertexArrayFormat()
+        array_format.addColumn(pandac.InternalName.getVertex(), 3, pandac.Geom.NTFloat32, pandac.Geom.CPoint)
+        array_format.addColumn(pandac.InternalName.getColor(), 4, pandac.Geom.NTFloat32, pandac.Geom.CColor)
+        array_format.addColumn(pandac.InternalName.getTexcoord(), 2, pandac.Geom.NTFloat32, pandac.Geom.CTexcoord)
+        vertex_format = pandac.GeomVertexFormat.registerFormat(pandac.GeomVertexFormat(array_format))
+        self._vdata = pandac.GeomVertexData('StimulusBatch', vertex_format, pandac.Geom.UHDynamic)
+        self._vdata.uncleanSetNumRows(n * len(self._corners))
+        self._write_vertices()
+
+        # two triangles per quad
+        quad_count = n * len(quads)
+        indices = (numpy.arange(quad_count, dtype=numpy.uint32)[:, None] * 4 +
+                   numpy.array([0, 1, 2, 0, 2, 3], dtype=numpy.uint32)).reshape(-1)
+        triangles = pandac.GeomTriangles(pandac.Geom.UHStatic)
+        triangles.setIndexType(pandac.Geom.NTUint32)
+        index_array = triangles.modifyVertices()
+        index_array.uncleanSetNumRows(len(indices))
+        memoryview(index_array).cast('B')[:] = indices.tobytes()
+        geom = pandac.Geom(self._vdata)
+        geom.addPrimitive(triangles)
+        node = pandac.GeomNode('StimulusBatch')
+        node.addGeom(geom)
+
+        if parent is None:
+            parent = engine.base.aspect2d
+        self.nodepath = parent.attachNewNode(node)
+        self.nodepath.setTransparency(pandac.TransparencyAttrib.MAlpha)
+        if texture is not None:
+            self.nodepath.setTexture(texture, 1)
+
+    def update(self,
+               indices=None,  # the indices of the elements to update (a slice, index array or boolean mask; all if None)
+               positions=None,  # new positions of the elements
+               colors=None,  # new colors of the elements
+               scales=None,  # new scales of the elements
+               ):
+        """Change attributes of some or all elements; only the vertex data is rewritten."""
+        if indices is None:
+            indices = slice(None)
+        if positions is not None:
+            self.positions[indices] = positions
+        if colors is not None:
+            self.colors[indices] = colors
+        if scales is not None:
+            scales = numpy.asarray(scales, dtype=numpy.float32)
+            self.scales[indices] = scales.reshape(-1, 1) if scales.ndim == 1 else scales
+        self._write_vertices()
+
+    def destroy(self):
+        """Remove the batch from the scene graph."""
+        if self.nodepath is not None:
+            self.nodepath.removeNode()
+            self.nodepath = None
+
+    # support for some occasionally useful functions (as in BasicStimuli.destroy_helper)
+    def setColor(self, r, g, b, a):
+        self.update(colors=(r, g, b, a))
+
+    def setPos(self, x, y, z):
+        self.nodepath.setPos(x, y, z)
+
+    def _write_vertices(self):
+        """Internal helper that computes all vertices in one vectorized pass and writes them to the vertex buffer."""
+        n = len(self.positions)
+        v = len(self._corners)
+        data = numpy.empty((n, v, 9), dtype=numpy.float32)
+        xy = self.positions[:, None, :] + self._corners[None, :, :] * self.scales[:, None, :]
+        data[:, :, 0] = xy[:, :, 0]
+        data[:, :, 1] = 0
+        data[:, :, 2] = xy[:, :, 1]
+        data[:, :, 3:7] = self.colors[:, None, :]
+        data[:, :, 7:9] = self.uvs[:, None, 0:2] + self._texcoords[None, :, :] * (self.uvs[:, None, 2:4] -
+                                                                                 self.uvs[:, None, 0:2])
+        memoryview(self._vdata.modifyArray(0)).cast('B')[:] = data.tobytes()
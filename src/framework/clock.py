@@ -0,0 +1,52 @@
+"""
+Clocks that provide the current time to the framework.
+
+By default, all framework code reads the wall-clock time (RealClock). For headless execution, the launcher
+installs a VirtualClock via set_clock() before any module is loaded; the virtual time only advances when the
+launcher advances it (by one frame period per frame), so that modules can run much faster than real time.
+"""
+
+import time
+
+
+class RealClock:
+    """The default clock, which reports the wall-clock time (as time.time())."""
+
+    virtual = False  # whether the clock's time is decoupled from the wall-clock time
+
+    def time(self):
+        """Get the current time in seconds."""
+        return time.time()
+
+
+class VirtualClock:
+    """A clock whose time only advances when advance() is called."""
+
+    virtual = True  # whether the clock's time is decoupled from the wall-clock time
+
+    def __init__(self, start=None):
+        """Construct a new VirtualClock; the initial time defaults to the current wall-clock time."""
+        self._now = time.time() if start is None else start
+
+    def time(self):
+        """Get the current time in seconds."""
+        return self._now
+
+    def advance(self, duration):
+        """Advance the clock by the given number of seconds."""
+        self._now += duration
+
+
+global _clock
+_clock = RealClock()
+
+
+def get_clock():
+    """Get the clock that is currently used by the framework."""
+    return _clock
+
+
+def set_clock(clock):
+    """Set the clock to be used by subsequently created modules, presenters, etc."""
+    global _clock
+    _clock = clock
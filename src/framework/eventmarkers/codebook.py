@@ -0,0 +1,44 @@
+# -*- coding:utf-8 -*-
+"""
+Codebook for string markers sent via LSL.
+
+When the codebook is enabled, each distinct string marker is assigned a negative integer code the first time it
+is sent (numeric markers are non-negative, so the two cannot be confused). At that time, a mapping sample
+[code, string] is pushed on the side stream 'SNAP-MarkerCodebook' (type 'MarkerCodebook', 2 string channels);
+the marker stream itself only carries the code. Note that the side stream must be recorded from the beginning of
+the session, since mappings are only sent once. Use decode_markers() to restore the strings after recording.
+"""
+
+
+class MarkerCodebook:
+    """Assigns integer codes to string markers."""
+
+    def __init__(self):
+        """Construct a new, empty MarkerCodebook."""
+        self._codes = {}  # mapping from string to code
+
+    def encode(self, marker):
+        """
+        Get the code for a string marker; returns a tuple of the code and a flag that indicates whether the string
+        has just been entered into the codebook (i.e., whether its mapping still needs to be published).
+        """
+        code = self._codes.get(marker)
+        if code is None:
+            code = -(len(self._codes) + 1)
+            self._codes[marker] = code
+            return code, True
+        return code, False
+
+    def __len__(self):
+        return len(self._codes)
+
+
+def decode_markers(markers, mappings):
+    """
+    Restore the string markers in a recorded marker stream.
+    * markers: list of marker stream samples (strings, as recorded from the SNAP-Markers stream)
+    * mappings: list of [code, string] samples recorded from the SNAP-MarkerCodebook stream
+    Returns the list of markers, with all codes that appear in the mappings replaced by their strings.
+    """
+    strings = {str(code): string for code, string in mappings}
+    return [strings.get(str(m), m) for m in markers]
@@ -1,10 +1,15 @@
 import os
+import queue
+import threading
 import time
 import traceback
 
 import pylsl
 from pylsl import stream_info, stream_outlet
 
+from .codebook import MarkerCodebook
+from .markerlog import BinaryMarkerLog
+
 global marker_log
 marker_log = None
 
@@ -14,12 +19,105 @@ lsl_backend = None
 global river_backend
 river_backend = None
 
+# the codebook for string markers sent via LSL, and the outlet for its mappings (if enabled)
+global marker_codebook
+marker_codebook = None
+
+global codebook_backend
+codebook_backend = None
+
 global serial_port
 serial_port = None
 
-
-def init_markers(lsl, logfile, datariver, serialport, uid):
-    """ Initialize the marker protocols to use. """
+# the dispatchers that deliver markers to the enabled backends (one per backend)
+global dispatchers
+dispatchers = []
+
+
+class MarkerDispatcher:
+    """
+    Delivers markers to a single backend, by default on a dedicated worker thread. This way, a slow backend
+    (e.g., a serial port write or a disk flush) neither delays the caller nor skews the timestamps of the other
+    backends. Markers are delivered in the order in which they were sent, together with the LSL and wall-clock
+    timestamps that were taken when send_marker() was called.
+    """
+
+    def __init__(self,
+                 name,  # the name of the backend (for statistics and error messages)
+                 deliver,  # function deliver(markercode, timestamp, wallclock) that delivers a marker to the backend
+                 asynchronous=True  # whether to deliver on a worker thread (otherwise, in the caller's thread)
+                 ):
+        """Construct a new MarkerDispatcher and start its worker thread."""
+        self.name = name
+        self._deliver = deliver
+        self._queue = queue.SimpleQueue()
+        self.delivered = 0  # number of markers delivered so far
+        self.errors = 0  # number of markers whose delivery failed
+        self.total_latency = 0.0  # the sum of all delivery latencies (time from send_marker() until delivered)
+        self.max_latency = 0.0  # the maximum delivery latency
+        self._thread = None
+        if asynchronous:
+            self._thread = threading.Thread(target=self._run, name='MarkerDispatcher-' + name, daemon=True)
+            self._thread.start()
+
+    def submit(self, markercode, timestamp, wallclock):
+        """Submit a marker for delivery."""
+        if self._thread is not None:
+            self._queue.put((markercode, timestamp, wallclock))
+        else:
+            self._dispatch(markercode, timestamp, wallclock)
+
+    def statistics(self):
+        """Get a dictionary of delivery statistics for this backend."""
+        return {'queue_depth': self._queue.qsize(),
+                'delivered': self.delivered,
+                'errors': self.errors,
+                'mean_latency': self.total_latency / self.delivered if self.delivered > 0 else 0.0,
+                'max_latency': self.max_latency}
+
+    def shutdown(self, timeout=5.0):
+        """Deliver all pending markers (waiting up to timeout seconds) and stop the worker thread."""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        """Internal worker thread function."""
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            self._dispatch(*item)
+
+    def _dispatch(self, markercode, timestamp, wallclock):
+        """Internal helper that delivers a marker and updates the statistics."""
+        try:
+            self._deliver(markercode, timestamp, wallclock)
+        except Exception as e:
+            if self.errors == 0:
+                print("Error sending a marker via " + self.name + ":", e)
+            self.errors += 1
+            return
+        latency = pylsl.local_clock() - timestamp
+        self.delivered += 1
+        self.total_latency += latency
+        if latency > self.max_latency:
+            self.max_latency = latency
+
+
+def init_markers(lsl, logfile, datariver, serialport, uid, asynchronous=True, log_flush_interval=1.0,
+                 log_fsync=False, codebook=False):
+    """
+    Initialize the marker protocols to use.
+    If asynchronous is True, markers are delivered to each backend on a dedicated worker thread.
+    If logfile is True, markers are logged into a binary log file (see markerlog.py) whose buffer is flushed
+    at least every log_flush_interval seconds (and forced to disk if log_fsync is True).
+    If codebook is True, string markers are sent via LSL as integer codes (see codebook.py).
+    """
+
+    global dispatchers
+    dispatchers = []
 
     if lsl:
         try:
@@ -29,6 +127,14 @@ def init_markers(lsl, logfile, datariver, serialport, uid):
                                source_id="SNAPmarkers-" + uid)
             lsl_backend = stream_outlet(info)
             lsl_backend.pylsl = pylsl
+            if codebook:
+                global marker_codebook, codebook_backend
+                info = stream_info(name="SNAP-MarkerCodebook", type="MarkerCodebook", channel_count=2,
+                                   nominal_srate=0, channel_format=pylsl.cf_string,
+                                   source_id="SNAPmarkercodebook-" + uid)
+                codebook_backend = stream_outlet(info)
+                marker_codebook = MarkerCodebook()
+            dispatchers.append(MarkerDispatcher('LSL', _deliver_lsl, asynchronous))
             print("The lab streaming layer is ready for sending markers.")
         except RuntimeError as e:
             print(f"Error ({e}) Initializing the lab streaming layer backend failed. "
@@ -38,11 +144,12 @@ def init_markers(lsl, logfile, datariver, serialport, uid):
         try:
             # find a new slot for the logfiles
             for k in range(10000):
-                fname = 'logs/markerlog-' + str(k) + '.log'
+                fname = 'logs/markerlog-' + str(k) + '.bin'
                 if not os.path.exists(fname):
                     global marker_log
-                    marker_log = open(fname, 'w')
+                    marker_log = BinaryMarkerLog(fname, log_flush_interval, log_fsync)
                     break
+            dispatchers.append(MarkerDispatcher('log file', _deliver_log, asynchronous))
             print("A marker logfile has been prepared for logging.")
         except:
             print("Error initializing the marker logging. Your event markers will not be logged into a file.")
@@ -53,6 +160,7 @@ def init_markers(lsl, logfile, datariver, serialport, uid):
             import framework.eventmarkers.datariver_backend
             river_backend = framework.eventmarkers.datariver_backend
             river_backend.send_marker(int(999))
+            dispatchers.append(MarkerDispatcher('DataRiver', _deliver_river, asynchronous))
             print("DataRiver has been loaded successfully for sending markers.")
         except:
             print("Error initializing the DataRiver backend. "
@@ -70,6 +178,8 @@ def init_markers(lsl, logfile, datariver, serialport, uid):
             serial_port = serial.Serial(port=serialport - 1, timeout=TIMEOUT,
                                         bytesize=BYTESIZE, baudrate=BAUDRATE,
                                         parity=PARITY, stopbits=STOPBITS)
+            # the serial port goes first, since it is usually the most latency-sensitive
+            dispatchers.insert(0, MarkerDispatcher('serial port', _deliver_serial, asynchronous))
             print("Serial port interface has been loaded successfully for sending markers.")
         except Exception as e:
             print("Error initializing the Serial port interface. "
@@ -78,27 +188,64 @@ def init_markers(lsl, logfile, datariver, serialport, uid):
             traceback.print_exc()
 
 
-def send_marker(markercode):
-    """Global marker sending / logging function."""
+def send_marker(markercode, timestamp=None):
+    """
+    Global marker sending / logging function.
+    The marker is timestamped right away (unless an LSL timestamp is given) and then handed off to the backends'
+    dispatchers.
+    """
+    if timestamp is None:
+        timestamp = pylsl.local_clock()
+        wallclock = time.time()
+    else:
+        wallclock = time.time() - (pylsl.local_clock() - timestamp)
+    for d in dispatchers:
+        d.submit(markercode, timestamp, wallclock)
+
+
+def marker_statistics():
+    """Get a dictionary of delivery statistics (queue depth, latency, etc.) for each marker backend."""
+    return {d.name: d.statistics() for d in dispatchers}
+
+
+def shutdown_markers():
+    global dispatchers
+    for d in dispatchers:
+        d.shutdown()
+        stats = d.statistics()
+        print("Marker backend %s: %i markers delivered (%i failed), mean latency %.3f ms, max latency %.3f ms." % (
+            d.name, stats['delivered'], stats['errors'], stats['mean_latency'] * 1000, stats['max_latency'] * 1000))
+    dispatchers = []
 
     global serial_port
     if serial_port is not None:
-        serial_port.write(chr(markercode % 256))
-
-    global lsl_backend
-    if lsl_backend is not None:
-        lsl_backend.push_sample(lsl_backend.pylsl.vectorstr([str(markercode)]), lsl_backend.pylsl.local_clock(), True)
+        serial_port.close()
 
     global marker_log
     if marker_log is not None:
-        marker_log.write(repr(time.time()) + ': ' + str(markercode) + '\n')
+        marker_log.close()
+        marker_log = None
 
-    global river_backend
-    if river_backend is not None:
-        river_backend.send_marker(int(markercode))
 
+# --- backend delivery functions (invoked by the dispatchers) ---
 
-def shutdown_markers():
-    global serial_port
-    if serial_port is not None:
-        serial_port.close()
+def _deliver_serial(markercode, timestamp, wallclock):
+    serial_port.write(chr(markercode % 256))
+
+
+def _deliver_lsl(markercode, timestamp, wallclock):
+    if marker_codebook is not None and isinstance(markercode, str):
+        code, new = marker_codebook.encode(markercode)
+        if new:
+            # publish the mapping before the first use of the code
+            codebook_backend.push_sample(pylsl.vectorstr([str(code), markercode]), timestamp, True)
+        markercode = code
+    lsl_backend.push_sample(lsl_backend.pylsl.vectorstr([str(markercode)]), timestamp, True)
+
+
+def _deliver_log(markercode, timestamp, wallclock):
+    marker_log.write(markercode, timestamp, wallclock)
+
+
+def _deliver_river(markercode, timestamp, wallclock):
+    river_backend.send_marker(int(markercode))
@@ -0,0 +1,229 @@
+# -*- coding:utf-8 -*-
+"""
+Compact binary marker log files, and conversion of these files to CSV and XDF.
+
+A marker log file begins with the 8-byte magic 'SNAPMLOG' and a little-endian uint32 format version, followed by
+fixed-size little-endian records (struct format '<Bddq'): record kind, LSL timestamp (float64), wall-clock time
+(float64, as in time.time()) and code (int64). The kinds are:
+* 0: numeric marker; the code is the marker value
+* 1: string marker; the code is the id of the string in the string table
+* 2: string table entry; the code is the id of the string, and the record is followed by the length of the string
+     in bytes (uint32) and its UTF-8 encoding
+A string is entered into the table right before the first marker that uses it, so a log file that was cut short
+(e.g., by a crash) can still be read up to the last complete record.
+
+This module can also be run as a script to convert a log file, e.g.:
+  python -m framework.eventmarkers.markerlog logs/markerlog-0.bin --csv markers.csv --xdf markers.xdf
+"""
+import optparse
+import os
+import struct
+import threading
+
+MAGIC = b'SNAPMLOG'
+VERSION = 1
+
+KIND_NUMERIC = 0
+KIND_STRING = 1
+KIND_STRING_ENTRY = 2
+
+_header = struct.Struct('<8sI')
+_record = struct.Struct('<Bddq')
+_length = struct.Struct('<I')
+
+
+class BinaryMarkerLog:
+    """
+    Writes markers into a buffered binary log file (see module documentation for the format). If a flush interval
+    is given, a background thread flushes the buffer whenever markers have been written, at least every
+    flush_interval seconds.
+    """
+
+    def __init__(self,
+                 filename,  # the file to write to
+                 flush_interval=1.0,  # the maximum time in seconds for which written markers may stay in the buffer
+                 fsync=False,  # whether to also force flushed data to disk (os.fsync) at every flush
+                 buffer_size=65536  # the size of the write buffer in bytes
+                 ):
+        """Construct a new BinaryMarkerLog and write the file header."""
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self._file = open(filename, 'wb', buffering=buffer_size)
+        self._file.write(_header.pack(MAGIC, VERSION))
+        self._strings = {}  # the string table, mapping from string to id
+        self._dirty = False  # whether markers have been written since the last flush
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self._flusher = None
+        if flush_interval is not None:
+            self._flusher = threading.Thread(target=self._flush_loop, name='BinaryMarkerLog', daemon=True)
+            self._flusher.start()
+
+    def write(self, markercode, timestamp, wallclock):
+        """Write a marker with the given LSL timestamp and wall-clock time."""
+        with self._lock:
+            if self._file is not None:
+                self._write(markercode, timestamp, wallclock)
+
+    def _write(self, markercode, timestamp, wallclock):
+        """Internal helper that writes a marker into the buffer."""
+        if isinstance(markercode, str):
+            code = self._strings.get(markercode)
+            if code is None:
+                # enter the string into the table
+                code = len(self._strings)
+                self._strings[markercode] = code
+                data = markercode.encode('utf-8')
+                self._file.write(_record.pack(KIND_STRING_ENTRY, timestamp, wallclock, code))
+                self._file.write(_length.pack(len(data)))
+                self._file.write(data)
+            self._file.write(_record.pack(KIND_STRING, timestamp, wallclock, code))
+        else:
+            self._file.write(_record.pack(KIND_NUMERIC, timestamp, wallclock, int(markercode)))
+        self._dirty = True
+
+    def flush(self):
+        """Flush the buffered markers to the file (and to disk, if fsync is enabled)."""
+        with self._lock:
+            if self._file is not None:
+                self._flush()
+
+    def _flush(self):
+        """Internal helper that flushes the buffer."""
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+        self._dirty = False
+
+    def close(self):
+        """Flush and close the log file."""
+        self._closed.set()
+        if self._flusher is not None:
+            self._flusher.join()
+            self._flusher = None
+        with self._lock:
+            if self._file is not None:
+                self._flush()
+                self._file.close()
+                self._file = None
+
+    def _flush_loop(self):
+        """Internal loop of the thread that flushes the buffer periodically."""
+        while not self._closed.wait(self.flush_interval):
+            try:
+                with self._lock:
+                    if self._dirty and self._file is not None:
+                        self._flush()
+            except Exception as e:
+                print("Error flushing the marker log:", e)
+
+
+def read_marker_log(filename):
+    """
+    Read a binary marker log file; returns a list of (LSL timestamp, wall-clock time, marker) tuples, where the
+    marker is either an int or a str.
+    """
+    markers = []
+    strings = {}
+    with open(filename, 'rb') as f:
+        magic, version = _header.unpack(f.read(_header.size))
+        if magic != MAGIC:
+            raise Exception("The file " + filename + " is not a SNAP binary marker log.")
+        while True:
+            data = f.read(_record.size)
+            if len(data) < _record.size:
+                break
+            kind, timestamp, wallclock, code = _record.unpack(data)
+            if kind == KIND_STRING_ENTRY:
+                data = f.read(_length.size)
+                if len(data) < _length.size:
+                    break
+                length = _length.unpack(data)[0]
+                data = f.read(length)
+                if len(data) < length:
+                    break
+                strings[code] = data.decode('utf-8')
+            elif kind == KIND_STRING:
+                markers.append((timestamp, wallclock, strings[code]))
+            else:
+                markers.append((timestamp, wallclock, code))
+    return markers
+
+
+def write_csv(markers, filename):
+    """Write markers (as returned by read_marker_log) to a CSV file with columns timestamp, wallclock, marker."""
+    import csv
+    with open(filename, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['timestamp', 'wallclock', 'marker'])
+        for timestamp, wallclock, marker in markers:
+            writer.writerow([repr(timestamp), repr(wallclock), marker])
+
+
+def write_xdf(markers, filename, name='SNAP-Markers', source_id='SNAPmarkers'):
+    """
+    Write markers (as returned by read_marker_log) to an XDF file that holds a single string marker stream
+    (as recorded from the launcher's LSL outlet), so that it can be loaded by the usual XDF importers.
+    """
+    from xml.sax.saxutils import escape
+
+    def varlen(n):
+        # variable-length integer as used by XDF
+        if n < 256:
+            return struct.pack('<BB', 1, n)
+        if n < 4294967296:
+            return struct.pack('<BI', 4, n)
+        return struct.pack('<BQ', 8, n)
+
+    def chunk(f, tag, content):
+        f.write(varlen(len(content) + 2))
+        f.write(struct.pack('<H', tag))
+        f.write(content)
+
+    stream_id = struct.pack('<I', 1)
+    with open(filename, 'wb') as f:
+        f.write(b'XDF:')
+        # file header
+        chunk(f, 1, b'<?xml version="1.0"?><info><version>1.0</version></info>')
+        # stream header
+        header = ('<?xml version="1.0"?><info><name>%s</name><type>Markers</type><channel_count>1</channel_count>'
+                  '<nominal_srate>0</nominal_srate><channel_format>string</channel_format>'
+                  '<source_id>%s</source_id><created_at>%r</created_at></info>') % (
+            escape(name), escape(source_id), markers[0][0] if markers else 0.0)
+        chunk(f, 2, stream_id + header.encode('utf-8'))
+        # samples (in chunks of at most 1000)
+        for k in range(0, len(markers), 1000):
+            content = [stream_id, varlen(len(markers[k:k + 1000]))]
+            for timestamp, wallclock, marker in markers[k:k + 1000]:
+                data = str(marker).encode('utf-8')
+                content.append(struct.pack('<Bd', 8, timestamp))
+                content.append(varlen(len(data)))
+                content.append(data)
+            chunk(f, 3, b''.join(content))
+        # stream footer
+        footer = ('<?xml version="1.0"?><info><first_timestamp>%r</first_timestamp>'
+                  '<last_timestamp>%r</last_timestamp><measured_srate>0</measured_srate>'
+                  '<sample_count>%i</sample_count></info>') % (
+            markers[0][0] if markers else 0.0, markers[-1][0] if markers else 0.0, len(markers))
+        chunk(f, 6, stream_id + footer.encode('utf-8'))
+
+
+def convert_marker_log(filename, csvfile=None, xdffile=None):
+    """Convert a binary marker log file to CSV and/or XDF."""
+    markers = read_marker_log(filename)
+    if csvfile:
+        write_csv(markers, csvfile)
+    if xdffile:
+        write_xdf(markers, xdffile)
+    return len(markers)
+
+
+if __name__ == "__main__":
+    parser = optparse.OptionParser(usage="%prog [options] markerlog.bin")
+    parser.add_option("--csv", dest="csvfile", default=None, help="The CSV file to write.")
+    parser.add_option("--xdf", dest="xdffile", default=None, help="The XDF file to write.")
+    (opts, args) = parser.parse_args()
+    if len(args) != 1 or not (opts.csvfile or opts.xdffile):
+        parser.error("Please specify a marker log file and at least one of --csv and --xdf.")
+    count = convert_marker_log(args[0], opts.csvfile, opts.xdffile)
+    print("Converted %i markers." % count)
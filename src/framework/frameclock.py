@@ -0,0 +1,63 @@
+"""
+Running estimate of the display's frame period and phase, for frame-locked stimulus scheduling.
+"""
+
+
+class FrameClock:
+    """
+    Counts display frames and predicts when future frames will be processed.
+
+    The clock is updated once per frame with the time of the frame's tick. It tracks the frame period and the phase
+    of the frame grid with a simple phase-locked loop (an alpha-beta filter), so that single late ticks do not throw
+    off the predictions. If more than one frame period has passed since the last update (e.g., because a frame was
+    dropped), the frame counter advances by the number of elapsed periods; frame numbers thus count display
+    refreshes rather than main loop iterations.
+    """
+
+    def __init__(self,
+                 period=1 / 60.0,  # the initial guess of the frame period, in seconds
+                 alpha=0.1,  # gain of the phase correction
+                 beta=0.01,  # gain of the period correction
+                 warmup=10  # the number of initial frames during which the period is estimated directly
+                 ):
+        """Construct a new FrameClock."""
+        self.period = period  # the current estimate of the frame period, in seconds
+        self.alpha = alpha
+        self.beta = beta
+        self.warmup = warmup
+        self.frame = -1  # the number of the current frame (-1 before the first update)
+        self._time = None  # the estimated tick time of the current frame
+
+    def update(self, now):
+        """Advance the clock to the frame whose tick happens at the given time."""
+        if self._time is None:
+            self.frame = 0
+            self._time = now
+            return
+        if self.frame < self.warmup:
+            # estimate the period directly from the inter-frame intervals
+            delta = now - self._time
+            if delta > 0:
+                self.period = delta if self.frame == 0 else 0.5 * (self.period + delta)
+            self.frame += 1
+            self._time = now
+            return
+        # number of frame periods since the last update
+        elapsed = max(1, int(round((now - self._time) / self.period)))
+        predicted = self._time + elapsed * self.period
+        error = now - predicted
+        self.frame += elapsed
+        self._time = predicted + self.alpha * error
+        self.period += self.beta * error / elapsed
+
+    def predict_time(self, frame):
+        """Predict the tick time of the given frame."""
+        if self._time is None:
+            return None
+        return self._time + (frame - self.frame) * self.period
+
+    def predict_frame(self, t):
+        """Predict the frame whose tick time is closest to the given time (but not before the next frame)."""
+        if self._time is None:
+            return 0
+        return max(self.frame + 1, self.frame + int(round((t - self._time) / self.period)))
@@ -0,0 +1,68 @@
+"""
+Deadline-driven pacing of the launcher's main loop.
+"""
+
+import time
+
+
+class FramePacer:
+    """
+    Paces the main loop to the refresh period of the display, instead of stepping the engine as fast as possible.
+
+    After each engine step, wait() blocks until the next frame deadline, using a coarse sleep() for most of the
+    remaining time (which frees the CPU for other threads, e.g. marker sending) and a short busy-wait for the rest
+    (which keeps the wakeup precise despite the coarse granularity of the OS scheduler). Deadlines lie on a fixed
+    grid of multiples of the refresh period; if a deadline was missed, the miss is counted (and optionally reported)
+    and the pacer re-aligns to the next grid point without waiting.
+
+    Note that wait() should be called while no locks are held, so that other threads can run during the sleep.
+    """
+
+    def __init__(self,
+                 refresh_rate=60.0,  # the refresh rate of the display, in Hz
+                 spin_duration=0.002,  # the final portion of each wait that is busy-waited, in seconds
+                 report_missed=True  # whether to print a message whenever a frame deadline was missed
+                 ):
+        """Construct a new FramePacer for the given display refresh rate."""
+        self.period = 1.0 / refresh_rate  # the frame period, in seconds
+        self.spin_duration = spin_duration
+        self.report_missed = report_missed
+        self.frames = 0  # the number of frames paced so far
+        self.missed_deadlines = 0  # the number of frame deadlines that were missed so far
+        self._deadline = None  # the time of the next frame deadline, according to time.perf_counter()
+
+    def wait(self):
+        """
+        Wait until the next frame deadline; returns the number of deadlines that were missed since the last call
+        (0 if the deadline was met).
+        """
+        now = time.perf_counter()
+        self.frames += 1
+        if self._deadline is None:
+            # first frame: start the deadline grid here
+            self._deadline = now + self.period
+            return 0
+
+        remaining = self._deadline - now
+        if remaining < 0:
+            # we are late: count the deadlines that we missed and re-align to the next grid point
+            missed = int(-remaining // self.period) + 1
+            self.missed_deadlines += missed
+            self._deadline += missed * self.period
+            if self.report_missed:
+                print("FramePacer: missed %i frame deadline(s) (%.2f ms late)." % (missed, -remaining * 1000))
+            return missed
+
+        # coarse sleep for the bulk of the time, then spin until the deadline
+        if remaining > self.spin_duration:
+            time.sleep(remaining - self.spin_duration)
+        while time.perf_counter() < self._deadline:
+            pass
+        self._deadline += self.period
+        return 0
+
+    def reset(self):
+        """Restart the deadline grid and reset the statistics (e.g., after a long stall such as loading a module)."""
+        self.frames = 0
+        self.missed_deadlines = 0
+        self._deadline = None
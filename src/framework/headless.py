@@ -0,0 +1,47 @@
+"""
+Support for headless execution of modules (e.g., for automated tests of experiment scripts).
+"""
+
+
+class EventScript:
+    """
+    A script of input events that are injected during headless execution, in place of a human participant.
+
+    Each line of a script file has the form "<time> <event> [<event> ...]", where the time is in seconds relative
+    to the start of the module and the events are Panda3d event names, for example:
+        5.0 space
+        7.25 mouse1
+    Empty lines and lines that begin with # are ignored.
+    """
+
+    def __init__(self, filename):
+        """Construct a new EventScript by parsing the given script file."""
+        self._entries = []  # list of (time, event) in order of time
+        with open(filename, 'r') as f:
+            for line in f.readlines():
+                line = line.strip()
+                if len(line) == 0 or line.startswith('#'):
+                    continue
+                fields = line.split()
+                for event in fields[1:]:
+                    self._entries.append((float(fields[0]), event))
+        self._entries.sort(key=lambda e: e[0])
+        self._next = 0  # index of the next entry to be injected
+        self._start = 0.0  # the time at which the script was started
+
+    def start(self, now):
+        """(Re-)start the script at the given time."""
+        self._next = 0
+        self._start = now
+
+    def due(self, now):
+        """Get the list of events that are due at the given time (each event is returned only once)."""
+        events = []
+        while self._next < len(self._entries) and self._entries[self._next][0] <= now - self._start:
+            events.append(self._entries[self._next][1])
+            self._next += 1
+        return events
+
+    def finished(self):
+        """Check whether all events of the script have been injected."""
+        return self._next >= len(self._entries)
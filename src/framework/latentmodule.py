@@ -3,13 +3,17 @@
 # time-consumption functions, such as sleep()).
 # ===========================================================================
 
+import heapq
+import inspect
+import itertools
 import threading
-import time
 import traceback
 
 from direct.showbase.MessengerGlobal import messenger
 
 from . import BasicStimuli
+from .frameclock import FrameClock
+from .registry import ScopedHandle
 from . import TickModule
 from . import shared_lock
 
@@ -38,6 +42,19 @@ class LatentModule(TickModule, BasicStimuli):
     elaborate hierarchy of event handlers, sequences and intervals (as usual in Panda3d), or you
     can implement the majority of code as "regular code" with interleaved time-consumption functions,
     or mix these styles.
+
+    By default, run() executes on its own thread, which hands control back and forth with the main loop
+    whenever a time-consumption function is entered or finishes. Alternatively, run() may be written as a
+    generator or as an async def coroutine, in which case it is stepped directly by the main loop (without
+    a thread of its own). In this coroutine mode, the time-consumption functions (including blocking calls
+    of the BasicStimuli functions) return awaitables that must be awaited, as in:
+        async def run(self):
+            await self.write('Press space', duration='space')
+            t = await self.waitfor('space', duration=2)
+    or, if run() is a generator, delegated to using "yield from", as in "yield from self.sleep(1)".
+
+    All time-related functions use the framework's clock (see framework.clock), which may be a virtual clock
+    in headless execution.
     """
 
     def __init__(self,
@@ -58,17 +75,25 @@ class LatentModule(TickModule, BasicStimuli):
         BasicStimuli.__init__(self)
 
         self._thread = None  # the internal runner thread; None if not running
+        self._coroutine = None  # the run() coroutine if running in coroutine mode; None if not running
         # condition variable that signals that the sleep period is over
         self._resumecond = threading.Condition(shared_lock)
+        # condition variable that signals that the runner thread is waiting again (or has finished); used to hand
+        # control back and forth synchronously when running on a virtual clock
+        self._idlecond = threading.Condition(shared_lock)
+        self._handoff = False  # whether the main thread is waiting for the runner thread to become idle
         self._cancelled = False
         # signals whether cancel() has been invoked (i.e. that run() shall terminate at the next opportunity)
 
-        now = time.time()
+        now = self._clock.time()
         # the point in time when the currently running time-consumption function should resume (if any)
         self._resumeat = now
         self._exectime = now  # the time point when the last time-consumption function was invoked
         self._lasttick = now  # the time point of the last tick()
         self._frametime = 1 / 60.0  # initial guess of time between frames (updated every frame)
+        # estimate of the display's frame period and phase (shared by the sub-tasks of a module)
+        self._frameclock = FrameClock()
+        self._resumeframe = None  # the frame at which the current frame-locked wait should end (if any)
         # whether time lost during a sleep(), e.g., due to jitter, will be compensated over successive sleep's
         self._make_up_for_lost_time = make_up_for_lost_time
         # the maximum amount of lost time prior to any sleep() call that will be compensated for
@@ -80,9 +105,18 @@ class LatentModule(TickModule, BasicStimuli):
         # the tick function that is running whenever no current tick function is specified
         self._default_tick = default_tick
 
-        self._subtasks = []  # optional list of any semi-parallel sub-tasks; tick and cancel are propagated down to them
+        # optional (ordered) set of any semi-parallel sub-tasks; tick and cancel are propagated down to them
+        self._subtasks = {}
+        # heap of (resume time, sequence number, sub-task) for sleeping sub-tasks that need no per-frame tick
+        self._timers = []
+        self._ticked = {}  # (ordered) set of sleeping sub-tasks that need to be ticked every frame
+        self._stale_timers = 0  # number of superseded entries in self._timers
+        self._timer_count = itertools.count()  # source of sequence numbers for self._timers
+        self._parent = None  # the task that launched this task as a sub-task, if any
+        self._timer_seq = None  # sequence number of this task's current entry in the parent's timer heap, if any
         self._messages = []  # queue of messages to be sent off at the next tick
-        self._to_destroy = []  # list of objects to .destroy() upon cancel
+        self._telemetry = None  # the launcher's frame timing telemetry recorder, if any
+        self._scoped_events = {}  # mapping from event name to the ScopedHandle of a handler accepted within a scope
 
     # ======================
     # === Core Interface ===
@@ -96,6 +130,8 @@ class LatentModule(TickModule, BasicStimuli):
         * Consider using try/finally in your run() function to clean up any on-screen (or audio) resources when the
           module is cancelled. This is especially true in the advanced use case of implementing parallel sub-tasks that
           are intended to be cancelled at some point by the main task.
+        * This function may also be a generator or an async def coroutine; in that case it is executed in
+          coroutine mode (see class documentation) and must await all time-consumption functions.
         """
 
     def launch(self, newtask, inherit_timing_parameters=True):
@@ -107,8 +143,11 @@ class LatentModule(TickModule, BasicStimuli):
             newtask._make_up_for_lost_time = self._make_up_for_lost_time
             newtask._max_compensated_time = self._max_compensated_time
             newtask._max_inter_frame_interval = self._max_inter_frame_interval
+        newtask._parent = self
+        newtask._frameclock = self._frameclock
+        newtask._onset_tracker = self._onset_tracker
+        self._subtasks[newtask] = None
         newtask.start()
-        self._subtasks.append(newtask)
         return newtask
 
     # ====================================================================================
@@ -120,20 +159,7 @@ class LatentModule(TickModule, BasicStimuli):
         Sleep for a number of seconds; optionally execute some tick function at every frame.
         Event handlers may fire during this time, and content is rendered every frame.
         """
-        self._exectime = time.time()
-        if self._make_up_for_lost_time and abs(self._resumeat - self._exectime) < self._max_compensated_time:
-            self._resumeat = self._resumeat + duration
-        else:
-            self._resumeat = self._exectime + duration
-
-        self._cur_tick = cur_tick
-        if self._cancelled:
-            # make sure that run() terminates
-            raise self.ModuleCancelled
-        self._resumecond.wait(self._resumeat - self._exectime)
-        if self._cancelled:
-            # make sure that run() terminates
-            raise self.ModuleCancelled
+        return self._latent(self._sleep(duration, cur_tick))
 
     def waitfor(self, eventid, duration=100000, cur_tick=None):
         """
@@ -143,26 +169,7 @@ class LatentModule(TickModule, BasicStimuli):
         Returns None if no event has happened and otherwise the time when the 
         event occurred (relative to the beginning of the wait period).
         """
-        # register the event handler(s)
-        self._events_received = []
-        self._times_received = []
-
-        try:
-            self.accept(eventid, self._on_wait_event, [eventid])
-
-            # call sleep
-            if self.implicit_markers:
-                self.marker(228)
-            self.sleep(duration, cur_tick)
-
-        finally:
-            self.ignore(eventid)
-
-        # wrap up results
-        if len(self._times_received) > 0:
-            return self._times_received[0]
-        else:
-            return None
+        return self._latent(self._waitfor(eventid, duration, cur_tick))
 
     def waitfor_multiple(self, eventids, duration=100000, cur_tick=None):
         """
@@ -173,30 +180,7 @@ class LatentModule(TickModule, BasicStimuli):
         id of the event that happened first and the time when it occurred
         (relative to the beginning of the wait period).
         """
-        # register the event handler(s)
-        self._events_received = []
-        self._times_received = []
-        if eventids.__class__ is str:
-            eventids = [eventids]
-
-        try:
-            for eventid in eventids:
-                self.accept(eventid, self._on_wait_event, [eventid])
-
-            # call sleep
-            if self.implicit_markers:
-                self.marker(228)
-            self.sleep(duration, cur_tick)
-
-        finally:
-            for eventid in eventids:
-                self.ignore(eventid)
-
-        # wrap up results
-        if len(self._times_received) > 0:
-            return self._events_received[0], self._times_received[0]
-        else:
-            return None
+        return self._latent(self._waitfor_multiple(eventids, duration, cur_tick))
 
     def watchfor(self, eventid, duration=100000, cur_tick=None):
         """
@@ -206,23 +190,7 @@ class LatentModule(TickModule, BasicStimuli):
         Returns a list of times at which the event occurred (relative to the 
         beginning of the watch period), or an empty list if it did not occur.
         """
-        try:
-            self._measuretime = time.time()
-            # register an event handler
-            self._received_dict = {eventid: []}
-            self._events_received = []
-            self.accept(eventid, self._on_record_event, [eventid])
-
-            # call sleep
-            if self.implicit_markers:
-                self.marker(228)
-            self.sleep(duration, cur_tick)
-
-        finally:
-            # unregister the handler
-            self.ignore(eventid)
-
-        return self._received_dict[eventid]
+        return self._latent(self._watchfor(eventid, duration, cur_tick))
 
     def watchfor_multiple(self, eventids, duration=100000, cur_tick=None, list_only=False):
         """
@@ -235,29 +203,38 @@ class LatentModule(TickModule, BasicStimuli):
         occurred (relative to the beginning of the watch period). If list_only is given
         as true, instead a list of event codes in order of appearance is returned 
         """
-        try:
-            self._measuretime = time.time()
-            # register event handlers and reset the dict
-            self._received_dict = {}
-            self._events_received = []
-            for eventid in eventids:
-                self._received_dict[eventid] = []
-                self.accept(eventid, self._on_record_event, [eventid])
+        return self._latent(self._watchfor_multiple(eventids, duration, cur_tick, list_only))
 
-            # call sleep
-            if self.implicit_markers:
-                self.marker(228)
-            self.sleep(duration, cur_tick)
+    def present_at_frame(self, frame, cur_tick=None):
+        """
+        Sleep until the given display frame (see current_frame()), so that a stimulus that is created right
+        afterwards is shown at the flip of that frame; optionally execute some tick function at every frame.
+        Event handlers may fire during this time, and content is rendered every frame.
 
-        finally:
-            # unregister the handlers
-            for eventid in eventids:
-                self.ignore(eventid)
+        Returns the number of the frame at which the function actually returned (which is later than the
+        requested frame if that frame had already passed or was dropped).
+        """
+        return self._latent(self._present_at_frame(frame, cur_tick))
 
-        if list_only:
-            return self._events_received
-        else:
-            return self._received_dict
+    def schedule_at(self, t, cur_tick=None):
+        """
+        Sleep until the display frame that is predicted to be processed closest to the given point in time
+        (of the framework's clock, e.g. t0 + 0.5, where t0 was obtained via self._clock.time()), so that a stimulus
+        that is created right afterwards is shown at the flip of that frame. The prediction is based on a running
+        estimate of the frame period and phase, which allows for frame-exact stimulus durations (e.g., in RSVP or
+        SSVEP paradigms); optionally execute some tick function at every frame.
+
+        Returns a tuple of the predicted and the actual frame number.
+        """
+        return self._latent(self._schedule_at(t, cur_tick))
+
+    def current_frame(self):
+        """The number of the current display frame (counting display refreshes since the module was started)."""
+        return self._frameclock.frame
+
+    def frame_period(self):
+        """The current estimate of the display's frame period, in seconds."""
+        return self._frameclock.period
 
     def watchfor_multiple_begin(self, eventids):
         """
@@ -270,7 +247,7 @@ class LatentModule(TickModule, BasicStimuli):
         results = self.watchfor_multiple_end(h);
         """
         # register event handlers and reset the dict
-        self._measuretime = time.time()
+        self._measuretime = self._clock.time()
         self._received_dict = {}
         self._events_received = []
         for eventid in eventids:
@@ -299,13 +276,15 @@ class LatentModule(TickModule, BasicStimuli):
         """
         Resume from a time-consumption function, e.g., in response to some event.
         """
-        self._resumeat = time.time()
+        self._resumeat = self._clock.time()
+        self._resumeframe = None
+        self._schedule()
 
     def consumed_duration(self):
         """
         The amount of time that has been consumed since the most recent time-consumption function was entered.
         """
-        return time.time() - self._exectime
+        return self._clock.time() - self._exectime
 
     # ==============================================
     # === advanced functions for complex modules ===
@@ -316,11 +295,39 @@ class LatentModule(TickModule, BasicStimuli):
         Convenience function for sending messages.
         """
         self._messages.append(msg)
+        self._schedule()
+
+    def accept(self, event, method, extraArgs=[]):
+        """
+        Accept an event (see DirectObject.accept()); if this happens within a scope (see trial_scope()), the event
+        handler is removed when the scope ends.
+        """
+        TickModule.accept(self, event, method, extraArgs)
+        if event not in self._scoped_events and self._resources.current_scope() != 'module':
+            self._scoped_events[event] = ScopedHandle(self._resources, self.ignore, event)
 
-    def prune(self):
+    def ignore(self, event):
+        """Stop accepting an event (see DirectObject.ignore())."""
+        TickModule.ignore(self, event)
+        handle = self._scoped_events.pop(event, None)
+        if handle is not None:
+            self._resources.release(handle)
+
+    def frame_statistics(self):
+        """
+        Get a dictionary of frame timing statistics (frame count, dropped frames, inter-frame intervals, etc.)
+        since the module was started, or None if the launcher does not record frame telemetry.
+        """
+        if self._telemetry is None:
+            return None
+        return self._telemetry.summary()
+
+    def prune(self, budget=None):
         """
         Optionally release any large cached resources (e.g. textures) to make space for the next module.
+        By default, this prunes the media cache (see BasicStimuli.prune()).
         """
+        return BasicStimuli.prune(self, budget)
 
     # ==================================================
     # === Implementation of the TickModule interface ===
@@ -333,15 +340,25 @@ class LatentModule(TickModule, BasicStimuli):
         try:
             shared_lock.acquire()
             # engine_lock.acquire()
-            if self._thread is None:
+            if self._thread is None and self._coroutine is None and self._is_coroutine_run():
+                # coroutine mode: create the run() coroutine and step it up to its first time-consumption function
+                self._cancelled = False
+                self._resumeat = self._clock.time()
+                self._clear_subtasks()
+                self._coroutine = self.run()
+                self._step_coroutine()
+            elif self._thread is None and self._coroutine is None:
                 # create the runner thread and launch it
                 self._thread = threading.Thread(target=self._run_wrap)
                 self._thread.daemon = True
                 self._thread.start()
                 self._cancelled = False
-                self._resumeat = time.time()
+                self._resumeat = self._clock.time()
                 # make sure that the sub-tasks are clean
-                self._subtasks = []
+                self._clear_subtasks()
+                if self._clock.virtual:
+                    # let the thread run up to its first time-consumption function
+                    self._wait_idle()
         finally:
             # engine_lock.release()
             shared_lock.release()
@@ -351,15 +368,31 @@ class LatentModule(TickModule, BasicStimuli):
         Implementation of the cancel() interface, see TickModule.
         """
         # first cancel all sub-tasks
-        for t in self._subtasks:
+        for t in list(self._subtasks):
             t.cancel()
-        self._subtasks = []
+        self._clear_subtasks()
 
         shared_lock.acquire()
         # engine_lock.acquire()
 
-        # then cancel the main thread
-        if self._thread is not None:
+        # then cancel the main thread (or coroutine)
+        if self._coroutine is not None:
+            # set the cancellation flag and step the coroutine, so that the ModuleCancelled exception is raised in it
+            self._cancelled = True
+            self._step_coroutine()
+            if self._coroutine is not None:
+                # the coroutine swallowed the exception: close it forcibly
+                try:
+                    self._coroutine.close()
+                except Exception as e:
+                    print("Exception while closing run():")
+                    print(e)
+                self._coroutine = None
+                if self._parent is not None:
+                    self._parent._release_subtask(self)
+            # engine_lock.release()
+            shared_lock.release()
+        elif self._thread is not None:
             thread = self._thread
             # set the cancellation flag and notify the thread
             self._cancelled = True
@@ -372,13 +405,40 @@ class LatentModule(TickModule, BasicStimuli):
             # engine_lock.release()
             shared_lock.release()
 
-        # finally destroy all objects in self._to_destroy (in reverse order)
-        self._to_destroy.reverse()
-        for e in self._to_destroy:
-            try:
-                e.destroy()
-            except:
-                pass
+        # finally destroy all remaining stimulus objects (most recent first), reporting what was left over; this is
+        # done under the lock, since the runner thread may still be unwinding (without tearing down its scopes)
+        shared_lock.acquire()
+        try:
+            self._release_resources()
+        finally:
+            shared_lock.release()
+
+    def _release_resources(self):
+        """Internal helper that destroys all remaining resources of the module (after it has been cancelled)."""
+        leftovers = self._resources.leak_report()
+        if leftovers:
+            print("%s: destroying %i leftover objects at cancel (%s)." % (
+                self.__class__.__name__, sum(n for scope, kind, n in leftovers),
+                ", ".join("%i %s in %s scope" % (n, kind, scope) for scope, kind, n in leftovers)))
+        self._resources.clear()
+        self._scoped_events = {}
+        # (the pending expirations refer to objects that have been destroyed by now)
+        self._expiries = []
+        # and release the recycled stimulus nodes and sound objects
+        self._stimulus_pool.clear()
+        self._sound_pool.clear()
+        for stream in self._movie_streams.values():
+            stream.destroy()
+        self._movie_streams = {}
+        if self._preloader is not None:
+            self._preloader.shutdown()
+            self._preloader = None
+        if self._procedural is not None:
+            self._procedural.shutdown()
+            self._procedural = None
+        if self._mixer is not None:
+            self._mixer.shutdown()
+            self._mixer = None
 
     def tick(self):
         """
@@ -389,11 +449,14 @@ class LatentModule(TickModule, BasicStimuli):
             # engine_lock.acquire()
 
             # determine the inter-frame time delta (if it's not a hickup)
-            now = time.time()
+            now = self._clock.time()
             delta = now - self._lasttick
             if delta < self._max_inter_frame_interval:
                 self._frametime = delta
             self._lasttick = now
+            if self._parent is None:
+                # the top-level task keeps track of the display frames
+                self._frameclock.update(now)
 
             # send all queued messages
             for msg in self._messages:
@@ -401,9 +464,15 @@ class LatentModule(TickModule, BasicStimuli):
             self._messages = []
 
             # if we are closer to the frame at which we should resume than the one before, end the sleep period 
-            if now > self._resumeat - self._frametime / 2:
+            if self._is_due(now):
                 # time-consumption function may finish now
-                self._resumecond.notify()
+                if self._coroutine is not None:
+                    self._step_coroutine()
+                else:
+                    self._resumecond.notify()
+                    if self._clock.virtual:
+                        # virtual time must not advance while the runner thread is still busy
+                        self._wait_idle()
             elif self._cur_tick is not None:
                 # invoke current tick function
                 if self._cur_tick(delta) is False:
@@ -413,14 +482,25 @@ class LatentModule(TickModule, BasicStimuli):
                 if self._default_tick(delta) is False:
                     self.resume()
 
-            # propagate tick to sub-tasks    
-            for t in self._subtasks[:]:
-                if not t.is_alive():
-                    # optimization: remove from subtasks if not alive anymore
-                    self._subtasks.remove(t)
-                else:
-                    # invoke tick
-                    t.tick()
+            # propagate tick to the sub-tasks that need a tick every frame...
+            ticked = list(self._ticked)
+            # ... and to those sleeping sub-tasks that are due to resume now (sub-tasks that go back to sleep while
+            # being ticked are not resumed again before the next frame, even if they are due right away)
+            due = []
+            while self._timers and now > self._timers[0][0] - self._frametime / 2:
+                resumeat, seq, t = heapq.heappop(self._timers)
+                if t._timer_seq != seq:
+                    # superseded entry
+                    self._stale_timers -= 1
+                    continue
+                t._timer_seq = None
+                due.append(t)
+            for t in due:
+                # the sub-task has not been ticked while sleeping, so give it the current frame timing
+                t._lasttick = now - delta
+                self._tick_subtask(t, now)
+            for t in ticked:
+                self._tick_subtask(t, now)
 
         except Exception as inst:
             print("Exception during tick():")
@@ -437,7 +517,7 @@ class LatentModule(TickModule, BasicStimuli):
 
     def is_alive(self):
         """ Check whether the current module is (still) running."""
-        return self._thread is not None
+        return self._thread is not None or self._coroutine is not None
 
     class ModuleCancelled(Exception):
         """
@@ -446,6 +526,143 @@ class LatentModule(TickModule, BasicStimuli):
         """
         pass
 
+    class Awaitable:
+        """
+        The return value of a time-consumption function in coroutine mode; can be awaited (in an async def run())
+        or delegated to with "yield from" (in a generator run()), which evaluates to the function's result.
+        """
+
+        def __init__(self, gen):
+            self._gen = gen
+
+        def __await__(self):
+            return (yield from self._gen)
+
+        __iter__ = __await__
+
+    def _clear_subtasks(self):
+        """Internal helper that forgets all sub-tasks (and their scheduling state)."""
+        self._subtasks = {}
+        self._timers = []
+        self._ticked = {}
+        self._stale_timers = 0
+
+    def _schedule(self):
+        """
+        Internal helper that (re-)registers this task with the parent's scheduler (if it is a sub-task);
+        called whenever its resume time or its need for per-frame ticks may have changed.
+        """
+        if self._parent is not None:
+            self._parent._schedule_subtask(self)
+
+    def _schedule_subtask(self, task):
+        """
+        Internal helper that registers a sleeping sub-task either in the timer heap (keyed by its resume time)
+        or, if it needs to be ticked every frame, in the per-frame set.
+        """
+        if task._timer_seq is not None:
+            # the task's previous heap entry is superseded
+            self._stale_timers += 1
+            task._timer_seq = None
+        if task._needs_ticks():
+            if task not in self._ticked:
+                task._lasttick = self._lasttick
+                self._ticked[task] = None
+        else:
+            self._ticked.pop(task, None)
+            task._timer_seq = next(self._timer_count)
+            heapq.heappush(self._timers, (task._resumeat, task._timer_seq, task))
+            if self._stale_timers > 64 and self._stale_timers > len(self._timers) / 2:
+                # compact the heap
+                self._timers = [e for e in self._timers if e[2]._timer_seq == e[1]]
+                heapq.heapify(self._timers)
+                self._stale_timers = 0
+
+    def _release_subtask(self, task):
+        """Internal helper that forgets a sub-task that has finished."""
+        self._subtasks.pop(task, None)
+        self._ticked.pop(task, None)
+        if task._timer_seq is not None:
+            self._stale_timers += 1
+            task._timer_seq = None
+
+    def _tick_subtask(self, task, now):
+        """Internal helper that ticks a sub-task and re-schedules it if it is still sleeping."""
+        if not task.is_alive():
+            self._release_subtask(task)
+            return
+        task.tick()
+        if task.is_alive() and not task._is_due(now):
+            if (task._timer_seq is None and task not in self._ticked) or \
+                    (task in self._ticked and not task._needs_ticks()):
+                self._schedule_subtask(task)
+
+    def _needs_ticks(self):
+        """Check whether this task needs to be ticked every frame (rather than only when it is due to resume)."""
+        return self._cur_tick is not None or self._default_tick is not None or \
+            len(self._subtasks) > 0 or len(self._messages) > 0 or self._resumeframe is not None
+
+    def _is_due(self, now):
+        """Check whether the current time-consumption function should end in the current frame."""
+        if self._resumeframe is not None:
+            return self._frameclock.frame >= self._resumeframe
+        return now > self._resumeat - self._frametime / 2
+
+    def _latent(self, gen):
+        """
+        Internal helper that executes the generator implementation of a time-consumption function.
+        In threaded mode, the generator is run to completion (blocking the runner thread whenever it yields a wait
+        time) and its result is returned; in coroutine mode, an Awaitable for it is returned instead.
+        """
+        if self._coroutine is not None:
+            return self.Awaitable(gen)
+        try:
+            timeout = next(gen)
+            while True:
+                if self._handoff:
+                    self._handoff = False
+                    self._idlecond.notify()
+                self._resumecond.wait(timeout)
+                timeout = next(gen)
+        except StopIteration as e:
+            return e.value
+
+    def _wait_idle(self):
+        """
+        Internal helper that waits until the runner thread is waiting in a time-consumption function again
+        (or has finished); used to execute the thread in lockstep with the main loop when on a virtual clock.
+        """
+        self._handoff = True
+        while self._handoff and self._thread is not None:
+            self._idlecond.wait()
+        self._handoff = False
+
+    def _is_coroutine_run(self):
+        """Check whether run() is written as a generator or coroutine (and thus executes in coroutine mode)."""
+        return inspect.isgeneratorfunction(self.run) or inspect.iscoroutinefunction(self.run)
+
+    def _step_coroutine(self):
+        """
+        Internal helper that advances the run() coroutine up to its next time-consumption function;
+        executed in the main thread.
+        """
+        try:
+            waiting = self._coroutine.send(None)
+            if isinstance(waiting, self.Awaitable):
+                # a time-consumption function was yielded rather than delegated to
+                self._coroutine.throw(TypeError("In a generator run(), time-consumption functions must be invoked "
+                                                "with 'yield from' (e.g., yield from self.sleep(1))."))
+        except (StopIteration, self.ModuleCancelled):
+            # the coroutine has finished or was cancelled
+            self._coroutine = None
+        except Exception as e:
+            print("Exception during run():")
+            print(e)
+            traceback.print_exc()
+            self._coroutine = None
+        if self._coroutine is None and self._parent is not None:
+            self._parent._release_subtask(self)
+
     def _run_wrap(self):
         """
         Internal wrapper around the run function; executed in a separate thread.
@@ -465,14 +682,157 @@ class LatentModule(TickModule, BasicStimuli):
         finally:
             # make sure that we release the lock and reset the state
             self._thread = None
+            self._idlecond.notify()
+            if self._parent is not None:
+                self._parent._release_subtask(self)
             # engine_lock.release()
             shared_lock.release()
 
+    def _sleep(self, duration=100000, cur_tick=None):
+        """Generator implementation of sleep(); yields the remaining wait time."""
+        self._exectime = self._clock.time()
+        self._resumeframe = None
+        if self._make_up_for_lost_time and abs(self._resumeat - self._exectime) < self._max_compensated_time:
+            self._resumeat = self._resumeat + duration
+        else:
+            self._resumeat = self._exectime + duration
+
+        self._cur_tick = cur_tick
+        self._schedule()
+        if self._cancelled:
+            # make sure that run() terminates
+            raise self.ModuleCancelled
+        yield self._resumeat - self._exectime
+        if self._cancelled:
+            # make sure that run() terminates
+            raise self.ModuleCancelled
+
+    def _present_at_frame(self, frame, cur_tick=None):
+        """Generator implementation of present_at_frame()."""
+        self._exectime = self._clock.time()
+        self._resumeframe = frame
+        predicted = self._frameclock.predict_time(frame)
+        self._resumeat = predicted if predicted is not None else self._exectime
+        self._cur_tick = cur_tick
+        self._schedule()
+        if self._cancelled:
+            # make sure that run() terminates
+            raise self.ModuleCancelled
+        # (the wait is ended by tick() in the given frame; the timeout is only a safeguard)
+        yield max(self._resumeat - self._exectime, 0) + self._max_inter_frame_interval
+        self._resumeframe = None
+        if self._cancelled:
+            # make sure that run() terminates
+            raise self.ModuleCancelled
+        return self._frameclock.frame
+
+    def _schedule_at(self, t, cur_tick=None):
+        """Generator implementation of schedule_at()."""
+        predicted = self._frameclock.predict_frame(t)
+        actual = yield from self._present_at_frame(predicted, cur_tick)
+        return predicted, actual
+
+    def _waitfor(self, eventid, duration=100000, cur_tick=None):
+        """Generator implementation of waitfor()."""
+        # register the event handler(s)
+        self._events_received = []
+        self._times_received = []
+
+        try:
+            self.accept(eventid, self._on_wait_event, [eventid])
+
+            # call sleep
+            if self.implicit_markers:
+                self.marker(228)
+            yield from self._sleep(duration, cur_tick)
+
+        finally:
+            self.ignore(eventid)
+
+        # wrap up results
+        if len(self._times_received) > 0:
+            return self._times_received[0]
+        else:
+            return None
+
+    def _waitfor_multiple(self, eventids, duration=100000, cur_tick=None):
+        """Generator implementation of waitfor_multiple()."""
+        # register the event handler(s)
+        self._events_received = []
+        self._times_received = []
+        if eventids.__class__ is str:
+            eventids = [eventids]
+
+        try:
+            for eventid in eventids:
+                self.accept(eventid, self._on_wait_event, [eventid])
+
+            # call sleep
+            if self.implicit_markers:
+                self.marker(228)
+            yield from self._sleep(duration, cur_tick)
+
+        finally:
+            for eventid in eventids:
+                self.ignore(eventid)
+
+        # wrap up results
+        if len(self._times_received) > 0:
+            return self._events_received[0], self._times_received[0]
+        else:
+            return None
+
+    def _watchfor(self, eventid, duration=100000, cur_tick=None):
+        """Generator implementation of watchfor()."""
+        try:
+            self._measuretime = self._clock.time()
+            # register an event handler
+            self._received_dict = {eventid: []}
+            self._events_received = []
+            self.accept(eventid, self._on_record_event, [eventid])
+
+            # call sleep
+            if self.implicit_markers:
+                self.marker(228)
+            yield from self._sleep(duration, cur_tick)
+
+        finally:
+            # unregister the handler
+            self.ignore(eventid)
+
+        return self._received_dict[eventid]
+
+    def _watchfor_multiple(self, eventids, duration=100000, cur_tick=None, list_only=False):
+        """Generator implementation of watchfor_multiple()."""
+        try:
+            self._measuretime = self._clock.time()
+            # register event handlers and reset the dict
+            self._received_dict = {}
+            self._events_received = []
+            for eventid in eventids:
+                self._received_dict[eventid] = []
+                self.accept(eventid, self._on_record_event, [eventid])
+
+            # call sleep
+            if self.implicit_markers:
+                self.marker(228)
+            yield from self._sleep(duration, cur_tick)
+
+        finally:
+            # unregister the handlers
+            for eventid in eventids:
+                self.ignore(eventid)
+
+        if list_only:
+            return self._events_received
+        else:
+            return self._received_dict
+
     def _on_wait_event(self, eventid):
         """
         Internal event handler for waitfor (triggers resume).
         """
-        self._times_received.append(time.time() - self._exectime)
+        self._times_received.append(self._clock.time() - self._exectime)
         # self.marker(229)
         self._events_received.append(eventid)
         self.resume()
@@ -481,7 +841,7 @@ class LatentModule(TickModule, BasicStimuli):
         """
         Internal event handler for watchfor(_multiple).
         """
-        self._received_dict[eventid].append(time.time() - self._measuretime)
+        self._received_dict[eventid].append(self._clock.time() - self._measuretime)
         idx = [i for i, x in enumerate(self._received_dict.keys()) if x == eventid]
         self.marker(230 + idx[0])
         self._events_received.append(eventid)
@@ -0,0 +1,153 @@
+"""
+Memory-budgeted cache of media files (textures and sounds).
+"""
+
+import collections
+
+# the estimated memory per second of decoded audio, in bytes (16-bit stereo at 44.1 kHz)
+SOUND_BYTES_PER_SECOND = 44100 * 2 * 2
+
+
+def resolve_media(filename):
+    """
+    Resolve a media file name through the engine's model path (i.e., the way the engine's loader finds it); returns
+    the OS-specific path of the file, or the given name if it is not found there (or the engine is not available).
+    """
+    try:
+        from pandac.PandaModules import Filename, VirtualFileSystem, getModelPath
+    except ImportError:
+        return filename
+    path = Filename.fromOsSpecific(filename)
+    if VirtualFileSystem.getGlobalPtr().resolveFilename(path, getModelPath().getValue()):
+        return path.toOsSpecific()
+    return filename
+
+
+class MediaCache:
+    """
+    Keeps track of the textures and sounds that have been loaded through it (by kind and file name), along with
+    their estimated memory footprint, and unloads the least recently used ones from the engine's caches whenever
+    the total exceeds the memory budget.
+
+    Unloading only removes an asset from the engine's caches (so that the memory is freed once no stimulus uses it
+    anymore); assets that are still on screen or playing are unaffected. Since the cache keeps the handle of each
+    asset, unloading does not need to load the asset again.
+    """
+
+    def __init__(self,
+                 engine,  # the engine (see BasicStimuli.set_engine)
+                 budget=512 * 1024 * 1024  # the memory budget in bytes (None for no limit)
+                 ):
+        """Construct a new, empty MediaCache."""
+        self._engine = engine
+        self.budget = budget
+        # mapping from (kind, filename) to (handle, size in bytes), least recently used first
+        self._entries = collections.OrderedDict()
+        self.size = 0  # the total size of the cached assets, in bytes
+        self.hits = 0  # number of lookups of cached assets
+        self.misses = 0  # number of lookups that had to load the asset
+        self.evictions = 0  # number of assets that were evicted to stay within the budget
+
+    def texture(self, filename):
+        """Get the texture for the given file (loading it if necessary)."""
+        entry = self._lookup('texture', filename)
+        if entry is not None:
+            return entry[0]
+        texture = self._engine.base.loader.loadTexture(filename)
+        self.add('texture', filename, texture)
+        return texture
+
+    def sound(self, filename):
+        """
+        Get a new sound object for the given file; sound objects for the same file share the decoded data, which
+        the engine keeps cached. Since each call creates a new sound object, sound lookups do not count towards the
+        hit and miss statistics.
+        """
+        key = ('sound', filename)
+        sound = self._engine.base.loader.loadSfx(filename)
+        if key in self._entries:
+            self._entries.move_to_end(key)
+        else:
+            self.add('sound', filename, sound)
+        return sound
+
+    def add(self, kind, filename, handle):
+        """Enter an asset ('texture' or 'sound') that has been loaded elsewhere (e.g., by the MediaPreloader)."""
+        key = (kind, filename)
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            return
+        size = self._estimate_size(kind, handle)
+        self._entries[key] = (handle, size)
+        self.size += size
+        if self.budget is not None and self.size > self.budget:
+            self.prune()
+
+    def remove(self, kind, filename):
+        """Unload an asset from the engine's caches; returns whether it was cached."""
+        entry = self._entries.pop((kind, filename), None)
+        if entry is None:
+            return False
+        self._unload(kind, entry[0])
+        self.size -= entry[1]
+        return True
+
+    def prune(self, budget=None):
+        """
+        Evict the least recently used assets until the total size is within the given budget (by default, the
+        cache's budget); returns the cache statistics.
+        """
+        if budget is None:
+            budget = self.budget
+        if budget is not None:
+            while self.size > budget and self._entries:
+                (kind, filename), (handle, size) = self._entries.popitem(last=False)
+                self._unload(kind, handle)
+                self.size -= size
+                self.evictions += 1
+        return self.statistics()
+
+    def clear(self):
+        """Unload all cached assets."""
+        self.prune(0)
+
+    def statistics(self):
+        """Get a dictionary of cache statistics."""
+        return {'entries': len(self._entries),
+                'bytes': self.size,
+                'budget': self.budget,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions}
+
+    def _lookup(self, kind, filename):
+        """Internal helper that looks up a cache entry and updates the statistics."""
+        key = (kind, filename)
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+        else:
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return entry
+
+    def _unload(self, kind, handle):
+        """Internal helper that removes an asset from the engine's caches."""
+        try:
+            if kind == 'texture':
+                self._engine.base.loader.unloadTexture(handle)
+            else:
+                self._engine.base.loader.unloadSfx(handle)
+        except:
+            pass
+
+    @staticmethod
+    def _estimate_size(kind, handle):
+        """Internal helper that estimates the memory footprint of an asset, in bytes."""
+        try:
+            if kind == 'texture':
+                return handle.estimateTextureMemory()
+            else:
+                return int(handle.length() * SOUND_BYTES_PER_SECOND)
+        except:
+            return 0
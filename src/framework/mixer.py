@@ -0,0 +1,450 @@
+"""
+Software audio mixer with sample-accurate scheduling of sound onsets.
+
+Sounds are preloaded as PCM clips (NumPy arrays) and played as voices that can be scheduled at an absolute time of
+the framework's clock (e.g., a fixed number of milliseconds after a visual onset). A dedicated mixing thread renders
+the active voices block by block into a ring buffer, from which the output sink consumes the audio; each voice
+records the sample index (and the corresponding time) at which it actually started.
+
+The output sink is pluggable: DeviceSink plays through the sound card (requires the sounddevice package), while
+NullSink and FileSink discard the audio or write it to a WAV file, e.g., for offline tests. Sinks that are not
+real-time are driven by AudioMixer.render(); their sample clock is then exactly locked to the framework clock at the
+time the mixer was started, so that scheduled onsets can be checked sample by sample in the written file.
+"""
+
+import threading
+import time
+import wave
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    import sounddevice
+except ImportError:
+    sounddevice = None
+
+from .clock import get_clock
+from .mediacache import resolve_media
+
+
+class AudioClip:
+    """A sound held in memory as PCM samples (a frames x channels float32 array in the range -1 to 1)."""
+
+    def __init__(self,
+                 samples,  # the samples, as a frames x channels (or 1-d, for mono) array
+                 rate=44100,  # the sampling rate of the samples
+                 name=None  # optionally the name of the clip (e.g., its file name)
+                 ):
+        """Construct a new AudioClip."""
+        samples = numpy.asarray(samples, dtype=numpy.float32)
+        self.samples = samples.reshape(len(samples), -1)
+        self.rate = rate
+        self.name = name
+
+    def length(self):
+        """Get the duration of the clip in seconds."""
+        return len(self.samples) / float(self.rate)
+
+    def resampled(self, rate, playrate=1.0):
+        """Get a copy of the clip at the given sampling rate, optionally sped up by the given play rate."""
+        ratio = self.rate * playrate / float(rate)
+        if ratio == 1.0:
+            return self
+        frames = int(len(self.samples) / ratio)
+        positions = numpy.arange(frames) * ratio
+        source = numpy.arange(len(self.samples))
+        samples = numpy.stack([numpy.interp(positions, source, self.samples[:, c])
+                               for c in range(self.samples.shape[1])], axis=1)
+        return AudioClip(samples, rate, self.name)
+
+
+def load_clip(filename):
+    """
+    Load a PCM WAV file (8, 16, 24 or 32 bits per sample) into an AudioClip; the file name is resolved through the
+    engine's model path (as by the engine's loader).
+    """
+    with wave.open(resolve_media(filename), 'rb') as f:
+        width = f.getsampwidth()
+        channels = f.getnchannels()
+        rate = f.getframerate()
+        data = f.readframes(f.getnframes())
+    if width == 1:
+        samples = (numpy.frombuffer(data, numpy.uint8).astype(numpy.float32) - 128) / 128.0
+    elif width == 2:
+        samples = numpy.frombuffer(data, '<i2').astype(numpy.float32) / 32768.0
+    elif width == 3:
+        raw = numpy.frombuffer(data, numpy.uint8).reshape(-1, 3).astype(numpy.int32)
+        samples = ((raw[:, 0] | (raw[:, 1] << 8) | (raw[:, 2] << 16)) << 8 >> 8).astype(numpy.float32) / 8388608.0
+    elif width == 4:
+        samples = numpy.frombuffer(data, '<i4').astype(numpy.float32) / 2147483648.0
+    else:
+        raise ValueError("Unsupported sample width in " + filename)
+    return AudioClip(samples.reshape(-1, channels), rate, filename)
+
+
+class Voice:
+    """
+    A clip that is playing (or scheduled to play) on the mixer. Once the voice has started, start_sample holds the
+    index of the output sample at which it started and onset the corresponding clock time; late is the number of
+    samples by which it started after its scheduled time (0 if it started on time).
+    """
+
+    def __init__(self, mixer, clip, at, volume, balance, offset, loops):
+        self._mixer = mixer
+        self.clip = clip
+        self.at = at  # the scheduled clock time (None for as soon as possible)
+        self.volume = volume
+        self.balance = balance
+        self.offset = offset  # the first sample of the clip to play
+        self.loops = loops  # the number of times to play the clip (0 for endless)
+        self.start_sample = None
+        self.onset = None
+        self.late = 0
+        self.started = threading.Event()  # set once the voice has started
+        self.finished = False
+        self.stopped = False
+
+    def stop(self):
+        """Stop the voice (or cancel it, if it has not started yet)."""
+        self.stopped = True
+
+    def length(self):
+        """Get the duration of the voice in seconds (for compatibility with the engine's sound objects)."""
+        return self.clip.length() * (self.loops or 1) - self.offset / float(self.clip.rate)
+
+    def status(self):
+        """Get whether the voice is 'scheduled', 'playing' or 'finished'."""
+        if self.finished or self.stopped:
+            return 'finished'
+        return 'scheduled' if self.start_sample is None else 'playing'
+
+
+class AudioMixer:
+    """
+    Mixes any number of voices into one output stream on a dedicated thread (see module documentation).
+
+    The mixer renders ahead of the output by at most the size of its ring buffer (buffer_blocks * blocksize
+    samples); voices that are scheduled at least that far ahead start exactly at their scheduled sample, later
+    ones start at the next sample that has not been rendered yet (and report how late they were).
+    """
+
+    def __init__(self,
+                 sink=None,  # the output sink (by default, a DeviceSink if sounddevice is installed, else a NullSink)
+                 rate=44100,  # the output sampling rate
+                 channels=2,  # the number of output channels (1 or 2)
+                 blocksize=256,  # the number of samples that are mixed at a time
+                 buffer_blocks=4,  # the number of blocks in the ring buffer
+                 clock=None  # the clock that onsets refer to (by default, the framework's clock)
+                 ):
+        """Construct a new AudioMixer; call start() to begin the output."""
+        if numpy is None:
+            raise ImportError("The audio mixer requires NumPy.")
+        if sink is None:
+            sink = DeviceSink() if sounddevice is not None else NullSink(realtime=True)
+        self.sink = sink
+        self.rate = rate
+        self.channels = channels
+        self.blocksize = blocksize
+        self.clock = clock if clock is not None else get_clock()
+        self._clips = {}  # the loaded clips, by file name and play rate
+        self._unsupported = set()  # the files (and play rates) that cannot be loaded as clips
+        self._voices = []  # the voices that have not finished yet
+        self._lock = threading.Condition()
+        self._ring = numpy.zeros((buffer_blocks, blocksize, channels), dtype=numpy.float32)
+        self._written = 0  # the number of blocks rendered into the ring buffer
+        self._read = 0  # the number of samples consumed by the sink
+        self._offset = None  # the clock time of output sample 0
+        self._thread = None
+        self._running = False
+        self.underruns = 0  # the number of blocks that were not rendered in time
+        self.late_voices = 0  # the number of voices that started after their scheduled time
+
+    def start(self):
+        """Start the mixing thread and the output."""
+        if self._thread is not None:
+            return
+        self._running = True
+        self._offset = self.clock.time() + self.sink.latency
+        self._thread = threading.Thread(target=self._run, name='AudioMixer', daemon=True)
+        self._thread.start()
+        self.sink.open(self)
+
+    def shutdown(self):
+        """Stop the output and the mixing thread."""
+        if self._thread is None:
+            return
+        self.sink.close()
+        with self._lock:
+            self._running = False
+            self._lock.notify_all()
+        self._thread.join()
+        self._thread = None
+
+    def load(self, filename, playrate=1.0):
+        """Get the clip for a WAV file at the output rate (loading and resampling it if necessary)."""
+        key = (filename, playrate)
+        clip = self._clips.get(key)
+        if clip is None:
+            clip = self._clips[key] = load_clip(filename).resampled(self.rate, playrate)
+        return clip
+
+    def can_load(self, filename, playrate=1.0):
+        """
+        Get whether a file can be played by the mixer at the given play rate (i.e., whether it is a PCM WAV file that
+        can be found), loading its clip if necessary; other files can be played through the engine instead.
+        """
+        if (filename, playrate) in self._clips:
+            return True
+        if (filename, playrate) in self._unsupported:
+            return False
+        try:
+            self.load(filename, playrate)
+            return True
+        except (wave.Error, EOFError, ValueError, ZeroDivisionError, IOError, OSError):
+            self._unsupported.add((filename, playrate))
+            return False
+
+    def unload(self, filename=None):
+        """Drop a loaded clip (or all clips)."""
+        if filename is None:
+            self._clips = {}
+            self._unsupported = set()
+        else:
+            self._clips = {k: c for k, c in self._clips.items() if k[0] != filename}
+            self._unsupported = {k for k in self._unsupported if k[0] != filename}
+
+    def play(self,
+             clip,  # the clip to play (an AudioClip, or the file name of a WAV file)
+             at=None,  # the clock time at which the clip shall start (None for as soon as possible)
+             volume=1.0,  # the volume of the clip
+             balance=0.0,  # the balance between -1 (left) and 1 (right)
+             timeoffset=0.0,  # the time offset into the clip, in seconds
+             loops=1  # the number of times to play the clip (0 for endless)
+             ):
+        """Play a clip, optionally at a given time; returns the Voice."""
+        if type(clip) == str:
+            clip = self.load(clip)
+        elif clip.rate != self.rate:
+            clip = clip.resampled(self.rate)
+        voice = Voice(self, clip, at, volume, balance, int(timeoffset * self.rate), loops)
+        with self._lock:
+            self._voices.append(voice)
+        return voice
+
+    def stop_all(self):
+        """Stop all voices."""
+        with self._lock:
+            for v in self._voices:
+                v.stop()
+
+    def sample_to_time(self, sample):
+        """Get the clock time at which the given output sample is played."""
+        return self._offset + sample / float(self.rate)
+
+    def time_to_sample(self, t):
+        """Get the index of the output sample that is played at the given clock time."""
+        return int(round((t - self._offset) * self.rate))
+
+    def read(self, frames):
+        """
+        Get the next frames x channels samples of the output; called by the sink. Missing blocks (if the mixing
+        thread falls behind) are filled with silence.
+        """
+        if self.sink.realtime:
+            # track the mapping between output samples and clock time (smoothed against scheduling jitter)
+            offset = self.clock.time() + self.sink.latency - self._read / float(self.rate)
+            self._offset = offset if self._read == 0 else self._offset + 0.01 * (offset - self._offset)
+        out = numpy.zeros((frames, self.channels), dtype=numpy.float32)
+        done = 0
+        with self._lock:
+            while done < frames:
+                block, pos = divmod(self._read, self.blocksize)
+                n = min(frames - done, self.blocksize - pos)
+                if block < self._written:
+                    out[done:done + n] = self._ring[block % len(self._ring), pos:pos + n]
+                elif pos == 0:
+                    # the block has not been rendered in time: skip it
+                    self._written = block + 1
+                    self.underruns += 1
+                self._read += n
+                done += n
+            self._lock.notify_all()
+        return out
+
+    def render(self, duration):
+        """Consume the given number of seconds of output and pass it to the sink (for sinks that are not real-time)."""
+        frames = int(round(duration * self.rate))
+        while frames > 0:
+            # wait until the mixing thread has rendered the next block
+            with self._lock:
+                while self._written * self.blocksize <= self._read and self._running:
+                    self._lock.wait(0.1)
+            n = min(frames, self.blocksize - self._read % self.blocksize)
+            self.sink.write(self.read(n))
+            frames -= n
+
+    def statistics(self):
+        """Get a dictionary of mixer statistics."""
+        return {'samples': self._read, 'voices': len(self._voices), 'underruns': self.underruns,
+                'late_voices': self.late_voices, 'clips': len(self._clips)}
+
+    def _run(self):
+        """Internal loop of the mixing thread."""
+        while True:
+            with self._lock:
+                # wait until there is room in the ring buffer
+                while self._running and (self._written + 1) * self.blocksize - self._read > self._ring.size // self.channels:
+                    self._lock.wait()
+                if not self._running:
+                    return
+                block = self._written
+                voices = list(self._voices)
+            out = self._ring[block % len(self._ring)]
+            out[:] = 0
+            begin = block * self.blocksize
+            for v in voices:
+                self._mix(v, out, begin)
+            with self._lock:
+                if block == self._written:
+                    self._written = block + 1
+                self._voices = [v for v in self._voices if not (v.finished or v.stopped)]
+
+    def _mix(self, voice, out, begin):
+        """Internal helper that mixes the part of a voice that falls into the output block starting at begin."""
+        if voice.stopped:
+            return
+        if voice.start_sample is None:
+            start = begin if voice.at is None else self.time_to_sample(voice.at)
+            if start >= begin + len(out):
+                return
+            if start < begin:
+                # the scheduled sample has already been rendered
+                voice.late = begin - start
+                self.late_voices += 1
+                start = begin
+            voice.start_sample = start
+            voice.onset = self.sample_to_time(start)
+            voice.started.set()
+        samples = voice.clip.samples
+        total = len(samples) * voice.loops - voice.offset if voice.loops else None
+        first = max(0, voice.start_sample - begin)
+        played = begin + first - voice.start_sample
+        n = len(out) - first if total is None else min(len(out) - first, total - played)
+        if n <= 0:
+            voice.finished = True
+            return
+        indices = (voice.offset + played + numpy.arange(n)) % len(samples)
+        chunk = samples[indices]
+        if chunk.shape[1] != self.channels:
+            chunk = chunk.mean(axis=1, keepdims=True) if self.channels == 1 else numpy.repeat(chunk[:, :1], 2, axis=1)
+        gains = numpy.full(self.channels, voice.volume, dtype=numpy.float32)
+        if self.channels == 2:
+            gains *= (min(1.0, 1.0 - voice.balance), min(1.0, 1.0 + voice.balance))
+        out[first:first + n] += chunk * gains
+        if total is not None and played + n >= total:
+            voice.finished = True
+
+
+class NullSink:
+    """An output sink that discards the audio (e.g., for tests)."""
+
+    latency = 0.0  # the delay from handing a sample to the sink until it is played, in seconds
+
+    def __init__(self,
+                 realtime=False  # whether to consume the audio at the sampling rate (else it is driven by render())
+                 ):
+        self.realtime = realtime
+        self._thread = None
+        self._running = False
+
+    def open(self, mixer):
+        """Begin consuming the mixer's output."""
+        if self.realtime:
+            self._running = True
+            self._thread = threading.Thread(target=self._pace, args=(mixer,), name='AudioSink', daemon=True)
+            self._thread.start()
+
+    def write(self, block):
+        """Consume a block of samples."""
+        pass
+
+    def close(self):
+        """Stop consuming the mixer's output."""
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _pace(self, mixer):
+        """Internal loop that consumes one block per block period of wall-clock time."""
+        period = mixer.blocksize / float(mixer.rate)
+        deadline = time.time()
+        while self._running:
+            self.write(mixer.read(mixer.blocksize))
+            deadline += period
+            delay = deadline - time.time()
+            if delay > 0:
+                time.sleep(delay)
+
+
+class FileSink(NullSink):
+    """An output sink that writes the audio to a 16-bit WAV file."""
+
+    def __init__(self,
+                 filename,  # the file to write
+                 realtime=False  # whether to consume the audio at the sampling rate (else it is driven by render())
+                 ):
+        NullSink.__init__(self, realtime)
+        self.filename = filename
+        self._file = None
+
+    def open(self, mixer):
+        self._file = wave.open(self.filename, 'wb')
+        self._file.setnchannels(mixer.channels)
+        self._file.setsampwidth(2)
+        self._file.setframerate(mixer.rate)
+        NullSink.open(self, mixer)
+
+    def write(self, block):
+        self._file.writeframes((numpy.clip(block, -1.0, 1.0) * 32767).astype('<i2').tobytes())
+
+    def close(self):
+        NullSink.close(self)
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class DeviceSink:
+    """An output sink that plays the audio through a sound card (requires the sounddevice package)."""
+
+    realtime = True
+
+    def __init__(self,
+                 device=None,  # the output device (as in sounddevice; None for the default device)
+                 latency='low'  # the requested output latency (as in sounddevice)
+                 ):
+        if sounddevice is None:
+            raise ImportError("Audio output to a sound card requires the sounddevice package.")
+        self.device = device
+        self.requested_latency = latency
+        self.latency = 0.0
+        self._stream = None
+
+    def open(self, mixer):
+        def callback(outdata, frames, timeinfo, status):
+            outdata[:] = mixer.read(frames)
+        self._stream = sounddevice.OutputStream(samplerate=mixer.rate, blocksize=mixer.blocksize,
+                                                channels=mixer.channels, dtype='float32', device=self.device,
+                                                latency=self.requested_latency, callback=callback)
+        self.latency = self._stream.latency
+        self._stream.start()
+
+    def close(self):
+        if self._stream is not None:
+            self._stream.stop()
+            self._stream.close()
+            self._stream = None
@@ -0,0 +1,226 @@
+"""
+Movie playback with a background decode-ahead buffer.
+"""
+
+import queue
+import threading
+
+from .clock import get_clock
+
+
+class MovieStream:
+    """
+    Decodes the frames of a movie on a worker thread into a queue of up to buffer_frames frames, and shows them on a
+    texture from a task that runs every frame right before the frame is rendered (as in RSVPStream).
+
+    Decoding starts (at the given time offset) as soon as the stream is constructed, so a stream that is created
+    ahead of time (e.g., via BasicStimuli.precache_movie()) is already prerolled when play() is called; if play() is
+    called with a different time offset, the decoder is restarted there. Frames before the time offset are never
+    shown. Once play() has been called, playback starts as soon as the buffer is full, but no later than the start
+    latency target (if the buffer has not filled up by then, playback starts with the frames that have been decoded
+    so far).
+
+    The stream keeps a log of its playback: the number of decoded frames, of presented frames, of frames that were
+    decoded but dropped because a later frame was already due, and of stalls (frames in which the due frame had not
+    been decoded yet), as well as the actual start latency; see statistics().
+    """
+
+    def __init__(self,
+                 engine,  # the engine (see BasicStimuli.set_engine)
+                 filename,  # the movie file to play
+                 buffer_frames=8,  # the number of frames that are decoded ahead of the presentation
+                 start_latency=0.1,  # the maximum time in seconds from play() until the first frame is shown
+                 clock=None,  # the clock that paces the playback (by default, the framework's clock)
+                 timeoffset=0.0  # the time offset into the movie at which to start decoding
+                 ):
+        """Construct a new MovieStream and start decoding the movie."""
+        pandac = engine.pandac
+        self._engine = engine
+        self.filename = filename
+        self.start_latency = start_latency
+        self.clock = clock if clock is not None else get_clock()
+        self._video = pandac.MovieVideo.get(pandac.Filename.fromOsSpecific(filename))
+        self._cursor = self._video.open() if self._video is not None else None
+        if self._cursor is None:
+            raise IOError("Could not open the movie " + filename)
+        self.width = self._cursor.sizeX()  # the size of the video in pixels
+        self.height = self._cursor.sizeY()
+        self.texture = pandac.Texture(filename)
+        self._cursor.setupTexture(self.texture)
+        self.timeoffset = timeoffset  # the time offset into the movie
+        self.loops = 1  # the number of times to play the movie (0 for endless)
+        self.finished = False
+        # playback log
+        self.decoded = 0
+        self.presented = 0
+        self.dropped = 0
+        self.stalls = 0
+        self.latency = None  # the time from play() until the first frame was shown
+        self._frames = queue.Queue(buffer_frames)  # queue of (presentation time, buffer); None at the end
+        self._playing = threading.Event()  # set once play() has been called (the number of loops is known then)
+        self._running = False
+        self._thread = None
+        self._start_decoder()
+        self._task = None
+        self._requested = None  # the clock time at which play() was called
+        self._start = None  # the clock time at which the first frame was shown
+        self._pending = None  # the next decoded frame that is not due yet
+        self._ended = False  # whether the decoder has reached the end of the movie
+        self._shown = None  # the presentation time of the frame that is currently shown
+        self._period = 1.0 / 30  # the estimated frame period of the movie
+
+    def play(self,
+             playrate=1.0,  # the playback rate of the movie
+             timeoffset=0.0,  # time offset into the movie
+             loops=1,  # the number of times to play the movie (0 for endless)
+             sound=None,  # optionally the movie's soundtrack, which is started along with the first frame
+             on_start=None,  # optional function that is called when the first frame is shown
+             on_finish=None  # optional function that is called when the movie has ended (or was stopped)
+             ):
+        """Start the playback."""
+        if timeoffset != self.timeoffset:
+            # the movie was prerolled at a different position
+            self._stop_decoder()
+            self._cursor = self._video.open()
+            self._frames = queue.Queue(self._frames.maxsize)
+            self.decoded = 0
+            self.timeoffset = timeoffset
+            self._start_decoder()
+        self.playrate = playrate
+        self.loops = loops
+        self._playing.set()
+        self._sound = sound
+        self._on_start = on_start
+        self._on_finish = on_finish
+        self._requested = self.clock.time()
+        self._task = self._engine.base.taskMgr.add(self._present_task, "MovieStream.present", sort=40)
+
+    def stop(self):
+        """Stop the playback."""
+        self.destroy()
+
+    def destroy(self):
+        """Stop the playback and the decoder."""
+        self._stop_decoder()
+        if self._task is not None:
+            self._engine.base.taskMgr.remove(self._task)
+            self._task = None
+        if not self.finished:
+            self.finished = True
+            if self._requested is not None and self._on_finish is not None:
+                self._on_finish()
+
+    def statistics(self):
+        """Get a dictionary of playback statistics (see class documentation)."""
+        return {'decoded': self.decoded,
+                'presented': self.presented,
+                'dropped': self.dropped,
+                'stalls': self.stalls,
+                'start_latency': self.latency}
+
+    def _start_decoder(self):
+        """Internal helper that starts the decoder thread at the current time offset."""
+        if self.timeoffset > 0 and self._cursor.canSeek():
+            self._cursor.seek(self.timeoffset)
+        self._running = True
+        self._thread = threading.Thread(target=self._decode, name='MovieStream', daemon=True)
+        self._thread.start()
+
+    def _stop_decoder(self):
+        """Internal helper that stops the decoder thread."""
+        self._running = False
+        try:
+            # unblock the decoder
+            while True:
+                self._frames.get_nowait()
+        except queue.Empty:
+            pass
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        self._thread = None
+
+    def _decode(self):
+        """Internal loop of the decoder thread."""
+        cursor = self._cursor
+        offset = 0.0  # the presentation time of the beginning of the current loop
+        loop = 1
+        while self._running:
+            buf = cursor.fetchBuffer()
+            if buf is None:
+                # (whether the movie loops is only known once play() has been called)
+                while self._running and not self._playing.wait(0.1):
+                    pass
+                if self.loops == 0 or loop < self.loops:
+                    # start the next loop
+                    offset += cursor.length()
+                    loop += 1
+                    cursor = self._video.open()
+                    continue
+                item = None
+            elif offset + buf.getBeginTime() < self.timeoffset:
+                # (frames before the time offset are skipped, e.g., if the cursor could not seek to it exactly)
+                continue
+            else:
+                self.decoded += 1
+                item = (offset + buf.getBeginTime(), buf)
+            while self._running:
+                try:
+                    self._frames.put(item, timeout=0.1)
+                    break
+                except queue.Full:
+                    pass
+            if item is None:
+                return
+
+    def _next(self):
+        """Internal helper that gets the next decoded frame (or None if there is none yet)."""
+        if self._pending is None and not self._ended:
+            try:
+                self._pending = self._frames.get_nowait()
+                if self._pending is None:
+                    self._ended = True
+            except queue.Empty:
+                pass
+        return self._pending
+
+    def _present_task(self, task):
+        """Task that shows the frame that is due in the current frame."""
+        now = self.clock.time()
+        if self._start is None:
+            # wait for the preroll (until the buffer is full or the start latency target has been reached)
+            if not (self._frames.full() or self._ended or now - self._requested >= self.start_latency):
+                return task.cont
+            self._start = now
+            self.latency = now - self._requested
+            if self._sound is not None:
+                self._sound.play()
+        position = self.timeoffset + (now - self._start) * self.playrate
+
+        # find the most recent frame that is due
+        due = None
+        while True:
+            frame = self._next()
+            if frame is None or frame[0] > position:
+                break
+            self._pending = None
+            if due is not None:
+                self.dropped += 1
+            due = frame
+        if due is not None:
+            self._cursor.applyToTexture(due[1], self.texture, 0)
+            if self._shown is not None and due[0] > self._shown:
+                self._period = due[0] - self._shown
+            self._shown = due[0]
+            self.presented += 1
+            if self.presented == 1 and self._on_start is not None:
+                self._on_start()
+        elif self._shown is not None and position >= self._shown + self._period:
+            if self._ended and self._pending is None:
+                # the last frame has been shown for its full duration
+                self._task = None
+                self.destroy()
+                return task.done
+            if self._pending is None:
+                # the next frame is due but has not been decoded yet
+                self.stalls += 1
+        return task.cont
@@ -0,0 +1,68 @@
+"""
+Time-stamping of visual stimulus onsets at the time when they are flipped to the display.
+"""
+
+import collections
+
+import pylsl
+
+from .eventmarkers import send_marker
+
+
+class OnsetTracker:
+    """
+    Emits stimulus onset markers at the time of the buffer flip that first shows the change,
+    rather than at the time when the stimulus was created.
+
+    Markers are registered via register() when a stimulus is created (see BasicStimuli.onset_marker()); a task
+    that runs right after the engine has rendered the frame (the igLoop task) flips the frame and then sends all
+    pending markers with the flip time as their timestamp. Offset markers are sent when the stimulus is removed. With sync-video enabled, the flip returns at the vertical retrace, so the marker
+    latency and jitter are typically well below a frame. Note that on frames with pending markers the flip happens
+    right away rather than at the beginning of the next frame, which slightly reduces CPU/GPU parallelism.
+
+    For each onset, both the call time and the flip time are kept (see onsets and statistics()).
+    """
+
+    def __init__(self,
+                 engine,  # the global base object (ShowBase)
+                 history=10000  # the number of most recent onsets for which the timing is kept
+                 ):
+        """Construct a new OnsetTracker and install its task."""
+        self._engine = engine
+        self._pending = []  # list of (markercode, call time) for markers that wait for the next flip
+        # the most recent onsets, as (markercode, call time, flip time), using the LSL clock
+        self.onsets = collections.deque(maxlen=history)
+        self._task = engine.taskMgr.add(self._flip_task, "OnsetTracker.flip", sort=55)
+
+    def register(self, markercode):
+        """Register a marker to be sent at the next flip."""
+        self._pending.append((markercode, pylsl.local_clock()))
+
+    def statistics(self):
+        """Get a dictionary of statistics of the onset latency (flip time minus call time), in seconds."""
+        latencies = [flip - call for (code, call, flip) in self.onsets]
+        if len(latencies) == 0:
+            return {'onsets': 0}
+        return {'onsets': len(latencies),
+                'mean_latency': sum(latencies) / len(latencies),
+                'min_latency': min(latencies),
+                'max_latency': max(latencies)}
+
+    def destroy(self):
+        """Send any pending markers right away and remove the task."""
+        self._engine.taskMgr.remove(self._task)
+        for markercode, calltime in self._pending:
+            send_marker(markercode)
+        self._pending = []
+
+    def _flip_task(self, task):
+        """Task that flips the frame and time-stamps the pending markers; runs after the frame has been rendered."""
+        if len(self._pending) > 0:
+            self._engine.graphicsEngine.flipFrame()
+            fliptime = pylsl.local_clock()
+            pending = self._pending
+            self._pending = []
+            for markercode, calltime in pending:
+                send_marker(markercode, fliptime)
+                self.onsets.append((markercode, calltime, fliptime))
+        return task.cont
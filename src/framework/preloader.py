@@ -0,0 +1,185 @@
+"""
+Background loading of media files (pictures, sounds, movies, fonts and models).
+"""
+
+import concurrent.futures
+import itertools
+import queue
+import threading
+import traceback
+
+from .mediacache import resolve_media
+
+
+class MediaPreloader:
+    """
+    Loads media files on a pool of worker threads, in the order of their priority (lower values first; files of
+    equal priority are loaded in the order of submission).
+
+    Loading happens in two steps: the worker thread reads and decodes the file (e.g., via the engine's texture or
+    model pool, which are thread-safe), and a task on the main thread finishes it up (e.g., by preparing a texture
+    or model for upload to the graphics card, or by opening a sound with the audio manager, which is not
+    thread-safe). At most max_finish_per_frame files are finished up per frame, so that preloading does not cause
+    frame drops.
+
+    Each request returns a concurrent.futures.Future whose result is the loaded object; its callbacks run on the
+    main thread. Optionally, an event is sent when a batch of requests has completed, which can be waited for via
+    waitfor().
+    """
+
+    def __init__(self,
+                 engine,  # the engine (see BasicStimuli.set_engine)
+                 workers=4,  # the number of worker threads
+                 max_finish_per_frame=4  # the maximum number of loaded files that are finished up per frame
+                 ):
+        """Construct a new MediaPreloader and start its worker threads."""
+        self._engine = engine
+        self.max_finish_per_frame = max_finish_per_frame
+        self._requests = queue.PriorityQueue()  # queue of (priority, sequence number, kind, filename, future)
+        self._loaded = queue.SimpleQueue()  # queue of (kind, data, future, exception) for the main thread
+        self._seq = itertools.count()
+        self.submitted = 0  # number of files submitted so far
+        self.completed = 0  # number of files loaded (or failed) so far
+        self._futures = set()  # the futures of the requests that have not completed yet
+        self._threads = []
+        for k in range(workers):
+            thread = threading.Thread(target=self._run, name='MediaPreloader-' + str(k), daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        self._task = engine.base.taskMgr.add(self._finish_task, "MediaPreloader.finish", sort=-10)
+
+    def preload(self,
+                filenames,  # a file name or list of file names
+                kind='picture',  # the kind of media: 'picture', 'sound', 'movie', 'font' or 'model'
+                priority=0,  # the priority of the request (lower values are loaded first)
+                event=None  # optionally the name of an event to send once all given files have been loaded
+                ):
+        """Request files to be loaded; returns a Future (or a list of Futures if a list of files was given)."""
+        if kind not in ('picture', 'sound', 'movie', 'font', 'model'):
+            raise ValueError("Unsupported kind of media: " + str(kind))
+        single = type(filenames) == str
+        if single:
+            filenames = [filenames]
+        futures = []
+        for filename in filenames:
+            future = concurrent.futures.Future()
+            future.set_running_or_notify_cancel()
+            self._requests.put((priority, next(self._seq), kind, filename, future))
+            self._futures.add(future)
+            futures.append(future)
+        self.submitted += len(futures)
+        if event is not None:
+            remaining = [len(futures)]
+
+            def on_done(future):
+                remaining[0] -= 1
+                if remaining[0] == 0:
+                    self._engine.base.messenger.send(event)
+            for future in futures:
+                future.add_done_callback(on_done)
+        return futures[0] if single else futures
+
+    def progress(self):
+        """Get the number of completed and of submitted files."""
+        return self.completed, self.submitted
+
+    def pending(self):
+        """Get the number of files that have not completed yet."""
+        return self.submitted - self.completed
+
+    def shutdown(self):
+        """
+        Stop the worker threads and the task; pending requests are dropped, and their futures fail with a
+        CancelledError.
+        """
+        for thread in self._threads:
+            self._requests.put((float('-inf'), -1, None, None, None))
+        self._threads = []
+        if self._task is not None:
+            self._engine.base.taskMgr.remove(self._task)
+            self._task = None
+        futures, self._futures = self._futures, set()
+        for future in futures:
+            try:
+                future.set_exception(concurrent.futures.CancelledError("The preloader has been shut down."))
+            except:
+                traceback.print_exc()
+
+    def _run(self):
+        """Internal worker thread function."""
+        while True:
+            priority, seq, kind, filename, future = self._requests.get()
+            if kind is None:
+                break
+            try:
+                self._loaded.put((kind, self._load(kind, filename), future, None))
+            except Exception as e:
+                self._loaded.put((kind, None, future, e))
+
+    def _load(self, kind, filename):
+        """Internal helper that loads a file on a worker thread; returns the data for _finish()."""
+        loader = self._engine.base.loader
+        if kind == 'picture':
+            return loader.loadTexture(filename)
+        elif kind == 'font':
+            return loader.loadFont(filename)
+        elif kind == 'model':
+            return loader.loadModel(filename)
+        elif kind == 'movie':
+            return loader.loadTexture(filename), filename
+        else:
+            # read the file once so that it is in the OS cache when the audio manager opens it (the name is
+            # resolved through the model path, as by the audio manager)
+            with open(resolve_media(filename), 'rb') as f:
+                while f.read(1 << 20):
+                    pass
+            return filename
+
+    def _finish(self, kind, data):
+        """Internal helper that finishes up a loaded file on the main thread; returns the loaded object."""
+        base = self._engine.base
+        gsg = base.win.getGsg() if getattr(base, 'win', None) is not None else None
+        if kind == 'picture':
+            if gsg is not None:
+                data.prepare(gsg.getPreparedObjects())
+            return data
+        elif kind == 'model':
+            if gsg is not None:
+                data.prepareScene(gsg)
+            return data
+        elif kind == 'movie':
+            texture, filename = data
+            if gsg is not None:
+                texture.prepare(gsg.getPreparedObjects())
+            try:
+                base.loader.loadSfx(filename)
+            except:
+                # the movie has no audio track
+                pass
+            return texture
+        elif kind == 'sound':
+            return base.loader.loadSfx(data)
+        return data
+
+    def _finish_task(self, task):
+        """Task that finishes up loaded files on the main thread."""
+        for k in range(self.max_finish_per_frame):
+            try:
+                kind, data, future, exception = self._loaded.get_nowait()
+            except queue.Empty:
+                break
+            if exception is None:
+                try:
+                    data = self._finish(kind, data)
+                except Exception as e:
+                    exception = e
+            self.completed += 1
+            self._futures.discard(future)
+            try:
+                if exception is None:
+                    future.set_result(data)
+                else:
+                    future.set_exception(exception)
+            except:
+                traceback.print_exc()
+        return task.cont
@@ -0,0 +1,194 @@
+"""
+Procedural generation of psychophysical stimuli (Gabor patches, gratings and noise patches).
+
+All stimuli are computed with NumPy in a single vectorized pass and handed to the engine as in-memory textures,
+without a round-trip through image files. Luminance values are in the range 0 to 1 around a mean of 0.5;
+angles are in degrees and lengths in pixels.
+"""
+
+import collections
+import concurrent.futures
+import math
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def _grid(size):
+    """Internal helper that returns the pixel coordinates relative to the center of a square patch."""
+    c = (size - 1) / 2.0
+    y, x = numpy.mgrid[0:size, 0:size].astype(numpy.float32)
+    return x - c, c - y
+
+
+def _mask(kind, x, y, size, sigma):
+    """Internal helper that computes an alpha mask: None, 'circle' or 'gaussian'."""
+    if kind is None:
+        return None
+    r2 = x * x + y * y
+    if kind == 'circle':
+        return (r2 <= (size / 2.0) ** 2).astype(numpy.float32)
+    elif kind == 'gaussian':
+        return numpy.exp(-r2 / (2 * sigma * sigma))
+    raise ValueError("Unsupported mask: " + str(kind))
+
+
+def gabor(size=256, wavelength=32.0, orientation=0.0, phase=0.0, sigma=None, contrast=1.0, mask=None):
+    """
+    Compute a Gabor patch: a sinusoidal grating under a Gaussian envelope (sigma defaults to size/6).
+    Returns a tuple of the luminance and the alpha mask (or None) as size x size float32 arrays.
+    """
+    if sigma is None:
+        sigma = size / 6.0
+    x, y = _grid(size)
+    theta = math.radians(orientation)
+    carrier = numpy.cos(2 * math.pi * (x * math.cos(theta) + y * math.sin(theta)) / wavelength + math.radians(phase))
+    envelope = numpy.exp(-(x * x + y * y) / (2 * sigma * sigma))
+    return 0.5 + 0.5 * contrast * carrier * envelope, _mask(mask, x, y, size, sigma)
+
+
+def grating(size=256, wavelength=32.0, orientation=0.0, phase=0.0, contrast=1.0, waveform='sine', mask='circle',
+            sigma=None):
+    """
+    Compute a grating ('sine' or 'square' waveform), by default in a circular aperture.
+    Returns a tuple of the luminance and the alpha mask (or None) as size x size float32 arrays.
+    """
+    x, y = _grid(size)
+    theta = math.radians(orientation)
+    carrier = numpy.cos(2 * math.pi * (x * math.cos(theta) + y * math.sin(theta)) / wavelength + math.radians(phase))
+    if waveform == 'square':
+        carrier = numpy.sign(carrier)
+    elif waveform != 'sine':
+        raise ValueError("Unsupported waveform: " + str(waveform))
+    return 0.5 + 0.5 * contrast * carrier, _mask(mask, x, y, size, sigma if sigma is not None else size / 6.0)
+
+
+def noise(size=256, contrast=1.0, spectrum='white', seed=0, mask=None, sigma=None):
+    """
+    Compute a noise patch with a 'white' or 'pink' (1/f amplitude) spectrum, scaled so that +/-3 standard
+    deviations span the given contrast; the same seed gives the same patch.
+    Returns a tuple of the luminance and the alpha mask (or None) as size x size float32 arrays.
+    """
+    values = numpy.random.default_rng(seed).standard_normal((size, size)).astype(numpy.float32)
+    if spectrum == 'pink':
+        fy = numpy.fft.fftfreq(size)[:, None]
+        fx = numpy.fft.rfftfreq(size)[None, :]
+        f = numpy.sqrt(fx * fx + fy * fy)
+        f[0, 0] = 1.0
+        values = numpy.fft.irfft2(numpy.fft.rfft2(values) / f, s=(size, size)).astype(numpy.float32)
+        values /= values.std()
+    elif spectrum != 'white':
+        raise ValueError("Unsupported spectrum: " + str(spectrum))
+    x, y = _grid(size)
+    return (numpy.clip(0.5 + 0.5 * contrast * values / 3.0, 0.0, 1.0),
+            _mask(mask, x, y, size, sigma if sigma is not None else size / 6.0))
+
+
+# the available stimulus generators, by kind
+generators = {'gabor': gabor, 'grating': grating, 'noise': noise}
+
+
+def to_rgba(luminance, alpha=None):
+    """Convert a luminance image (and optional alpha mask) to the bytes of an 8-bit RGBA image in texture row order."""
+    h, w = luminance.shape
+    rgba = numpy.empty((h, w, 4), dtype=numpy.uint8)
+    rgba[:, :, 0:3] = (numpy.clip(luminance, 0.0, 1.0) * 255 + 0.5).astype(numpy.uint8)[:, :, None]
+    rgba[:, :, 3] = 255 if alpha is None else (numpy.clip(alpha, 0.0, 1.0) * 255 + 0.5).astype(numpy.uint8)
+    # (texture rows start at the bottom of the image)
+    return rgba[::-1].tobytes(), w, h
+
+
+def make_texture(pandac, data, name='procedural'):
+    """Create a texture from the RGBA image data returned by to_rgba()."""
+    pixels, w, h = data
+    texture = pandac.Texture(name)
+    texture.setup2dTexture(w, h, pandac.Texture.TUnsignedByte, pandac.Texture.FRgba8)
+    texture.setRamImageAs(pixels, 'RGBA')
+    return texture
+
+
+class ProceduralStimuli:
+    """
+    Generates procedural stimulus textures and caches them by their parameters (least recently used textures are
+    dropped once the cache is full). Stimuli that will be needed soon (e.g., the candidate levels of the next step
+    of a staircase) can be computed ahead of time on a worker thread via precompute(); only the (fast) creation of
+    the texture from the computed pixels then happens on the calling thread.
+    """
+
+    def __init__(self,
+                 engine,  # the engine (see BasicStimuli.set_engine)
+                 capacity=256  # the maximum number of cached textures
+                 ):
+        """Construct a new ProceduralStimuli generator."""
+        if numpy is None:
+            raise ImportError("Procedural stimulus generation requires NumPy.")
+        self._engine = engine
+        self.capacity = capacity
+        self._textures = collections.OrderedDict()  # mapping from parameter key to texture
+        self._pending = {}  # mapping from parameter key to the Future of its pixel data
+        self._executor = None
+        self.hits = 0  # number of requests that were served from the cache
+        self.misses = 0  # number of requests that had to be computed (or waited for)
+
+    def texture(self, kind, **params):
+        """Get the texture of a stimulus ('gabor', 'grating' or 'noise', see the respective functions)."""
+        key = self._key(kind, params)
+        texture = self._textures.get(key)
+        if texture is not None:
+            self._textures.move_to_end(key)
+            self.hits += 1
+            return texture
+        self.misses += 1
+        future = self._pending.pop(key, None)
+        data = future.result() if future is not None else self._compute(kind, params)
+        texture = make_texture(self._engine.pandac, data, kind)
+        self._textures[key] = texture
+        while len(self._textures) > self.capacity:
+            self._textures.popitem(last=False)
+        return texture
+
+    def precompute(self, kind, param_sets):
+        """Compute the stimuli for a list of parameter dictionaries in the background (unless already cached)."""
+        if self._executor is None:
+            self._executor = concurrent.futures.ThreadPoolExecutor(1, 'ProceduralStimuli')
+        for params in param_sets:
+            key = self._key(kind, params)
+            if key not in self._textures and key not in self._pending:
+                self._pending[key] = self._executor.submit(self._compute, kind, params)
+        while len(self._pending) > self.capacity:
+            # drop the oldest precomputed stimuli that have not been used
+            self._pending.pop(next(iter(self._pending))).cancel()
+
+    def precompute_levels(self, kind, levels, parameter='contrast', **params):
+        """
+        Compute the stimuli for several values of one parameter in the background, e.g. the next levels of a
+        staircase: precompute_levels('gabor', [c*0.8, c*1.25], 'contrast', size=256, wavelength=20).
+        """
+        self.precompute(kind, [dict(params, **{parameter: level}) for level in levels])
+
+    def statistics(self):
+        """Get a dictionary of cache statistics."""
+        return {'entries': len(self._textures), 'pending': len(self._pending), 'hits': self.hits,
+                'misses': self.misses}
+
+    def shutdown(self):
+        """Stop the worker thread (pending computations are dropped) and clear the cache."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        self._pending = {}
+        self._textures.clear()
+
+    @staticmethod
+    def _key(kind, params):
+        """Internal helper that computes the cache key for a stimulus."""
+        if kind not in generators:
+            raise ValueError("Unsupported kind of procedural stimulus: " + str(kind))
+        return (kind,) + tuple(sorted(params.items()))
+
+    @staticmethod
+    def _compute(kind, params):
+        """Internal helper that computes the RGBA pixel data of a stimulus."""
+        return to_rgba(*generators[kind](**params))
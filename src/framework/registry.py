@@ -0,0 +1,233 @@
+"""
+Registry of the stimulus objects (and other resources) that a module has to clean up.
+"""
+
+import itertools
+
+
+class Scope:
+    """A named scope (e.g., 'module', 'block' or 'trial') whose resources are torn down together."""
+
+    def __init__(self, name, parent):
+        self.name = name
+        self.parent = parent
+        self.slots = set()  # the registry slots of the live resources in this scope
+
+
+class ScopedHandle:
+    """
+    A registered resource that has no object of its own (e.g., an event handler or a timer); destroying it releases
+    it from the registry and calls the given cleanup function (if any).
+    """
+
+    def __init__(self, registry, cleanup=None, *args):
+        """Construct a new ScopedHandle and register it in the innermost scope of the registry."""
+        self._registry = registry
+        self._cleanup = cleanup
+        self._args = args
+        registry.add(self)
+
+    def destroy(self):
+        self._registry.release(self)
+        cleanup, self._cleanup = self._cleanup, None
+        if cleanup is not None:
+            cleanup(*self._args)
+
+
+class ResourceRegistry:
+    """
+    Keeps track of live resources (stimulus objects, sounds, streams, etc.) so that they can be destroyed when the
+    module is cancelled, or when the scope in which they were created ends.
+
+    Resources are stored in slots that are recycled; each slot carries a generation number that is incremented
+    whenever the slot is released, so that a handle (slot, generation) that is held on to after its resource was
+    released can never release a later resource in the same slot. Adding and releasing a resource (by handle or by
+    the object itself) takes constant time.
+
+    Scopes are nested in a stack, with the 'module' scope at the bottom; new resources belong to the innermost
+    scope. Tearing down a scope destroys its resources along with those of all scopes nested in it, most recently
+    added first.
+    """
+
+    def __init__(self):
+        """Construct a new, empty ResourceRegistry."""
+        self._objects = []  # the resource in each slot (None for free slots)
+        self._generations = []  # the generation of each slot
+        self._scopes = []  # the scope of each slot
+        self._order = []  # the sequence number of each slot's resource (to tear down in reverse order)
+        self._free = []  # the free slots
+        self._slot_of = {}  # mapping from id(resource) to its slot
+        self._finalizers = {}  # mapping from slot to a function that is called when its resource is torn down
+        self._seq = itertools.count()
+        self._stack = [Scope('module', None)]  # the stack of open scopes (innermost last)
+
+    def add(self, obj):
+        """Register a resource in the innermost scope; returns its handle."""
+        slot = self._slot_of.get(id(obj))
+        if slot is not None:
+            # the resource is registered already (e.g., a recycled stimulus node): move it to the current scope
+            self._unlink(slot)
+        if self._free:
+            slot = self._free.pop()
+        else:
+            slot = len(self._objects)
+            self._objects.append(None)
+            self._generations.append(0)
+            self._scopes.append(None)
+            self._order.append(0)
+        scope = self._stack[-1]
+        self._objects[slot] = obj
+        self._scopes[slot] = scope
+        self._order[slot] = next(self._seq)
+        self._slot_of[id(obj)] = slot
+        scope.slots.add(slot)
+        return slot, self._generations[slot]
+
+    def release(self, target):
+        """
+        Unregister a resource without destroying it; the target can be a handle or the resource itself.
+        Returns whether it was registered.
+        """
+        slot = self._resolve(target)
+        if slot is None:
+            return False
+        self._unlink(slot)
+        return True
+
+    def on_teardown(self, target, function):
+        """
+        Set a function that is called after a registered resource has been destroyed by a teardown (but not when it
+        is released); the target can be a handle or the resource itself. Returns whether it was registered.
+        """
+        slot = self._resolve(target)
+        if slot is None:
+            return False
+        self._finalizers[slot] = function
+        return True
+
+    def handle(self, obj):
+        """Get the current handle of a registered resource (or None if it is not registered)."""
+        slot = self._resolve(obj)
+        return None if slot is None else (slot, self._generations[slot])
+
+    def get(self, handle):
+        """Get the resource for a handle (or None if it has been released)."""
+        slot = self._resolve(handle)
+        return None if slot is None else self._objects[slot]
+
+    def __contains__(self, target):
+        return self._resolve(target) is not None
+
+    def __len__(self):
+        return len(self._slot_of)
+
+    def push_scope(self, name):
+        """Open a new scope (nested in the current one); returns the Scope."""
+        scope = Scope(name, self._stack[-1])
+        self._stack.append(scope)
+        return scope
+
+    def pop_scope(self, scope=None, teardown=True):
+        """
+        Close a scope (by default the innermost one; a scope name can also be given), along with all scopes nested
+        in it. Its resources are destroyed if teardown is True, otherwise they are handed over to the enclosing scope.
+        """
+        scope = self._find(scope)
+        if scope is None or scope.parent is None:
+            return
+        index = self._stack.index(scope)
+        for s in reversed(self._stack[index:]):
+            if teardown:
+                self._teardown(s.slots)
+            else:
+                for slot in s.slots:
+                    self._scopes[slot] = scope.parent
+                scope.parent.slots.update(s.slots)
+                s.slots = set()
+        del self._stack[index:]
+
+    def teardown(self, scope=None):
+        """
+        Destroy the resources of a scope (by default all resources; a Scope or scope name can also be given) and of
+        the scopes nested in it; the scopes remain open.
+        """
+        scope = self._find(scope) if scope is not None else self._stack[0]
+        if scope is None:
+            return
+        slots = set()
+        for s in self._stack[self._stack.index(scope):]:
+            slots.update(s.slots)
+        self._teardown(slots)
+
+    def clear(self):
+        """Destroy all resources and close all scopes except the module scope."""
+        self.teardown()
+        del self._stack[1:]
+
+    def current_scope(self):
+        """Get the name of the innermost scope."""
+        return self._stack[-1].name
+
+    def leak_report(self):
+        """Get a list of (scope name, type name, count) for the live resources, by scope and type."""
+        counts = {}
+        for obj, scope in zip(self._objects, self._scopes):
+            if obj is not None:
+                key = (scope.name, type(obj).__name__)
+                counts[key] = counts.get(key, 0) + 1
+        return sorted((scope, kind, n) for (scope, kind), n in counts.items())
+
+    def _resolve(self, target):
+        """Internal helper that gets the slot of a live handle or resource (or None)."""
+        if type(target) == tuple and len(target) == 2 and type(target[0]) == int:
+            slot, generation = target
+            if slot < len(self._objects) and self._generations[slot] == generation and \
+                    self._objects[slot] is not None:
+                return slot
+            return None
+        slot = self._slot_of.get(id(target))
+        if slot is not None and self._objects[slot] is target:
+            return slot
+        return None
+
+    def _unlink(self, slot):
+        """Internal helper that frees a slot."""
+        del self._slot_of[id(self._objects[slot])]
+        self._finalizers.pop(slot, None)
+        self._scopes[slot].slots.discard(slot)
+        self._objects[slot] = None
+        self._scopes[slot] = None
+        self._generations[slot] += 1
+        self._free.append(slot)
+
+    def _find(self, scope):
+        """Internal helper that finds an open scope by name (innermost first), or returns the innermost scope."""
+        if scope is None:
+            return self._stack[-1]
+        if isinstance(scope, Scope):
+            return scope if scope in self._stack else None
+        for s in reversed(self._stack):
+            if s.name == scope:
+                return s
+        return None
+
+    def _teardown(self, slots):
+        """Internal helper that destroys the resources in the given slots, most recently added first."""
+        for slot in sorted(slots, key=lambda s: -self._order[s]):
+            obj = self._objects[slot]
+            if obj is None:
+                continue
+            finalizer = self._finalizers.get(slot)
+            self._unlink(slot)
+            try:
+                if hasattr(obj, 'destroy'):
+                    obj.destroy()
+                elif hasattr(obj, 'stop'):
+                    obj.stop()
+            except:
+                pass
+            if finalizer is not None:
+                try:
+                    finalizer()
+                except Exception as e:
+                    print("Exception during resource teardown:", e)
@@ -0,0 +1,117 @@
+"""
+Frame-locked rapid serial visual presentation (RSVP) of image sequences.
+"""
+
+
+class RSVPStream:
+    """
+    Presents a sequence of images on a single card, each for a given number of display frames.
+
+    All images are loaded up front; a task that runs every frame right before the frame is rendered (after the
+    modules have been ticked) then swaps the card's texture whenever the next item is due, and emits the item's
+    onset marker for that frame. Thus, no stimulus objects are created during the stream, and item durations do not
+    depend on when the module's script gets to run. If a frame clock is given (e.g., the one of a LatentModule),
+    frames are counted as display refreshes, so that a dropped frame does not lengthen the current item; otherwise,
+    each render loop iteration counts as one frame. Items that are skipped entirely because of dropped frames are
+    recorded (see skipped), and a string marker is emitted in place of their onset marker.
+    """
+
+    def __init__(self,
+                 stimuli,  # the BasicStimuli instance that presents the stream (provides engine and markers)
+                 images,  # list of images to present (file names or Textures)
+                 frames,  # the number of frames for which each item is shown (a number or a list with one per item)
+                 markers=None,  # optional list of onset markers, one per item (None entries are skipped)
+                 end_marker=None,  # optional marker that is emitted when the stream ends
+                 pos=None,  # the (x,y,z) position of the card
+                 hpr=None,  # the (heading,pitch,roll) angles of the card
+                 scale=None,  # the (x,y,z) size of the card
+                 color=None,  # the (r,g,b,a) coloring of the card
+                 parent=None,  # parent rendering context or Panda3d NodePath
+                 frameclock=None,  # optionally a FrameClock that counts the display frames
+                 on_finish=None  # optional function that is called when the stream has ended
+                 ):
+        """Construct a new RSVPStream, load its images and start presenting at the next frame."""
+        if type(frames) in (int, float):
+            frames = [int(frames)] * len(images)
+        if len(frames) != len(images):
+            raise ValueError("The number of frame counts must match the number of images.")
+        self._stimuli = stimuli
+        engine = stimuli._engine
+        self.textures = [engine.base.loader.loadTexture(i) if type(i) == str else i for i in images]
+        # the frame (relative to the start) at which each item ends
+        self.boundaries = []
+        total = 0
+        for f in frames:
+            total += f
+            self.boundaries.append(total)
+        self.markers = markers
+        self.end_marker = end_marker
+        self.onsets = []  # list of (item index, frame number relative to the start) for each presented item
+        self.skipped = []  # list of (item index, frame number relative to the start) for each skipped item
+        self.finished = False
+        self._frameclock = frameclock
+        self._on_finish = on_finish
+        self._start = None  # the frame number at which the stream started
+        self._frame = 0  # the number of render loop iterations so far
+        self._item = -1  # the index of the current item
+        self._card = engine.direct.gui.OnscreenImage.OnscreenImage(image=self.textures[0] if images else 'blank.tga',
+                                                                   pos=pos, hpr=hpr, scale=scale, color=color,
+                                                                   parent=parent)
+        self._card.setTransparency(engine.pandac.TransparencyAttrib.MAlpha)
+        self._card.stash()
+        self._taskmgr = engine.base.taskMgr
+        self._task = self._taskmgr.add(self._present_task, "RSVPStream.present", sort=40)
+
+    def destroy(self):
+        """Stop the stream (if still running) and remove the card."""
+        if self._task is not None:
+            self._taskmgr.remove(self._task)
+            self._task = None
+        if self._card is not None:
+            self._card.destroy()
+            self._card = None
+        if not self.finished:
+            self.finished = True
+            if self._on_finish is not None:
+                self._on_finish()
+
+    def _current_frame(self):
+        """Internal helper that returns the current frame number."""
+        if self._frameclock is not None and self._frameclock.frame >= 0:
+            return self._frameclock.frame
+        return self._frame
+
+    def _present_task(self, task):
+        """Task that shows the item that is due in the current frame."""
+        self._frame += 1
+        now = self._current_frame()
+        if self._start is None:
+            self._start = now
+        elapsed = now - self._start
+        item = self._item
+        while item < len(self.boundaries) and (item < 0 or elapsed >= self.boundaries[item]):
+            item += 1
+        for skipped in range(self._item + 1, item):
+            # the item was due and over within a single frame drop, so it was never shown
+            self.skipped.append((skipped, elapsed))
+            if self.markers is not None and self.markers[skipped] is not None:
+                self._stimuli.marker("RSVPStream::skipped(item=%i, marker=%s)" % (skipped, self.markers[skipped]))
+        if item >= len(self.boundaries):
+            self._card.stash()
+            if self.end_marker is not None:
+                self._stimuli.onset_marker(self.end_marker)
+            if self.skipped:
+                print("RSVPStream: %i of %i items were skipped due to dropped frames." % (len(self.skipped),
+                                                                                         len(self.boundaries)))
+            self._task = None
+            self.destroy()
+            return task.done
+        if item != self._item:
+            if self._item < 0:
+                self._card.unstash()
+            self._card.setTexture(self.textures[item], 1)
+            self._item = item
+            self.onsets.append((item, elapsed))
+            if self.markers is not None and self.markers[item] is not None:
+                self._stimuli.onset_marker(self.markers[item])
+        return task.cont
@@ -0,0 +1,181 @@
+"""
+Voice-limited playback of sound files with recycling of the sound objects.
+"""
+
+from .clock import get_clock
+
+# the supported voice stealing policies
+STEAL_POLICIES = ('oldest', 'quietest', 'none')
+
+
+class SoundVoice:
+    """
+    Handle of a sound that was played through a SoundPool. The handle remains safe to use after the voice has ended
+    (e.g., stop() then does nothing), even though the underlying sound object may be playing another sound by then.
+    """
+
+    def __init__(self, pool, filename, sound, volume, end, on_end):
+        self._pool = pool
+        self.filename = filename
+        self.sound = sound  # the engine's sound object (None once the voice has ended)
+        self.volume = volume
+        self.end = end  # the clock time at which the voice ends
+        self.on_end = on_end
+
+    def stop(self):
+        """Stop the voice (if it is still playing)."""
+        if self.sound is not None:
+            self._pool._end(self)
+
+    def length(self):
+        """Get the remaining duration of the voice in seconds."""
+        return max(0.0, self.end - self._pool.clock.time())
+
+    def status(self):
+        """Get whether the voice is 'playing' or 'finished'."""
+        return 'finished' if self.sound is None else 'playing'
+
+    # support for some occasionally useful functions of the sound object
+    def setVolume(self, volume):
+        if self.sound is not None:
+            self.volume = volume
+            self.sound.setVolume(volume)
+
+    def setBalance(self, balance):
+        if self.sound is not None:
+            self.sound.setBalance(balance)
+
+
+class SoundPool:
+    """
+    Plays sound files with a limit on the number of simultaneously playing voices (polyphony). Once the limit is
+    reached, a new sound either replaces ("steals") the oldest or the quietest playing voice, or is dropped
+    (policy 'none'). Looping voices are never stolen; if all voices are looping, the new sound is dropped.
+
+    The sound objects of ended voices are kept per file and reused for the next sound from the same file, so that
+    rapid auditory streams (e.g., oddball sequences) neither pile up sound objects nor reload the decoded data.
+    Voices are ended by a single task that runs only while any voice is playing, instead of one timer per sound.
+    """
+
+    def __init__(self,
+                 engine,  # the engine (see BasicStimuli.set_engine)
+                 load=None,  # function that loads a new sound object for a file name (by default the engine's loadSfx)
+                 max_voices=16,  # the maximum number of simultaneously playing voices
+                 steal='oldest',  # the voice stealing policy: 'oldest', 'quietest' or 'none'
+                 clock=None  # the clock that determines when voices end (by default, the framework's clock)
+                 ):
+        """Construct a new SoundPool."""
+        if steal not in STEAL_POLICIES:
+            raise ValueError("Unsupported voice stealing policy: " + str(steal))
+        self._engine = engine
+        self._load = load if load is not None else engine.base.loader.loadSfx
+        self.max_voices = max_voices
+        self.steal = steal
+        self.clock = clock if clock is not None else get_clock()
+        self._voices = []  # the playing voices, oldest first
+        self._idle = {}  # mapping from file name to list of idle sound objects
+        self._task = None
+        self.played = 0  # number of voices played so far
+        self.reused = 0  # number of voices that reused an idle sound object
+        self.stolen = 0  # number of voices that were ended early to make room for a new one
+        self.dropped = 0  # number of sounds that were not played because all voices were busy
+
+    def play(self,
+             filename,  # the sound file to play
+             volume=0.1,  # the volume of the sound (between 0 and 1)
+             balance=0.0,  # the balance between -1 (hard left) and 1 (hard right)
+             playrate=1.0,  # the playrate of the sound (changes pitch and time)
+             timeoffset=0.0,  # time offset into the file
+             looping=False,  # whether the sound should be looping (until it is stopped)
+             loopcount=None,  # optionally the number of repeats
+             on_end=None  # optionally a function that is called when the voice has ended (or was stopped)
+             ):
+        """Play a sound; returns the SoundVoice, or None if the sound was dropped."""
+        if len(self._voices) >= self.max_voices:
+            candidates = [v for v in self._voices if v.end != float('inf')]
+            if self.steal == 'none' or not candidates:
+                self.dropped += 1
+                return None
+            if self.steal == 'oldest':
+                victim = candidates[0]
+            else:
+                victim = min(candidates, key=lambda v: v.volume)
+            self.stolen += 1
+            self._end(victim)
+
+        sound = self._acquire(filename)
+        sound.setVolume(volume)
+        sound.setBalance(balance)
+        length = sound.length()
+        if looping:
+            sound.setLoop(True)
+            length = float('inf')
+        else:
+            # (this also resets the looping of a recycled sound object)
+            sound.setLoopCount(loopcount if loopcount is not None else 1)
+            if loopcount is not None:
+                length *= loopcount
+        sound.setTime(timeoffset)
+        length -= timeoffset
+        sound.setPlayRate(playrate)
+        length /= playrate
+        sound.play()
+
+        voice = SoundVoice(self, filename, sound, volume, self.clock.time() + length, on_end)
+        self._voices.append(voice)
+        self.played += 1
+        if self._task is None:
+            self._task = self._engine.base.taskMgr.add(self._update, "SoundPool.update")
+        return voice
+
+    def stop_all(self):
+        """Stop all playing voices."""
+        for voice in list(self._voices):
+            self._end(voice)
+
+    def clear(self):
+        """Stop all playing voices and drop the idle sound objects."""
+        self.stop_all()
+        self._idle = {}
+
+    def statistics(self):
+        """Get a dictionary of pool statistics."""
+        return {'playing': len(self._voices),
+                'idle': sum(len(idle) for idle in self._idle.values()),
+                'played': self.played,
+                'reused': self.reused,
+                'stolen': self.stolen,
+                'dropped': self.dropped}
+
+    def _acquire(self, filename):
+        """Internal helper that gets an idle sound object for a file, or loads a new one."""
+        idle = self._idle.get(filename)
+        if idle:
+            self.reused += 1
+            return idle.pop()
+        return self._load(filename)
+
+    def _end(self, voice):
+        """Internal helper that ends a voice and recycles its sound object."""
+        sound = voice.sound
+        voice.sound = None
+        self._voices.remove(voice)
+        sound.stop()
+        idle = self._idle.setdefault(voice.filename, [])
+        if len(idle) < self.max_voices:
+            idle.append(sound)
+        if voice.on_end is not None:
+            try:
+                voice.on_end()
+            except Exception as e:
+                print("Exception in SoundPool end callback:", e)
+
+    def _update(self, task):
+        """Internal task that ends the voices that have finished playing; runs only while voices are playing."""
+        now = self.clock.time()
+        for voice in [v for v in self._voices if v.end <= now]:
+            self._end(voice)
+        if not self._voices:
+            self._task = None
+            return task.done
+        return task.cont
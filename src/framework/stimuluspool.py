@@ -0,0 +1,89 @@
+"""
+Recycling of the scene graph nodes of simple visual stimuli.
+"""
+
+import itertools
+
+
+class StimulusPool:
+    """
+    Keeps the nodes of destroyed stimuli (e.g., the OnscreenText and OnscreenImage objects created by write(),
+    picture(), rectangle(), etc.) stashed away, so that the next stimulus of the same kind and static style can reuse
+    one of them instead of building (and later tearing down) a new one. This avoids most of the scene graph
+    allocation in trial loops that present many short stimuli.
+
+    Nodes are keyed by their static properties (e.g., font, colors and alignment of a text); the caller updates the
+    remaining properties (e.g., the text and its position) when reusing a node. A pooled node's destroy() returns
+    it to the pool; the node must therefore not be used by the caller after destroying it.
+    """
+
+    def __init__(self,
+                 capacity=32  # the maximum number of idle nodes that are kept per key
+                 ):
+        """Construct a new, empty StimulusPool."""
+        self.capacity = capacity
+        self._idle = {}  # mapping from key to list of idle (stashed) nodes
+        self._generation = itertools.count(1)  # source of acquisition numbers
+        self.generation = 0  # the most recently assigned acquisition number
+        self.created = 0  # number of nodes created (and adopted) so far
+        self.reused = 0  # number of times an idle node was reused
+
+    def acquire(self, key):
+        """Get an idle node for the given key (visible again), or None if there is none."""
+        idle = self._idle.get(key)
+        while idle:
+            obj = idle.pop()
+            if obj.isEmpty():
+                # the node has been removed from the scene graph in the meantime (e.g., along with its parent)
+                continue
+            obj.unstash()
+            obj._pool_idle = False
+            obj._pool_generation = self.generation = next(self._generation)
+            self.reused += 1
+            return obj
+        return None
+
+    def adopt(self, key, obj):
+        """Make a newly created node poolable under the given key; returns the node."""
+        obj._pool_idle = False
+        obj._pool_generation = self.generation = next(self._generation)
+        obj.destroy = lambda: self.release(key, obj)
+        self.created += 1
+        return obj
+
+    def release(self, key, obj):
+        """Return a node to the pool (or destroy it if the pool is full)."""
+        if obj._pool_idle:
+            # already released
+            return
+        obj._pool_idle = True
+        if obj.isEmpty():
+            return
+        idle = self._idle.setdefault(key, [])
+        if len(idle) < self.capacity:
+            obj.stash()
+            idle.append(obj)
+        else:
+            self._discard(obj)
+
+    def clear(self):
+        """Destroy all idle nodes."""
+        for idle in self._idle.values():
+            for obj in idle:
+                self._discard(obj)
+        self._idle = {}
+
+    def statistics(self):
+        """Get a dictionary of pool statistics."""
+        return {'created': self.created,
+                'reused': self.reused,
+                'idle': sum(len(idle) for idle in self._idle.values())}
+
+    @staticmethod
+    def _discard(obj):
+        """Internal helper that really destroys a node."""
+        del obj.destroy
+        try:
+            obj.destroy()
+        except:
+            pass
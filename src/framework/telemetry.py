@@ -0,0 +1,153 @@
+"""
+Frame timing telemetry for the launcher's main loop.
+"""
+
+import array
+import struct
+import sys
+import time
+
+
+class FrameTelemetry:
+    """
+    Records per-frame timing information into a preallocated ring buffer, so that it can be determined after the
+    fact whether (and when) a session had frame drops.
+
+    For every frame, the following is recorded:
+    * the time stamp at which the frame began (time.perf_counter(), in seconds)
+    * the interval since the previous frame (in seconds)
+    * the time for which the shared_lock was held, by the main loop or by the module's tick() (in seconds)
+    * the time for which the main loop held the shared_lock (in seconds)
+    * the number of display frames that were dropped before this frame
+
+    Only the most recent `capacity` frames are retained, but the totals (frame and drop counts) cover the whole
+    session. The buffer can be written to a compact binary file using dump() (see there for the format).
+    """
+
+    # file format identifier and version of dump()
+    MAGIC = b'SNAPFTEL'
+    VERSION = 1
+
+    def __init__(self,
+                 capacity=2 ** 18,  # the number of most recent frames to retain
+                 frame_period=1 / 60.0,  # the nominal display frame period, in seconds
+                 drop_threshold=1.5  # inter-frame intervals above this many frame periods count as dropped frames
+                 ):
+        """Construct a new FrameTelemetry recorder; all buffers are allocated here."""
+        self.capacity = capacity
+        self.frame_period = frame_period
+        self.drop_threshold = drop_threshold
+        self._timestamps = array.array('d', [0.0]) * capacity
+        self._intervals = array.array('d', [0.0]) * capacity
+        self._tick_durations = array.array('d', [0.0]) * capacity
+        self._lock_durations = array.array('d', [0.0]) * capacity
+        self._dropped = array.array('H', [0]) * capacity
+        # offset that converts the recorded time stamps into wall-clock time (as in time.time())
+        self._wallclock_offset = time.time() - time.perf_counter()
+        self.reset()
+
+    def reset(self):
+        """Discard all recorded frames (e.g., at the beginning of a new session)."""
+        self.frames = 0  # total number of frames recorded
+        self.dropped_frames = 0  # total number of dropped display frames
+        self.max_interval = 0.0  # the longest inter-frame interval seen
+        self._next = 0  # the ring buffer slot to write next
+        self._last_timestamp = None
+
+    def record_frame(self, timestamp, tick_duration, lock_duration):
+        """
+        Record the timing of a frame; called once per frame by the main loop.
+        * timestamp: the time.perf_counter() time at which the frame began
+        * tick_duration: the time spent in the module's tick(), in seconds
+        * lock_duration: the time for which the shared_lock was held during the frame (by the main loop or by the
+          module's tick()), in seconds
+        """
+        if self._last_timestamp is None:
+            interval = 0.0
+        else:
+            interval = timestamp - self._last_timestamp
+        self._last_timestamp = timestamp
+
+        dropped = 0
+        if interval > self.drop_threshold * self.frame_period:
+            dropped = min(int(round(interval / self.frame_period)) - 1, 65535)
+            self.dropped_frames += dropped
+        if interval > self.max_interval:
+            self.max_interval = interval
+
+        k = self._next
+        self._timestamps[k] = timestamp
+        self._intervals[k] = interval
+        self._tick_durations[k] = tick_duration
+        self._lock_durations[k] = lock_duration
+        self._dropped[k] = dropped
+        self._next = (k + 1) % self.capacity
+        self.frames += 1
+
+    def summary(self):
+        """Get a dictionary of summary statistics over the retained frames and the whole session."""
+        n = min(self.frames, self.capacity)
+        result = {'frames': self.frames,
+                  'dropped_frames': self.dropped_frames,
+                  'max_interval': self.max_interval,
+                  'frame_period': self.frame_period,
+                  'retained_frames': n}
+        if n > 1:
+            intervals = self._intervals[1:n] if self.frames <= self.capacity else self._intervals
+            result['mean_interval'] = sum(intervals) / len(intervals)
+            result['mean_tick_duration'] = sum(self._tick_durations[:n]) / n
+            result['max_tick_duration'] = max(self._tick_durations[:n])
+            result['mean_lock_duration'] = sum(self._lock_durations[:n]) / n
+            result['max_lock_duration'] = max(self._lock_durations[:n])
+        return result
+
+    def dump(self, filename):
+        """
+        Write the retained frames (oldest first) to a binary file.
+
+        The file begins with a little-endian header (struct format '<8sIIQQdd'):
+        magic ('SNAPFTEL'), version, number of retained frames n, total frames, total dropped frames,
+        nominal frame period and the wall-clock offset (add it to a time stamp to get time.time() time).
+        It is followed by the arrays timestamps, intervals, tick durations and lock durations
+        (each n little-endian float64 values) and the dropped frame counts (n little-endian uint16 values).
+        """
+        n = min(self.frames, self.capacity)
+        with open(filename, 'wb') as f:
+            f.write(struct.pack('<8sIIQQdd', self.MAGIC, self.VERSION, n, self.frames, self.dropped_frames,
+                                self.frame_period, self._wallclock_offset))
+            for buf in (self._timestamps, self._intervals, self._tick_durations, self._lock_durations, self._dropped):
+                data = self._chronological(buf)
+                if sys.byteorder != 'little':
+                    data.byteswap()
+                data.tofile(f)
+
+    # --- internal ---
+
+    def _chronological(self, buf):
+        """Get the retained portion of a ring buffer as a new array, oldest entry first."""
+        if self.frames <= self.capacity:
+            return buf[:self.frames]
+        return buf[self._next:] + buf[:self._next]
+
+
+def load_telemetry(filename):
+    """
+    Load a file written by FrameTelemetry.dump(); returns a dictionary with the header fields and the arrays
+    'timestamps', 'intervals', 'tick_durations', 'lock_durations' and 'dropped'.
+    """
+    header = struct.Struct('<8sIIQQdd')
+    with open(filename, 'rb') as f:
+        magic, version, n, frames, dropped_frames, frame_period, wallclock_offset = header.unpack(
+            f.read(header.size))
+        if magic != FrameTelemetry.MAGIC:
+            raise Exception("The file " + filename + " is not a SNAP frame telemetry file.")
+        result = {'version': version, 'frames': frames, 'dropped_frames': dropped_frames,
+                  'frame_period': frame_period, 'wallclock_offset': wallclock_offset}
+        for name, typecode in (('timestamps', 'd'), ('intervals', 'd'), ('tick_durations', 'd'),
+                               ('lock_durations', 'd'), ('dropped', 'H')):
+            data = array.array(typecode)
+            data.fromfile(f, n)
+            if sys.byteorder != 'little':
+                data.byteswap()
+            result[name] = data
+    return result
@@ -0,0 +1,71 @@
+"""
+Caching of generated text geometry.
+"""
+
+import collections
+
+
+class TextCache:
+    """
+    A least-recently-used cache of generated text geometry (NodePaths), keyed by the text and everything that
+    affects its tessellation (font, alignment, wordwrap, colors, ...). Displaying a cached piece of text only
+    requires instancing its geometry under a new node, rather than re-generating it through a TextNode.
+
+    Evicted geometry stays alive for as long as it is still instanced somewhere in the scene graph.
+    """
+
+    def __init__(self,
+                 capacity=256  # the maximum number of cached pieces of text
+                 ):
+        """Construct a new, empty TextCache."""
+        self.capacity = capacity
+        self._entries = collections.OrderedDict()  # mapping from key to geometry, least recently used first
+        self.hits = 0  # number of lookups that found cached geometry
+        self.misses = 0  # number of lookups that did not
+
+    def get(self, key):
+        """Look up the geometry for the given key; returns None if it is not cached."""
+        geometry = self._entries.get(key)
+        if geometry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return geometry
+
+    def put(self, key, geometry):
+        """Enter geometry into the cache, evicting the least recently used entries if the cache is full."""
+        self._entries[key] = geometry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        """Remove all entries."""
+        self._entries.clear()
+
+    def statistics(self):
+        """Get a dictionary of cache statistics."""
+        return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class TextInstance:
+    """
+    An instance of cached text geometry on the screen. Supports destroy(); all other attribute accesses
+    (e.g., setPos() or setColor()) are forwarded to its NodePath.
+    """
+
+    def __init__(self, nodepath):
+        """Construct a new TextInstance for the given NodePath."""
+        self.nodepath = nodepath
+
+    def destroy(self):
+        """Remove the text from the screen."""
+        if not self.nodepath.isEmpty():
+            self.nodepath.removeNode()
+
+    def __getattr__(self, name):
+        return getattr(self.nodepath, name)
@@ -32,6 +32,8 @@ class AudioPresenter(MessagePresenter):
                  looping=False,         # whether the sound should be looping; can be turned off by calling .stop() on the return value of this function
                  loopcount=None,        # optionally the number of repeats if looping                 
                  surround=True,         # if True, the direction will go from -Pi/2 to Pi/2
+                 pool=None,             # optionally a framework.soundpool.SoundPool through which non-surround sounds are played (recycles the sound objects and limits the number of voices)
+                 mixer=None,            # optionally a framework.mixer.AudioMixer through which non-surround sounds are played (e.g., the return value of BasicStimuli.start_mixer())
                  *args,**kwargs
                  ):             
         """Construct a new AudioPresenter."""
@@ -43,6 +45,8 @@ class AudioPresenter(MessagePresenter):
         self.looping = looping
         self.loopcount = loopcount
         self.surround = surround
+        self.pool = pool
+        self.mixer = mixer
         self.speak = None
         self.audio3d = None      
 
@@ -50,6 +54,16 @@ class AudioPresenter(MessagePresenter):
         self.marker("AudioPresenter::_present(%s)" % message)
         if message[-4] == '.':
             # sound file name 
+            if self.mixer is not None and not self.surround and self.mixer.can_load(message,self.playrate):
+                # (files that the mixer cannot decode are played through the engine)
+                loops = self.loopcount if self.loopcount is not None else (0 if self.looping else 1)
+                self.mixer.play(self.mixer.load(message,self.playrate),None,self.volume,self.direction,self.timeoffset,loops)
+                self.marker(221)
+                return
+            if self.pool is not None and not self.surround:
+                self.pool.play(message,self.volume,self.direction,self.playrate,self.timeoffset,self.looping,self.loopcount)
+                self.marker(221)
+                return
             if self.surround:            
                 if self.audio3d is None:
                     self.audio3d = Audio3DManager.Audio3DManager(base.sfxManagerList[0], camera)
@@ -90,7 +104,9 @@ class AudioPresenter(MessagePresenter):
 
     def precache(self,message):
         if message[-4] == '.':
-            loader.loadSfx(message)
+            # (can_load() loads the clip into the mixer)
+            if self.mixer is None or self.surround or not self.mixer.can_load(message,self.playrate):
+                loader.loadSfx(message)
 
     def destroy(self):
         try:
@@ -1,6 +1,6 @@
 from direct.showbase import DirectObject
 import framework.eventmarkers.eventmarkers
-import time
+from framework.clock import get_clock
 
 class EventWatcher(DirectObject.DirectObject):
     """
@@ -22,6 +22,7 @@ class EventWatcher(DirectObject.DirectObject):
         self.defaulthandler = defaulthandler
         self.handleduration = handleduration
         self.triggeronce = triggeronce
+        self._clock = get_clock()   # the clock that provides the current time (real or virtual)
         
         self.handler = None
         self.timeouthandler = None
@@ -57,19 +58,19 @@ class EventWatcher(DirectObject.DirectObject):
             eventtype = [eventtype]
         for evtype in eventtype:            
             self.acceptOnce(evtype,self._handleevent,[evtype])
-        print str(time.time()) + " now watching for any event in: " + str(eventtype)
+        print str(self._clock.time()) + " now watching for any event in: " + str(eventtype)
 
         
         # register a new handler (replacing the old one, if necessary) 
         self.handler = handler
         self.timeouthandler = timeouthandler
-        self.expires_at = time.time() + handleduration
+        self.expires_at = self._clock.time() + handleduration
         self.expires_when_triggered = triggeronce
         framework.eventmarkers.eventmarkers.send_marker(214)
         taskMgr.doMethodLater(handleduration, self._trigger_timeout, 'EventWatcher.trigger_timeout()')
 
     def _handleevent(self,evtype):
-        t = time.time()
+        t = self._clock.time()
         self.timeouthandler = None
         if self.handler is not None:
             if self.expires_at > t:
@@ -99,7 +100,7 @@ class EventWatcher(DirectObject.DirectObject):
         self.ignoreAll()
 
     def _trigger_timeout(self,task):
-        if time.time() < self.expires_at:
+        if self._clock.time() < self.expires_at:
             return task.cont
         else:
             if self.timeouthandler is not None:
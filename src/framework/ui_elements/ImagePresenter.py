@@ -3,11 +3,14 @@ from MessagePresenter import MessagePresenter
 from panda3d.core import *
 from direct.gui.DirectGui import *
 from direct.gui.OnscreenImage import OnscreenImage
+from framework.atlas import apply_uv, is_atlas_reference, lookup_atlas_image
 
 class ImagePresenter(MessagePresenter):
     """
     A display that can present images with a fixed (or optionally randomly chosen) position,
     size and other display properties (e.g. coloring).   
+    Messages may also refer to images in a loaded texture atlas (e.g. 'atlas:media/face01.png', see 
+    framework.atlas); consecutive images on the same atlas page are then shown by only changing texture coordinates.
     
     See also MessagePresenter for usage information.
     """
@@ -42,10 +45,20 @@ class ImagePresenter(MessagePresenter):
             #color = self.color()
         self.icon = OnscreenImage(image=image,pos=(pos[0],0,pos[1]),scale=scale,hpr=rotation,color= ((0,0,0,0) if image=="blank.tga" else self.color),parent=self.renderviewport)
         self.icon.setTransparency(TransparencyAttrib.MAlpha)
+        self._page = None           # the atlas page that is currently shown, if any
 
     def _present(self,message):
         self.marker("ImagePresenter::_present(%s)" % message)
-        self.icon.setImage(message.strip())
+        image = message.strip()
+        if is_atlas_reference(image):
+            texture,uv = lookup_atlas_image(image)
+            if self._page is not texture:
+                self.icon.setImage(texture)
+                self._page = texture
+            apply_uv(self.icon,uv)
+        else:
+            self.icon.setImage(image)
+            self._page = None
         self.icon.setTransparency(TransparencyAttrib.MAlpha)
         # select remaining properties randomly, if applicable            
         # if callable(self.pos):
@@ -71,5 +84,6 @@ class ImagePresenter(MessagePresenter):
         self.icon.removeNode()
 
     def precache(self,message):
-        loader.loadTexture(message)
+        if not is_atlas_reference(message):
+            loader.loadTexture(message)
      
\ No newline at end of file
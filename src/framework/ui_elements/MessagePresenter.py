@@ -1,6 +1,6 @@
 # -*- coding:utf-8 -*-
-import time
 from framework.eventmarkers.eventmarkers import send_marker, init_markers
+from framework.clock import get_clock
 
 
 class MessagePresenter(object):
@@ -18,6 +18,7 @@ class MessagePresenter(object):
         self.clearafter = kwargs['clearafter'] if kwargs.has_key('clearafter') else 0.0
         self._locked_until = 0        
         self._next_clear = 0
+        self._clock = get_clock()   # the clock that provides the current time (real or virtual)
 
     # --- functions to be overridden by subclasses --- 
     
@@ -53,13 +54,13 @@ class MessagePresenter(object):
         * clearafter: Optionally, the presented message may automatically be cleared after this amount of time
                       has passed (equivalent to calling clear() after that time.
         """
-        now = time.time()
+        now = self._clock.time()
         if now > self._locked_until:
             if lockduration is None:
                 lockduration = self.lockduration
             if clearafter is None:
                 clearafter = self.clearafter
-            self._locked_until = time.time()+lockduration
+            self._locked_until = self._clock.time()+lockduration
             self._present(message)
             self.clear_after(clearafter)
             return True
@@ -86,12 +87,12 @@ class MessagePresenter(object):
     def clear_after(self,clearafter):
         """Clear the presenter after some time."""
         if clearafter > 0:
-            self._next_clear = time.time() + clearafter
+            self._next_clear = self._clock.time() + clearafter
             taskMgr.doMethodLater(clearafter, self._clear_task, 'MessagePresenter.clear()')
 
     def _clear_task(self,task):
         """Task to clear the icon after done."""
-        if time.time() >= self._next_clear-0.1: # we don't clear if the clear schedule has been overridden in the meantime...                                
+        if self._clock.time() >= self._next_clear-0.1: # we don't clear if the clear schedule has been overridden in the meantime...                                
             self.clear()                        # the 0.1 is a timing tolerance parameter
         return task.done 
             
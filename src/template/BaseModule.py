@@ -180,8 +180,8 @@ class Main(LatentModule):
         object.setZ(z[align])
 
     def photomarker(self, marker, position=None):
-        # sending generic LSL marker
-        self.marker(marker)
+        # sending generic LSL marker (time-stamped at the flip that shows the flash, if the launcher tracks onsets)
+        self.onset_marker(marker)
 
         # flashing coloured square to be picked up by photo sensor
         if position is None: position = self.photomarkerPosition